@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark indexing and querying outlines in the in-memory and on-disk stores.
+
+Indexes the same outline repeatedly (under a fresh ID each time, so nothing
+is deduplicated) into an ephemeral ChromaDB client and into a persistent
+client in a temporary directory, then runs the setup-context queries an
+analysis makes for each beat. Reports latency and how much each store wrote
+to disk.
+
+Example:
+    python benchmark_outline_store.py --repeats 20
+    python benchmark_outline_store.py --outline my_outline.txt --store memory
+"""
+
+import argparse
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from src.rag.analyzer import _chunk_text
+from src.rag.outline_store import store_outline_chunks, chunk_offsets, _directory_size
+from src.rag.retriever import Retriever
+from src.rag.vector_store import VectorStore, IN_MEMORY, reset_clients
+from src.config.config import Config
+
+from benchmark_pipeline import DEFAULT_OUTLINE, percentile
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare outline indexing in the in-memory and persistent stores")
+    parser.add_argument("--outline", default=DEFAULT_OUTLINE, help="Outline file to index")
+    parser.add_argument("--repeats", type=int, default=10, help="Times the outline is indexed into each store")
+    parser.add_argument("--beats", type=int, default=5, help="Beats queried per indexed outline")
+    parser.add_argument("--store", choices=("memory", "persistent", "both"), default="both",
+                        help="Store to benchmark")
+    return parser.parse_args()
+
+def benchmark_store(args, vector_store: VectorStore, outline: str, chunks, beats):
+    """Index and query the outline repeats times and collect latency and disk metrics."""
+    retriever = Retriever(vector_store)
+    index_times, query_times = [], []
+    
+    for i in range(args.repeats):
+        outline_id = f"benchmark-{i}"
+        start = time.perf_counter()
+        store_outline_chunks(vector_store, outline_id, chunks, chunk_offsets(outline, chunks))
+        index_times.append(time.perf_counter() - start)
+        
+        for beat in beats:
+            start = time.perf_counter()
+            retriever.get_setup_context(outline_id, beat, outline=outline)
+            query_times.append(time.perf_counter() - start)
+            
+    return {
+        "Index mean (s)": statistics.mean(index_times),
+        "Index p95 (s)": percentile(index_times, 0.95),
+        "Query mean (s)": statistics.mean(query_times),
+        "Query p95 (s)": percentile(query_times, 0.95),
+        "Disk bytes": _directory_size(vector_store.persist_directory),
+    }
+
+def format_value(value) -> str:
+    return f"{value:.4f}" if isinstance(value, float) else str(value)
+
+def print_report(results):
+    """Print one column per store, plus the memory/persistent ratio when both ran."""
+    stores = list(results)
+    compare = "memory" in results and "persistent" in results
+    print(f"{'':<16}" + "".join(f"{store:>14}" for store in stores) + (f"{'memory/disk':>14}" if compare else ""))
+    for name in results[stores[0]]:
+        row = f"{name:<16}" + "".join(f"{format_value(results[store][name]):>14}" for store in stores)
+        if compare:
+            persistent = results["persistent"][name]
+            row += f"{results['memory'][name] / persistent:>14.2f}" if persistent else f"{'-':>14}"
+        print(row)
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    with open(args.outline, "r") as f:
+        outline = f.read()
+    chunks = _chunk_text(outline)
+    paragraphs = [p.strip() for p in outline.split("\n\n") if p.strip()]
+    beats = paragraphs[-args.beats:]
+    
+    stores = ("memory", "persistent") if args.store == "both" else (args.store,)
+    results = {}
+    for store in stores:
+        directory = IN_MEMORY if store == "memory" else tempfile.mkdtemp(prefix="outline-benchmark-")
+        try:
+            results[store] = benchmark_store(args, VectorStore(directory), outline, chunks, beats)
+        finally:
+            reset_clients(directory)
+            if directory != IN_MEMORY:
+                shutil.rmtree(directory, ignore_errors=True)
+                
+    print(f"Outline: {len(chunks)} chunks, indexed {args.repeats} times into {Config.OUTLINE_STORAGE_MODE} collections")
+    print_report(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
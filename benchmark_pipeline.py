@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the analysis pipeline.
+
+Runs the real analyzer code (stage graph, token budgeting, setup check,
+synthesis parsing) against the fake LLM backend, so throughput and
+concurrency can be measured without network access or an API key.
+
+Both analysis tiers are run by default and reported side by side.
+
+Example:
+    python benchmark_pipeline.py --requests 200 --concurrency 20 --latency-ms 300 --rate-limit-rate 0.05
+    python benchmark_pipeline.py --tier fast
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+# Select the fake backend and disable response and stage caching before the analyzer is imported
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("STAGE_CACHE_ENABLED", "false")
+
+from src.rag import analyzer
+from src.rag.beat_definitions import definition_table
+from src.rag.llm_backend import FakeBackend
+from src.rag.llm_scheduler import LLMScheduler
+from src.config.config import Config
+
+DEFAULT_OUTLINE = os.path.join("data", "uat_samples", "well_structured_outline.txt")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline against the fake LLM backend")
+    parser.add_argument("--requests", type=int, default=100, help="Number of analyses to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="Analyses in flight at once")
+    parser.add_argument("--outline", default=DEFAULT_OUTLINE, help="Outline file to analyze")
+    parser.add_argument("--beat-type", default="Catalyst", help="Beat type to analyze")
+    parser.add_argument("--context-mode", choices=analyzer.SETUP_CONTEXT_MODES, default="full")
+    parser.add_argument("--tier", choices=analyzer.ANALYSIS_TIERS + ("both",), default="both",
+                        help="Analysis tier to benchmark")
+    parser.add_argument("--element-extractor", choices=analyzer.ELEMENT_EXTRACTORS, default=Config.ELEMENT_EXTRACTOR,
+                        help="How the thorough tier finds the beat's elements")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mean fake LLM latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Standard deviation of the fake latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 500 per call")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected 429 per call")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible runs")
+    parser.add_argument("--requests-per-minute", type=float, default=Config.LLM_REQUESTS_PER_MINUTE,
+                        help="Quota the LLM scheduler's token bucket is sized to")
+    parser.add_argument("--max-concurrency", type=int, default=Config.LLM_MAX_CONCURRENCY,
+                        help="Upper bound of the scheduler's adaptive concurrency limit")
+    return parser.parse_args()
+
+def find_beat(outline: str, beat_type: str) -> str:
+    """Return the outline paragraph labelled with the beat type, or the first paragraph."""
+    paragraphs = [p.strip() for p in outline.split("\n\n") if p.strip()]
+    for paragraph in paragraphs:
+        if paragraph.upper().startswith(beat_type.upper() + ":"):
+            return paragraph
+    return paragraphs[0]
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+async def run_benchmark(args, outline: str, beat: str, tier: str):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = {"rate_limited": 0, "failed": 0}
+    
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await analyzer.analyze_beat_async(
+                    outline, beat, args.beat_type, context_mode=args.context_mode, tier=tier
+                )
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                message = str(e).lower()
+                errors["rate_limited" if "429" in message or "quota" in message else "failed"] += 1
+                
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return time.perf_counter() - start, latencies, errors
+
+def make_scheduler(args) -> LLMScheduler:
+    return LLMScheduler(
+        requests_per_minute=args.requests_per_minute,
+        burst=Config.LLM_BURST,
+        max_concurrency=args.max_concurrency,
+        max_queue=Config.LLM_MAX_QUEUE,
+        queue_timeout=Config.LLM_QUEUE_TIMEOUT_SECONDS,
+        max_retries=Config.LLM_MAX_RETRIES,
+        backoff_base=Config.LLM_BACKOFF_BASE_SECONDS,
+        backoff_max=Config.LLM_BACKOFF_MAX_SECONDS
+    )
+
+def benchmark_tier(args, outline: str, beat: str, tier: str):
+    """Run the benchmark for one tier on a fresh backend and scheduler and collect its metrics."""
+    backend = FakeBackend(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    analyzer.model = backend
+    analyzer.scheduler = make_scheduler(args)
+    usage_before = analyzer.get_token_usage()
+    
+    elapsed, latencies, errors = asyncio.run(run_benchmark(args, outline, beat, tier))
+    
+    usage = analyzer.get_token_usage()
+    scheduler_stats = analyzer.scheduler.stats()
+    metrics = {
+        "LLM calls": backend.calls,
+        "Prompt tokens": usage["prompt_tokens"] - usage_before["prompt_tokens"],
+        "Response tokens": usage["response_tokens"] - usage_before["response_tokens"],
+        "Wall time (s)": elapsed,
+        "Throughput (/s)": len(latencies) / elapsed,
+        "Rate limited": errors["rate_limited"],
+        "Failed": errors["failed"],
+        "LLM retries": scheduler_stats["retries"],
+        "LLM wait avg (s)": scheduler_stats["wait_seconds_avg"],
+        "LLM wait max (s)": scheduler_stats["wait_seconds_max"],
+        "Concurrency limit": scheduler_stats["concurrency_limit"],
+    }
+    if latencies:
+        metrics.update({
+            "Latency p50 (s)": percentile(latencies, 0.50),
+            "Latency p95 (s)": percentile(latencies, 0.95),
+            "Latency p99 (s)": percentile(latencies, 0.99),
+            "Latency mean (s)": statistics.mean(latencies),
+        })
+    return metrics, bool(latencies)
+
+def format_value(value) -> str:
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+def print_report(results):
+    """Print one column per tier, plus the fast/thorough ratio when both ran."""
+    tiers = list(results)
+    names = [name for name in results[tiers[0]] if all(name in results[tier] for tier in tiers)]
+    compare = "thorough" in results and "fast" in results
+    header = f"{'':<20}" + "".join(f"{tier:>12}" for tier in tiers) + (f"{'fast/thorough':>16}" if compare else "")
+    print(header)
+    for name in names:
+        row = f"{name:<20}" + "".join(f"{format_value(results[tier][name]):>12}" for tier in tiers)
+        if compare:
+            thorough = results["thorough"][name]
+            row += f"{results['fast'][name] / thorough:>16.2f}" if thorough else f"{'-':>16}"
+        print(row)
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    with open(args.outline, "r") as f:
+        outline = f.read()
+    beat = find_beat(outline, args.beat_type)
+    
+    analyzer.response_cache = None
+    # Repeated identical requests would otherwise be answered from the stage cache
+    analyzer.stage_cache = None
+    Config.ELEMENT_EXTRACTOR = args.element_extractor
+    definition_table.load()
+    
+    tiers = analyzer.ANALYSIS_TIERS if args.tier == "both" else (args.tier,)
+    results = {}
+    ok = True
+    for tier in tiers:
+        results[tier], tier_ok = benchmark_tier(args, outline, beat, tier)
+        ok = ok and tier_ok
+    
+    print(f"Requests: {args.requests} per tier at concurrency {args.concurrency}")
+    print_report(results)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Move legacy per-outline ChromaDB collections into the shared outlines collection.
+
+Every outline used to be indexed into its own outline_<id> collection, and
+those collections were never removed. This copies their chunks (with their
+existing embeddings) into OUTLINES_COLLECTION, keyed by outline_id metadata,
+and deletes each legacy collection once its chunks have been copied.
+
+Example:
+    python migrate_outlines.py --dry-run
+    python migrate_outlines.py --persist-directory ./chroma_db
+"""
+
+import argparse
+import logging
+import sys
+
+from src.rag.vector_store import VectorStore, DEFAULT_PERSIST_DIRECTORY
+from src.rag.outline_store import migrate_outline_collections
+from src.config.config import Config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate outline_<id> collections into the shared outlines collection")
+    parser.add_argument("--persist-directory", default=DEFAULT_PERSIST_DIRECTORY, help="ChromaDB directory to migrate")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the legacy collections")
+    parser.add_argument("--keep", action="store_true", help="Keep the legacy collections after copying them")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    vector_store = VectorStore(args.persist_directory)
+    report = migrate_outline_collections(vector_store, delete=not args.keep, dry_run=args.dry_run)
+    
+    if args.dry_run:
+        print(f"{report['collections']} legacy outline collections would be migrated into {Config.OUTLINES_COLLECTION}")
+        return True
+        
+    print(
+        f"Migrated {report['migrated']} of {report['collections']} outline collections "
+        f"({report['chunks']} chunks) into {Config.OUTLINES_COLLECTION}; deleted {report['deleted']}, "
+        f"stamped {report['stamped']} chunks for the sweeper"
+    )
+    for name in report["failed"]:
+        print(f"Failed: {name}")
+    return not report["failed"]
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
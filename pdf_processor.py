@@ -4,8 +4,8 @@ from PyPDF2 import PdfReader
 import json
 from pathlib import Path
 import re
-import chromadb
 import logging
+from src.rag.vector_store import VectorStore
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -118,21 +118,11 @@ def setup_chromadb():
     """Initialize ChromaDB."""
     logging.info("Setting up ChromaDB...")
     try:
-        # Create client and collection
-        logging.info("Creating ChromaDB client...")
-        client = chromadb.PersistentClient(path="./chroma_db")
-        
-        try:
-            # Try to get existing collection
-            collection = client.get_collection(name="save_the_cat")
-            logging.info("Found existing collection")
-        except Exception as e:
-            logging.info(f"Collection not found, creating new one: {str(e)}")
-            # Create new collection if it doesn't exist
-            collection = client.create_collection(name="save_the_cat")
-            logging.info("Created new collection")
-        
-        return collection
+        vector_store = VectorStore()
+        # Keep the existing collection and its chunks, create it on first use
+        vector_store.get_or_create_collection("save_the_cat")
+        logging.info("Collection save_the_cat is ready")
+        return vector_store
     except Exception as e:
         logging.error(f"Error setting up ChromaDB: {str(e)}")
         raise
@@ -157,21 +147,21 @@ def main():
         chunks = process_document(text)
         
         # Setup ChromaDB
-        collection = setup_chromadb()
+        vector_store = setup_chromadb()
         
-        # Add chunks to ChromaDB
+        # Add chunks to ChromaDB in batches (BATCH_SIZE chunks per batch, MAX_WORKERS embedded at once)
         logging.info("Adding chunks to ChromaDB...")
-        for i, chunk in enumerate(chunks):
-            try:
-                collection.add(
-                    documents=[chunk],
-                    ids=[f"chunk_{i}"],
-                    metadatas=[{"source": os.path.basename(pdf_path), "chunk_index": i}]
-                )
-                if (i + 1) % 10 == 0:
-                    logging.info(f"Processed {i + 1} chunks...")
-            except Exception as e:
-                logging.error(f"Error adding chunk {i} to ChromaDB: {str(e)}")
+        source = os.path.basename(pdf_path)
+        report = vector_store.add_documents(
+            "save_the_cat",
+            documents=chunks,
+            ids=(f"chunk_{i}" for i in range(len(chunks))),
+            metadatas=({"source": source, "chunk_index": i} for i in range(len(chunks)))
+        )
+        logging.info(
+            f"Added {report['chunks']} chunks in {report['batches']} batches "
+            f"in {report['seconds']:.2f}s ({report['chunks_per_second']:.1f} chunks/s)"
+        )
         
         logging.info(f"Successfully processed and stored {len(chunks)} chunks in ChromaDB")
         
@@ -1,15 +1,13 @@
-import chromadb
 import logging
+from src.rag.vector_store import VectorStore
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def setup_chromadb():
     """Initialize ChromaDB."""
-    # Create client and get collection
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_collection(name="save_the_cat")
-    return collection
+    # Get the collection from the shared client on ./chroma_db
+    return VectorStore().get_collection("save_the_cat")
 
 def main():
     try:
@@ -39,13 +37,12 @@ def main():
         beat_types = ["Opening Image", "Catalyst", "Midpoint", "All Is Lost", "Dark Night of the Soul", "Break into Three", "Finale"]
         
         logging.info("\n\nBeat Type Verification:")
-        for beat_type in beat_types:
-            results = collection.query(
-                query_texts=[f"What is the {beat_type} beat?"],
-                n_results=1,
-                where={"beat_type": beat_type}
-            )
-            
+        # All beat queries are embedded in one batch
+        verification = VectorStore().query_many("save_the_cat", [
+            {"query_text": f"What is the {beat_type} beat?", "n_results": 1, "where": {"beat_type": beat_type}}
+            for beat_type in beat_types
+        ])
+        for beat_type, results in zip(beat_types, verification):
             if results['documents'][0]:
                 logging.info(f"\n✅ Found definition for: {beat_type}")
                 logging.info(f"Metadata: {results['metadatas'][0][0]}")
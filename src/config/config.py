@@ -13,6 +13,90 @@ class Config:
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', '1000'))
     MAX_WORKERS = int(os.getenv('MAX_WORKERS', '4'))
     
+    # Outline chunk storage: "shared" puts every outline in OUTLINES_COLLECTION keyed by
+    # outline_id metadata, "per_outline" creates an outline_<id> collection per outline
+    OUTLINE_STORAGE_MODE = os.getenv('OUTLINE_STORAGE_MODE', 'shared')
+    OUTLINES_COLLECTION = os.getenv('OUTLINES_COLLECTION', 'outlines')
+    # "memory" keeps outline indexes in process (no disk I/O), "persistent" in the ChromaDB directory
+    OUTLINE_STORE = os.getenv('OUTLINE_STORE', 'memory')
+    # Outline indexes unused for OUTLINE_INDEX_TTL_SECONDS are deleted by a sweep every
+    # OUTLINE_SWEEP_INTERVAL_SECONDS (0 disables it); reuse is recorded at most once per
+    # OUTLINE_INDEX_TOUCH_SECONDS per outline
+    OUTLINE_INDEX_TTL_SECONDS = int(os.getenv('OUTLINE_INDEX_TTL_SECONDS', str(7 * 24 * 3600)))
+    OUTLINE_SWEEP_INTERVAL_SECONDS = int(os.getenv('OUTLINE_SWEEP_INTERVAL_SECONDS', '3600'))
+    OUTLINE_INDEX_TOUCH_SECONDS = int(os.getenv('OUTLINE_INDEX_TOUCH_SECONDS', '3600'))
+    
+    # Analysis settings
+    ANALYSIS_MAX_WORKERS = int(os.getenv('ANALYSIS_MAX_WORKERS', '16'))
+    # "thorough" runs the four-call pipeline, "fast" a single structured-output call
+    ANALYSIS_TIER = os.getenv('ANALYSIS_TIER', 'thorough')
+    # "llm" asks the model for the beat's key elements, "local" extracts them without a model call
+    ELEMENT_EXTRACTOR = os.getenv('ELEMENT_EXTRACTOR', 'llm')
+    # The local extractor falls back to the model when it finds fewer candidates than this
+    ELEMENT_EXTRACTOR_MIN_CANDIDATES = int(os.getenv('ELEMENT_EXTRACTOR_MIN_CANDIDATES', '3'))
+    # "full" sends the whole outline to the setup check, "retrieval" only the relevant earlier chunks
+    SETUP_CONTEXT_MODE = os.getenv('SETUP_CONTEXT_MODE', 'full')
+    SETUP_CONTEXT_TOKEN_BUDGET = int(os.getenv('SETUP_CONTEXT_TOKEN_BUDGET', '2000'))
+    # "vector" (embeddings), "lexical" (in-process BM25, no embedding call) or "hybrid" (both,
+    # fused by reciprocal rank with constant RRF_K) for retrieving outline and framework chunks
+    RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+    RRF_K = int(os.getenv('RRF_K', '60'))
+    # Elements the outline index shows as never mentioned, or mentioned in at least
+    # SETUP_PRECHECK_MIN_MENTIONS earlier paragraphs, are settled without the model
+    SETUP_PRECHECK_ENABLED = os.getenv('SETUP_PRECHECK_ENABLED', 'true').lower() == 'true'
+    SETUP_PRECHECK_MIN_MENTIONS = int(os.getenv('SETUP_PRECHECK_MIN_MENTIONS', '2'))
+    # Outlines over these per-stage budgets are compacted before prompting
+    FUNCTIONAL_OUTLINE_TOKEN_BUDGET = int(os.getenv('FUNCTIONAL_OUTLINE_TOKEN_BUDGET', '8000'))
+    SETUP_OUTLINE_TOKEN_BUDGET = int(os.getenv('SETUP_OUTLINE_TOKEN_BUDGET', '8000'))
+    FAST_OUTLINE_TOKEN_BUDGET = int(os.getenv('FAST_OUTLINE_TOKEN_BUDGET', '8000'))
+    # Prompts still above this limit are rejected without calling the model
+    MAX_PROMPT_TOKENS = int(os.getenv('MAX_PROMPT_TOKENS', '30000'))
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', './cache/llm_responses.sqlite')
+    LLM_CACHE_MEMORY_ENTRIES = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '512'))
+    LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))
+    LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+    # Stage results keyed by their exact inputs, reused when a beat is re-analyzed after an outline edit
+    STAGE_CACHE_ENABLED = os.getenv('STAGE_CACHE_ENABLED', 'true').lower() == 'true'
+    STAGE_CACHE_MEMORY_ENTRIES = int(os.getenv('STAGE_CACHE_MEMORY_ENTRIES', '1024'))
+    
+    # LLM backend: "gemini", or "fake" for offline load tests
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+    GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL_NAME', 'models/gemini-1.5-flash-latest')
+    FAKE_LLM_LATENCY_MS = float(os.getenv('FAKE_LLM_LATENCY_MS', '200'))
+    FAKE_LLM_LATENCY_JITTER_MS = float(os.getenv('FAKE_LLM_LATENCY_JITTER_MS', '50'))
+    FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', '0'))
+    FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv('FAKE_LLM_RATE_LIMIT_RATE', '0'))
+    FAKE_LLM_SEED = int(os.getenv('FAKE_LLM_SEED')) if os.getenv('FAKE_LLM_SEED') else None
+    
+    # LLM call scheduling: token bucket sized to the provider quota plus adaptive concurrency
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '300'))
+    LLM_BURST = int(os.getenv('LLM_BURST', '20'))
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+    LLM_MIN_CONCURRENCY = int(os.getenv('LLM_MIN_CONCURRENCY', '1'))
+    LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '100'))
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '30'))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+    LLM_BACKOFF_BASE_SECONDS = float(os.getenv('LLM_BACKOFF_BASE_SECONDS', '0.5'))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv('LLM_BACKOFF_MAX_SECONDS', '8'))
+    
+    # Background analysis jobs (POST /analyze/jobs)
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+    JOB_QUEUE_MAX = int(os.getenv('JOB_QUEUE_MAX', '100'))
+    JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', '3600'))
+    
+    # Prometheus metrics served at /metrics
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    
+    # Per-request profiling of /analyze ("X-Profile: 1" header or "?profile=1");
+    # with PROFILING_TOKEN set, the flag must carry the token instead
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+    PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', './profiles')
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+    
     # File patterns
     DATA_FILE_PATTERN = os.getenv('DATA_FILE_PATTERN', '*.csv')
     
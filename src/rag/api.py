@@ -1,14 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-import chromadb
-from chromadb.config import Settings
 import logging
-from typing import List, Dict, Any
-from .analyzer import analyze_beat
+from typing import List, Dict, Any, Optional, Literal
+from .analyzer import analyze_beat_async, analyze_beat_stream, get_cache_stats, get_scheduler_stats
+from .token_budget import PromptTooLargeError
+from .single_flight import SingleFlight, content_key
+from .jobs import JobQueue, JobQueueFullError
+from .metrics import registry as metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .profiling import profile_call_async, format_summary
+from .outline_store import OutlineIndexSweeper, outline_vector_store
+from ..config.config import Config
+from .beat_definitions import definition_table
+from .vector_store import VectorStore, get_collection, chroma_query_seconds
+import json
 import os
+import time
+import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,26 +41,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize ChromaDB client
+# Initialize ChromaDB client (shared through the vector store registry)
 try:
-    chroma_client = chromadb.PersistentClient(path="./chroma_db")
-    collection = chroma_client.get_collection("save_the_cat")
+    collection = get_collection("save_the_cat")
     logger.info("Successfully connected to ChromaDB collection")
 except Exception as e:
     logger.error(f"Error connecting to ChromaDB: {e}")
     # Don't raise exception here, handle gracefully in endpoints instead
     logger.info("Will attempt to create/reconnect to collection when needed")
 
+http_requests_in_flight = metrics.gauge(
+    "script_doctor_http_requests_in_flight",
+    "HTTP requests being handled; streaming responses count until their headers are sent"
+)
+http_request_seconds = metrics.histogram(
+    "script_doctor_http_request_seconds",
+    "HTTP request latency by route and status code",
+    ["method", "route", "status"]
+)
+
+if Config.METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        """Track in-flight requests and per-route latency for /metrics"""
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            http_requests_in_flight.dec()
+            # The route template, not the raw path, so job ids do not create new series
+            route = request.scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=route.path if route is not None else "unmatched",
+                status=status
+            )
+
 # Mount static files
 static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
 os.makedirs(static_dir, exist_ok=True)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
+# Concurrent identical /analyze requests (double clicks, client retries) share one pipeline run
+analysis_flights = SingleFlight()
+
+@app.on_event("startup")
+async def preload_beat_definitions():
+    """Load all beat definitions once so /analyze never queries ChromaDB for them"""
+    try:
+        count = await run_in_threadpool(definition_table.load)
+        logger.info(f"Preloaded {count} beat definitions")
+    except Exception as e:
+        logger.error(f"Error preloading beat definitions: {e}")
+
 class SceneAnalysisRequest(BaseModel):
     full_outline: str = Field(..., min_length=1, description="The full screenplay outline")
     designated_beat: str = Field(..., min_length=1, description="The specific beat to analyze")
     beat_type: str = Field(..., min_length=1, description="The type of beat (e.g., Midpoint, Catalyst)")
     num_results: int = Field(default=3, ge=1, le=10, description="Number of suggestions to return")
+    context_mode: Optional[Literal["full", "retrieval"]] = Field(
+        default=None,
+        description="Outline context for the setup check: the full outline or only retrieved earlier chunks (server default when omitted)"
+    )
+    tier: Optional[Literal["thorough", "fast"]] = Field(
+        default=None,
+        description="Analysis tier: the staged four-call pipeline or a single-call quick check (server default when omitted)"
+    )
 
 class AnalysisResult(BaseModel):
     flag: str
@@ -60,15 +122,33 @@ class SceneAnalysisResponse(BaseModel):
     # Primary user-facing response focusing on synthesized analysis
     analysis: AnalysisResult
 
+class JobError(BaseModel):
+    status_code: int
+    detail: str
+
+class AnalysisJobResponse(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Same body /analyze returns, once the job has succeeded
+    result: Optional[SceneAnalysisResponse] = None
+    error: Optional[JobError] = None
+
 @app.get("/")
 async def root():
     """Serve the main HTML page"""
     return FileResponse(os.path.join(static_dir, "index.html"))
 
 @app.post("/analyze", response_model=SceneAnalysisResponse)
-async def analyze_scene(request: SceneAnalysisRequest):
+async def analyze_scene(request: SceneAnalysisRequest, http_request: Request, response: Response):
     """
     Analyze a beat using the Save the Cat methodology
+    
+    With PROFILING_ENABLED, an "X-Profile: 1" header or "?profile=1" query
+    flag (the PROFILING_TOKEN value when one is configured) profiles the
+    request; see _analyze_profiled.
     """
     try:
         # Log the request for debugging
@@ -77,56 +157,269 @@ async def analyze_scene(request: SceneAnalysisRequest):
         logger.info(f"Full outline length: {len(request.full_outline)} characters")
         
         # Validate that we have all the necessary inputs
-        if not request.full_outline.strip():
-            raise ValueError("Full outline is required")
+        _validate_request(request)
         
-        if not request.designated_beat.strip():
-            raise ValueError("Designated beat text is required")
+        if _profile_requested(http_request):
+            return _to_response(await _analyze_profiled(request, response))
             
-        if not request.beat_type.strip():
-            raise ValueError("Beat type is required")
-        
-        # Run the full analysis pipeline
-        analysis = analyze_beat(
-            outline=request.full_outline,
-            beat=request.designated_beat,
-            beat_type=request.beat_type
+        # Run the full analysis pipeline without blocking the event loop,
+        # joining an identical request that is already in flight
+        analysis = await analysis_flights.run(
+            _request_key(request),
+            lambda: analyze_beat_async(
+                outline=request.full_outline,
+                beat=request.designated_beat,
+                beat_type=request.beat_type,
+                context_mode=request.context_mode,
+                tier=request.tier
+            )
         )
         
-        # Ensure analysis has all the expected keys
-        if not isinstance(analysis, dict) or 'analysis' not in analysis:
-            raise ValueError("Invalid analysis result format")
-            
-        # Extract the analysis result
-        analysis_result = analysis['analysis']
-        if not all(key in analysis_result for key in ['flag', 'explanation', 'suggestions']):
-            raise ValueError("Missing required fields in analysis result")
-            
         # Return the formatted response
-        return SceneAnalysisResponse(
-            analysis=AnalysisResult(
-                flag=analysis_result.get('flag', 'Analysis failed'),
-                explanation=analysis_result.get('explanation', 'No explanation available'),
-                suggestions=analysis_result.get('suggestions', ['No suggestions available'])
-            )
-        )
+        return _to_response(analysis)
         
+    except Exception as e:
+        raise _to_http_error(e)
+
+@app.post("/analyze/stream")
+async def analyze_scene_stream(request: SceneAnalysisRequest):
+    """
+    Analyze a beat, streaming Server-Sent Events as each stage finishes
+    
+    Events: "started", one per finished stage ("definition",
+    "functional_analysis", "elements", "setup_analysis"), "synthesis_token"
+    for each chunk of synthesis text, then "result" carrying the same body
+    as /analyze. Failures after the stream has started are sent as an
+    "error" event with the status code /analyze would have returned.
+    """
+    logger.info(f"Streaming analysis for beat type: {request.beat_type}")
+    try:
+        _validate_request(request)
     except ValueError as e:
+        raise _to_http_error(e)
+        
+    async def events():
+        try:
+            async for event, data in analyze_beat_stream(
+                outline=request.full_outline,
+                beat=request.designated_beat,
+                beat_type=request.beat_type,
+                context_mode=request.context_mode,
+                tier=request.tier
+            ):
+                if event == "result":
+                    data = _to_response(data).model_dump()
+                yield _format_sse(event, data)
+        except Exception as e:
+            error = _to_http_error(e)
+            yield _format_sse("error", {"status_code": error.status_code, "detail": error.detail})
+            
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _profile_requested(http_request: Request) -> bool:
+    """True when profiling is enabled and the request asks for it."""
+    if not Config.PROFILING_ENABLED:
+        return False
+    flag = http_request.headers.get("X-Profile") or http_request.query_params.get("profile")
+    if not flag:
+        return False
+    if Config.PROFILING_TOKEN:
+        return flag == Config.PROFILING_TOKEN
+    return flag.lower() not in ("0", "false", "no")
+
+async def _analyze_profiled(request: SceneAnalysisRequest, response: Response) -> Dict[str, Any]:
+    """Run one analysis under the sampling profiler and report where its time went.
+    
+    The request takes the same async path as an unprofiled one. Its stage
+    tasks and the executor threads doing its ChromaDB and embedding work are
+    sampled, including time suspended on model calls; other requests served
+    meanwhile are not. The request is never coalesced with identical ones.
+    The collapsed-stack profile is written to PROFILE_OUTPUT_DIR/<id>.collapsed
+    and the slowest functions are returned in the X-Profile-Summary header.
+    """
+    profile_id = uuid.uuid4().hex
+    analysis, report = await profile_call_async(
+        profile_id,
+        Config.PROFILE_OUTPUT_DIR,
+        analyze_beat_async,
+        outline=request.full_outline,
+        beat=request.designated_beat,
+        beat_type=request.beat_type,
+        context_mode=request.context_mode,
+        tier=request.tier,
+        interval=Config.PROFILE_SAMPLE_INTERVAL_MS / 1000
+    )
+    response.headers["X-Profile-Id"] = profile_id
+    response.headers["X-Profile-Artifact"] = report["path"]
+    response.headers["X-Profile-Seconds"] = str(report["seconds"])
+    response.headers["X-Profile-Summary"] = format_summary(report["summary"])
+    return analysis
+
+def _validate_request(request: SceneAnalysisRequest) -> None:
+    """Reject requests whose required fields are blank."""
+    if not request.full_outline.strip():
+        raise ValueError("Full outline is required")
+        
+    if not request.designated_beat.strip():
+        raise ValueError("Designated beat text is required")
+        
+    if not request.beat_type.strip():
+        raise ValueError("Beat type is required")
+
+def _request_key(request: SceneAnalysisRequest) -> str:
+    """Content hash of the fields that determine the analysis result."""
+    return content_key(
+        request.full_outline, request.designated_beat, request.beat_type, request.context_mode, request.tier
+    )
+
+def _to_response(analysis: Dict[str, Any]) -> SceneAnalysisResponse:
+    """Convert an analyzer result into the public response model."""
+    # Ensure analysis has all the expected keys
+    if not isinstance(analysis, dict) or 'analysis' not in analysis:
+        raise ValueError("Invalid analysis result format")
+        
+    # Extract the analysis result
+    analysis_result = analysis['analysis']
+    if not all(key in analysis_result for key in ['flag', 'explanation', 'suggestions']):
+        raise ValueError("Missing required fields in analysis result")
+        
+    return SceneAnalysisResponse(
+        analysis=AnalysisResult(
+            flag=analysis_result.get('flag', 'Analysis failed'),
+            explanation=analysis_result.get('explanation', 'No explanation available'),
+            suggestions=analysis_result.get('suggestions', ['No suggestions available'])
+        )
+    )
+
+def _to_http_error(e: Exception) -> HTTPException:
+    """Map an analysis failure to the HTTP error returned to the client."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, PromptTooLargeError):
+        logger.error(f"Prompt too large: {e}")
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, ValueError):
         logger.error(f"Validation error: {e}")
         logger.error(f"Full error details: {str(e)}")
-        raise HTTPException(status_code=422, detail=str(e))
+        return HTTPException(status_code=422, detail=str(e))
+        
+    error_msg = str(e)
+    logger.error(f"Full error details: {error_msg}")
+    if "Rate limit exceeded" in error_msg or "quota" in error_msg.lower():
+        logger.error(f"API rate limit error: {e}")
+        return HTTPException(status_code=429, detail="API rate limit exceeded. Please try again later.")
+    elif "Invalid response from Gemini API" in error_msg:
+        logger.error(f"Invalid Gemini API response: {e}")
+        return HTTPException(status_code=500, detail="Invalid response from Gemini API")
+    else:
+        logger.error(f"Error analyzing beat: {e}")
+        return HTTPException(status_code=500, detail=str(e))
+
+def _format_sse(event: str, data: Any) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _run_analysis_job(request: SceneAnalysisRequest) -> SceneAnalysisResponse:
+    """Job handler: run the same coalesced pipeline as /analyze."""
+    try:
+        analysis = await analysis_flights.run(
+            _request_key(request),
+            lambda: analyze_beat_async(
+                outline=request.full_outline,
+                beat=request.designated_beat,
+                beat_type=request.beat_type,
+                context_mode=request.context_mode,
+                tier=request.tier
+            )
+        )
+        return _to_response(analysis)
+    except Exception as e:
+        # Map once, so polling the failed job reports the status /analyze would have returned
+        raise _to_http_error(e)
+
+# Background analyses, decoupled from the HTTP connection that submitted them
+analysis_jobs = JobQueue(
+    _run_analysis_job,
+    workers=Config.JOB_WORKERS,
+    max_queue=Config.JOB_QUEUE_MAX,
+    result_ttl=Config.JOB_RESULT_TTL_SECONDS
+)
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Start the background analysis workers"""
+    analysis_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Stop the background analysis workers"""
+    await analysis_jobs.stop()
+
+# Deletes outline indexes nobody has used for OUTLINE_INDEX_TTL_SECONDS
+outline_sweeper = OutlineIndexSweeper(
+    outline_vector_store,
+    ttl_seconds=Config.OUTLINE_INDEX_TTL_SECONDS,
+    interval_seconds=Config.OUTLINE_SWEEP_INTERVAL_SECONDS
+)
+
+@app.on_event("startup")
+async def start_outline_sweeper():
+    """Start the periodic sweep of unused outline indexes"""
+    if Config.OUTLINE_SWEEP_INTERVAL_SECONDS > 0:
+        outline_sweeper.start()
+
+@app.on_event("shutdown")
+async def stop_outline_sweeper():
+    """Stop the outline index sweeper"""
+    await outline_sweeper.stop()
+
+def _job_response(job) -> AnalysisJobResponse:
+    """Convert a job into its public status representation."""
+    error = None
+    if job.error is not None:
+        http_error = _to_http_error(job.error)
+        error = JobError(status_code=http_error.status_code, detail=str(http_error.detail))
+    return AnalysisJobResponse(
+        job_id=job.id,
+        status=job.status,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        result=job.result,
+        error=error
+    )
+
+@app.post("/analyze/jobs", response_model=AnalysisJobResponse, status_code=202)
+async def submit_analysis_job(request: SceneAnalysisRequest):
+    """
+    Queue a beat analysis and return its job id immediately
+    
+    Poll GET /analyze/jobs/{job_id} for the status and, once finished, the result.
+    """
+    try:
+        _validate_request(request)
+        job = analysis_jobs.submit(request)
+    except JobQueueFullError as e:
+        logger.warning(f"Rejected analysis job: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        error_msg = str(e)
-        logger.error(f"Full error details: {error_msg}")
-        if "Rate limit exceeded" in error_msg or "quota" in error_msg.lower():
-            logger.error(f"API rate limit error: {e}")
-            raise HTTPException(status_code=429, detail="API rate limit exceeded. Please try again later.")
-        elif "Invalid response from Gemini API" in error_msg:
-            logger.error(f"Invalid Gemini API response: {e}")
-            raise HTTPException(status_code=500, detail="Invalid response from Gemini API")
-        else:
-            logger.error(f"Error analyzing beat: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+        raise _to_http_error(e)
+    return _job_response(job)
+
+@app.get("/analyze/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(job_id: str):
+    """
+    Return the status of an analysis job, with its result once it has succeeded
+    """
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    return _job_response(job)
 
 @app.get("/health")
 async def health_check():
@@ -137,20 +430,24 @@ async def health_check():
         chroma_error = None
         
         try:
-            chroma_client = chromadb.PersistentClient(path="./chroma_db")
-            collection = chroma_client.get_collection("save_the_cat")
-            collection.count()
+            # ChromaDB calls block; keep them off the event loop
+            await run_in_threadpool(lambda: get_collection("save_the_cat").count())
             chroma_status = "healthy"
         except Exception as e:
             chroma_error = str(e)
-        
+            
         return {
             "status": "healthy" if chroma_status == "healthy" else "unhealthy",
             "components": {
                 "api": "healthy",
                 "chromadb": chroma_status,
                 "error": chroma_error
-            }
+            },
+            "llm_cache": get_cache_stats(),
+            "llm_scheduler": get_scheduler_stats(),
+            "analysis_coalescing": analysis_flights.stats(),
+            "analysis_jobs": analysis_jobs.stats(),
+            "outline_sweeper": outline_sweeper.stats()
         }
     except Exception as e:
         return {
@@ -162,20 +459,51 @@ async def health_check():
             }
         }
 
+def _collect_api_metrics():
+    """Job queue and request coalescing counters, read when /metrics is scraped."""
+    jobs = analysis_jobs.stats()
+    flights = analysis_flights.stats()
+    samples = [
+        ("script_doctor_analysis_jobs_queued", "gauge", "Analysis jobs waiting for a worker", {}, jobs["queue_depth"]),
+        ("script_doctor_analysis_jobs_running", "gauge", "Analysis jobs being processed", {}, jobs["running"]),
+        ("script_doctor_analysis_coalesced_total", "counter", "Analyze requests that joined an identical in-flight run", {}, flights["coalesced"]),
+    ]
+    sweeps = outline_sweeper.stats()
+    samples += [
+        ("script_doctor_outline_indexes_swept_total", "counter", "Outline indexes deleted by the TTL sweeper", {}, sweeps["outlines_deleted"]),
+        ("script_doctor_outline_sweep_freed_bytes_total", "counter", "Outline documents and embeddings deleted by the sweeper, in bytes", {}, sweeps["freed_bytes"]),
+    ]
+    for status in ("succeeded", "failed", "rejected"):
+        samples.append((
+            "script_doctor_analysis_jobs_total", "counter", "Finished or rejected analysis jobs by outcome",
+            {"status": status}, jobs[status]
+        ))
+    return samples
+
+metrics.add_collector(_collect_api_metrics)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: stage and model call latency, call outcomes, tokens, caches and queues"""
+    if not Config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.post("/query/{collection_name}")
 async def query_collection(collection_name: str, query: Dict[str, Any]):
     """Query a ChromaDB collection directly for testing purposes"""
     try:
         # Get the collection
-        collection = chroma_client.get_collection(collection_name)
+        collection = VectorStore().get_collection(collection_name)
         
         # Execute the query
-        results = collection.query(
-            query_texts=query.get("query_texts", []),
-            n_results=query.get("n_results", 1),
-            where=query.get("where")
-        )
-        
+        with chroma_query_seconds.time(caller="api"):
+            results = collection.query(
+                query_texts=query.get("query_texts", []),
+                n_results=query.get("n_results", 1),
+                where=query.get("where")
+            )
+            
         return results
     except Exception as e:
         logger.error(f"Error querying collection {collection_name}: {str(e)}")
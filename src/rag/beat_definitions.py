@@ -0,0 +1,147 @@
+from typing import Any, Dict, Optional
+import json
+import logging
+import os
+import re
+import threading
+
+from .vector_store import get_collection
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Framework collection and the JSON file it is usually ingested from
+FRAMEWORK_COLLECTION = "save_the_cat"
+DEFAULT_BEATS_JSON = os.path.join("data", "save_the_cat", "beats.json")
+
+def normalize_beat_type(beat_type: str) -> str:
+    """Normalize a beat type name for lookups.
+    
+    Case, spacing and punctuation are ignored, so "Break Into Two",
+    "break into two" and "Break-Into-Two" share a key, as do "Setup" and "Set-Up".
+    
+    Args:
+        beat_type (str): Beat type as entered by the user or stored in metadata
+    
+    Returns:
+        str: Normalized lookup key
+    """
+    return re.sub(r'[^a-z0-9]', '', beat_type.lower())
+
+def format_beat_document(beat_type: str, description: str) -> str:
+    """Render a beat definition in the same layout DocumentLoader stores in ChromaDB."""
+    return f"BEAT TYPE: {beat_type}\n\nDEFINITION: {description}\n\nThis is the '{beat_type}' beat according to the Save the Cat screenplay structure framework."
+
+class BeatDefinitionTable:
+    def __init__(self, collection_name: str = FRAMEWORK_COLLECTION, json_path: str = DEFAULT_BEATS_JSON):
+        """In-process table of Save the Cat beat definitions keyed by normalized beat type.
+        
+        There are only 15 fixed beats, so they are read once (from the framework
+        collection's metadata, or the beats JSON file as a fallback) and every
+        later lookup is a dict access instead of an embedding query.
+        
+        Args:
+            collection_name (str): ChromaDB collection holding the framework beats
+            json_path (str): Beats JSON file used when the collection has no beats
+        """
+        self.collection_name = collection_name
+        self.json_path = json_path
+        self._definitions: Optional[Dict[str, str]] = None
+        self._source: Optional[str] = None
+        self._lock = threading.Lock()
+        
+    def is_loaded(self) -> bool:
+        """Return True once the table has been populated."""
+        return self._definitions is not None
+        
+    def load(self) -> int:
+        """Populate the table, preferring the framework collection over the JSON file.
+        
+        Returns:
+            int: Number of beat definitions loaded
+        """
+        with self._lock:
+            definitions = {}
+            try:
+                definitions = self._load_from_collection(get_collection(self.collection_name))
+                self._source = f"collection:{self.collection_name}"
+            except Exception as e:
+                logger.warning(f"Could not load beat definitions from collection {self.collection_name}: {str(e)}")
+                
+            if not definitions:
+                try:
+                    definitions = self._load_from_json(self.json_path)
+                    self._source = f"json:{self.json_path}"
+                except Exception as e:
+                    logger.error(f"Could not load beat definitions from {self.json_path}: {str(e)}")
+                    
+            self._definitions = definitions
+            logger.info(f"Loaded {len(definitions)} beat definitions from {self._source}")
+            return len(definitions)
+            
+    def _load_from_collection(self, collection) -> Dict[str, str]:
+        """Read every beat document from the collection with a single metadata get."""
+        results = collection.get(include=["documents", "metadatas"])
+        documents = results.get("documents") or []
+        metadatas = results.get("metadatas") or []
+        
+        # Keep the first document per beat type, in ingestion order
+        entries = sorted(
+            zip(documents, metadatas),
+            key=lambda entry: (entry[1] or {}).get("index", 0)
+        )
+        definitions = {}
+        for document, metadata in entries:
+            beat_type = (metadata or {}).get("beat_type")
+            # Fallback chunks from unstructured ingestion are not beat definitions
+            if not beat_type or beat_type.startswith("chunk_"):
+                continue
+            definitions.setdefault(normalize_beat_type(beat_type), document)
+        return definitions
+        
+    def _load_from_json(self, path: str) -> Dict[str, str]:
+        """Read beat definitions from a beats JSON file."""
+        with open(path, 'r') as f:
+            data = json.load(f)
+            
+        definitions = {}
+        for beat in data.get("beats", []):
+            beat_type = beat.get("name")
+            if beat_type:
+                definitions[normalize_beat_type(beat_type)] = format_beat_document(
+                    beat_type, beat.get("description", "")
+                )
+        return definitions
+        
+    def get(self, beat_type: str) -> Optional[str]:
+        """Look up a beat definition, loading the table on first use.
+        
+        Args:
+            beat_type (str): Beat type in any capitalization or spacing
+        
+        Returns:
+            Optional[str]: Definition document, or None if the beat type is unknown
+        """
+        if self._definitions is None:
+            self.load()
+        # Read once so a concurrent invalidate() cannot swap the dict out mid-lookup
+        definitions = self._definitions or {}
+        return definitions.get(normalize_beat_type(beat_type))
+        
+    def invalidate(self) -> None:
+        """Drop the loaded definitions so the next lookup reloads them."""
+        with self._lock:
+            self._definitions = None
+            self._source = None
+        logger.info("Beat definition table invalidated")
+        
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of loaded definitions and where they came from."""
+        return {
+            "loaded": self.is_loaded(),
+            "definitions": len(self._definitions or {}),
+            "source": self._source
+        }
+
+# Process-wide table shared by the analyzer and invalidated on re-ingestion
+definition_table = BeatDefinitionTable()
@@ -7,18 +7,23 @@ import logging
 import re
 from PyPDF2 import PdfReader
 from .vector_store import VectorStore
+from .outline_store import store_outline_chunks, chunk_offsets, outline_vector_store
+from .beat_definitions import definition_table, format_beat_document, FRAMEWORK_COLLECTION
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 class DocumentLoader:
-    def __init__(self, vector_store=None):
+    def __init__(self, vector_store=None, outline_store=None):
         """Initialize the document loader.
         
         Args:
             vector_store: VectorStore instance for storing documents
+            outline_store: VectorStore outlines are indexed in, the one the
+                analyzer retrieves from (outline_vector_store()) by default
         """
         self.vector_store = vector_store or VectorStore()
+        self.outline_store = outline_store or outline_vector_store()
         
     def load_framework_document(self, file_path: str) -> None:
         """Load and index the framework document (e.g., Save the Cat PDF/TXT).
@@ -54,7 +59,7 @@ class DocumentLoader:
             raise ValueError(f"Unsupported file type: {ext}")
             
         # Create collection for framework document beats
-        collection_name = "save_the_cat"
+        collection_name = FRAMEWORK_COLLECTION
         
         # Check if collection exists and delete if it does
         try:
@@ -95,6 +100,9 @@ class DocumentLoader:
             metadatas=metadatas
         )
         
+        # The in-process definition table was built from the old collection
+        definition_table.invalidate()
+        
         logger.info(f"Successfully loaded framework document with {len(beat_documents)} beat definitions")
         
     def _extract_text_from_pdf(self, file_path: str) -> str:
@@ -178,7 +186,7 @@ class DocumentLoader:
             description = re.sub(r'\s+', ' ', description)
             
             # Create a structured document for this beat
-            beat_doc = f"BEAT TYPE: {beat_type}\n\nDEFINITION: {description}\n\nThis is the '{beat_type}' beat according to the Save the Cat screenplay structure framework."
+            beat_doc = format_beat_document(beat_type, description)
             
             beat_documents.append({
                 "type": beat_type,
@@ -218,7 +226,7 @@ class DocumentLoader:
                 description = beat.get("description", "")
                 
                 # Create a structured document for this beat
-                beat_doc = f"BEAT TYPE: {beat_type}\n\nDEFINITION: {description}\n\nThis is the '{beat_type}' beat according to the Save the Cat screenplay structure framework."
+                beat_doc = format_beat_document(beat_type, description)
                 
                 beat_documents.append({
                     "type": beat_type,
@@ -290,32 +298,9 @@ class DocumentLoader:
         """
         logger.info(f"Loading outline with ID: {outline_id}")
         
-        collection_name = f"outline_{outline_id}"
-        self.vector_store.create_collection(
-            name=collection_name,
-            metadata={"type": "screenplay_outline", "id": outline_id}
-        )
-        
         # Split outline into chunks
         chunks = self._chunk_text_with_overlap(outline_text)
         
-        documents = []
-        ids = []
-        metadatas = []
-        
-        for i, chunk in enumerate(chunks):
-            documents.append(chunk)
-            ids.append(f"{outline_id}_chunk_{i}")
-            metadatas.append({
-                "chunk_index": i,
-                "outline_id": outline_id
-            })
-            
-        self.vector_store.add_documents(
-            collection_name=collection_name,
-            documents=documents,
-            ids=ids,
-            metadatas=metadatas
-        )
+        store_outline_chunks(self.outline_store, outline_id, chunks, chunk_offsets(outline_text, chunks))
         
         logger.info(f"Successfully indexed outline with ID: {outline_id} ({len(chunks)} chunks)") 
\ No newline at end of file
@@ -0,0 +1,196 @@
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+import logging
+import re
+from .terms import STOPWORDS as TERM_STOPWORDS, normalize_term
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Words that never start or form an element on their own: the shared stopwords
+# plus pronouns, adverbs, numbers and screenplay markup
+STOPWORDS = TERM_STOPWORDS | frozenset("""
+above after again against all also any because before below between both can could did do does doing down
+during each even ever every few further had has have having he here hers herself him himself i if it itself
+just let me more most myself no nor not now off once only other ours out own same she should so some such than
+theirs them themselves then there they through too until up very we while will would you yours yet still
+without within toward towards across around behind beyond along among upon despite near inside outside
+like instead rather away back else alone meanwhile however suddenly finally eventually soon together afterwards
+one two three four five six seven eight nine ten first second third last next new old
+int ext day night cut fade later continuous act beat scene
+""".split())
+
+# Common nouns too generic to need a setup
+GENERIC_NOUNS = frozenset("""
+way thing things time times moment moments idea ideas reason reasons day days week weeks month months year
+years minute minutes hour hours life lot part place end beginning start side kind sort point fact something
+anything everything nothing someone anyone everyone people person room
+""".split())
+
+# Frequent verbs that end a noun phrase ("her art starts to change")
+VERBS = frozenset("""
+is are was were be goes go went starts start started begins begin began becomes become became comes come came
+makes make made takes take took gets get got turns turn seems seem leads lead finds find shows show tells tell
+gives give combines combine remains remain feels feel looks look says say knows know wants want needs need
+""".split())
+
+# Words after which a noun phrase starts
+DETERMINERS = frozenset("a an the her his their its our my your this these those".split())
+
+# Abbreviated titles whose period does not end a name
+TITLES = frozenset("dr mr mrs ms st prof capt sgt lt".split())
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z'\-]*")
+_BEAT_LABEL = re.compile(r"^\s*[A-Z][A-Z0-9 \-]*:\s*")
+_SENTENCE_END = re.compile(r"[.!?:;\"—]$")
+
+def _scan(text: str, words: Set[str]) -> Tuple[Counter, Set[str]]:
+    """Count whole-word occurrences of the given words in one pass over the text.
+    
+    Only the handful of candidate words is looked up, never the text's whole
+    vocabulary, which keeps extraction fast on long outlines.
+    
+    Returns:
+        Tuple of the lowercased counts and the words also used in lowercase
+    """
+    if not words or not text:
+        return Counter(), set()
+    pattern = re.compile(
+        r"(?<![A-Za-z])(?:" + "|".join(sorted(map(re.escape, words), key=len, reverse=True)) + r")(?![A-Za-z])",
+        re.IGNORECASE
+    )
+    matches = pattern.findall(text)
+    return Counter(match.lower() for match in matches), {match for match in matches if match.islower()}
+
+def _tokens(text: str) -> List[Dict]:
+    """Split text into words, marking those that start a sentence or follow punctuation."""
+    tokens = []
+    boundary = True
+    for match in re.finditer(r"\S+", text):
+        raw = match.group(0)
+        word = _WORD.search(raw)
+        if word is None:
+            boundary = True
+            continue
+        tokens.append({
+            "text": word.group(0),
+            "norm": normalize_term(word.group(0)),
+            "sentence_start": boundary,
+            # Punctuation before or after the word breaks a run of names or a noun phrase
+            "break_before": word.start() > 0,
+            "break_after": word.end() < len(raw) and not _is_title(raw, word.group(0)),
+        })
+        boundary = bool(_SENTENCE_END.search(raw)) and tokens[-1]["break_after"]
+    return tokens
+
+def _is_title(raw: str, word: str) -> bool:
+    """True for an abbreviated title such as "Dr." whose period is not a sentence end."""
+    return raw == word + "." and word.lower() in TITLES
+
+def _is_capitalized(token: Dict) -> bool:
+    return token["text"][0].isupper() and token["norm"] not in STOPWORDS
+
+def _names(tokens: List[Dict]) -> List[Tuple[List[str], bool]]:
+    """Runs of capitalized words: characters, places and named things.
+    
+    Returns:
+        List of (words, sentence_start) pairs; the first word of a run opening
+        a sentence may be an ordinary word ("Initially Sarah hesitates")
+    """
+    names = []
+    run = []
+    
+    def flush():
+        if run:
+            names.append(([normalize_term(t["text"]).title() for t in run], run[0]["sentence_start"]))
+            run.clear()
+            
+    for token in tokens:
+        if not _is_capitalized(token):
+            flush()
+            continue
+        if token["break_before"]:
+            flush()
+        run.append(token)
+        if token["break_after"]:
+            flush()
+    flush()
+    return names
+
+def _noun_phrases(tokens: List[Dict]) -> List[str]:
+    """Lowercase phrases introduced by a determiner, reduced to their last two words."""
+    phrases = []
+    for i, token in enumerate(tokens):
+        if token["norm"] not in DETERMINERS or token["break_after"]:
+            continue
+        words = []
+        for following in tokens[i + 1:i + 5]:
+            if following["norm"] in STOPWORDS or following["text"][0].isupper() or following["break_before"]:
+                break
+            # A participle or adverb after the head noun starts a new clause
+            if words and (following["norm"] in VERBS or following["norm"].endswith(("ing", "ed", "ly"))):
+                break
+            words.append(following["norm"])
+            if following["break_after"]:
+                break
+        # English noun phrases end in their head noun; keep at most one modifier
+        words = [word for word in words[-2:] if len(word) > 2]
+        if words and words[-1] not in GENERIC_NOUNS:
+            phrases.append(" ".join(words))
+    return phrases
+
+def extract_elements(beat: str, outline: str = "", max_elements: int = 5) -> List[str]:
+    """Find the story elements in a beat that need setup earlier in the outline.
+    
+    Candidates are capitalized names (characters, locations), noun phrases
+    repeated in the beat, and objects that also appear in the outline outside
+    the beat. Names rank first, then candidates by how often they occur.
+    
+    Args:
+        beat (str): The designated beat
+        outline (str): The full outline, used to find elements mentioned elsewhere
+        max_elements (int): Maximum number of elements returned
+    
+    Returns:
+        List[str]: Elements, most important first
+    """
+    beat = _BEAT_LABEL.sub("", beat, count=1)
+    tokens = _tokens(beat)
+    beat_counts = Counter(token["norm"] for token in tokens)
+    beat_lowercase = {token["text"] for token in tokens if token["text"].islower()}
+    
+    runs = _names(tokens)
+    phrases = _noun_phrases(tokens)
+    ambiguous = {words[0].lower() for words, sentence_start in runs if sentence_start}
+    heads = {phrase.split()[-1] for phrase in phrases}
+    outline_counts, outline_lowercase = _scan(outline, ambiguous | heads)
+    
+    # A sentence-initial word the text also uses in lowercase is not part of a name
+    common = (beat_lowercase | outline_lowercase) & ambiguous
+    names = []
+    for words, sentence_start in runs:
+        if sentence_start and words[0].lower() in common:
+            words = words[1:]
+        if words:
+            names.append(" ".join(words))
+            
+    scores: Dict[str, float] = {}
+    for name in sorted(dict.fromkeys(names), key=lambda name: -len(name.split())):
+        # A first name already covered by a full name is the same character
+        if any(name in other.split() for other in scores):
+            continue
+        scores[name] = 3.0 + sum(1 for other in names if other == name or other in name.split())
+        
+    for phrase in phrases:
+        head = phrase.split()[-1]
+        repeated = beat_counts[head] > 1
+        shared = outline_counts[head] > beat_counts[head]
+        if not (repeated or shared):
+            continue
+        # Keep the first phrase seen for a head noun
+        if any(other.split()[-1] == head for other in scores if other.islower()):
+            continue
+        scores[phrase] = beat_counts[head] + (1.0 if shared else 0.0)
+        
+    ranked = sorted(scores, key=lambda element: -scores[element])
+    return ranked[:max_elements]
@@ -0,0 +1,181 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+import uuid
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+class Job:
+    def __init__(self, payload: Any):
+        """A unit of background work and its outcome.
+        
+        Args:
+            payload (Any): Argument passed to the queue's handler
+        """
+        self.id = str(uuid.uuid4())
+        self.payload = payload
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+
+class JobQueue:
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = 4,
+        max_queue: int = 100,
+        result_ttl: float = 3600
+    ):
+        """Bounded queue of jobs processed by a fixed pool of asyncio workers.
+        
+        Submitting returns immediately, so the caller's latency does not depend
+        on how long the handler takes. Finished jobs are kept for result_ttl
+        seconds and then forgotten.
+        
+        Args:
+            handler (Callable): Coroutine function run for each job's payload
+            workers (int): Number of jobs processed concurrently
+            max_queue (int): Jobs allowed to wait; submissions beyond it are rejected
+            result_ttl (float): Seconds a finished job's result is retained
+        """
+        self.handler = handler
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        # Queued jobs carried over from a previous loop that did not fit in the
+        # new queue; moved into it as workers free up space
+        self._deferred: deque = deque()
+        self._stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "expired": 0}
+        
+    def start(self) -> None:
+        """Start the worker pool on the running event loop (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker_tasks = [loop.create_task(self._work(i)) for i in range(self.workers)]
+        # Jobs queued on a previous loop can no longer run there. Jobs interrupted
+        # while running were queued again too, so there may be more than fit.
+        self._deferred = deque(sorted(
+            (job for job in self._jobs.values() if job.status == "queued"),
+            key=lambda job: job.created_at
+        ))
+        self._refill()
+        if self._deferred:
+            logger.warning(f"Deferred {len(self._deferred)} queued jobs until the job queue has room")
+        logger.info(f"Started {self.workers} job workers")
+        
+    def _refill(self) -> None:
+        """Move deferred jobs into the queue, oldest first, while it has room."""
+        while self._deferred and not self._queue.full():
+            self._queue.put_nowait(self._deferred.popleft())
+        
+    async def stop(self) -> None:
+        """Cancel the workers; queued jobs stay queued until the pool is started again."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._loop = None
+        
+    def submit(self, payload: Any) -> Job:
+        """Queue a job for the worker pool.
+        
+        Args:
+            payload (Any): Argument for the handler
+        
+        Returns:
+            Job: The queued job
+        
+        Raises:
+            JobQueueFullError: If max_queue jobs are already waiting
+        """
+        self.start()
+        self._purge()
+        job = Job(payload)
+        try:
+            if self._deferred:
+                # Deferred jobs were submitted earlier and go first
+                raise asyncio.QueueFull
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise JobQueueFullError(f"Job queue is full ({self.max_queue} jobs waiting)")
+        self._jobs[job.id] = job
+        self._stats["submitted"] += 1
+        logger.info(f"Queued job {job.id} ({self._queue.qsize()} waiting)")
+        return job
+        
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id, or None if it is unknown or its result has expired."""
+        self._purge()
+        return self._jobs.get(job_id)
+        
+    async def _work(self, worker: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self._refill()
+            job.status = "running"
+            job.started_at = time.time()
+            logger.info(f"Worker {worker} started job {job.id}")
+            try:
+                job.result = await self.handler(job.payload)
+                job.status = "succeeded"
+                self._stats["succeeded"] += 1
+            except asyncio.CancelledError:
+                job.status = "queued"
+                job.started_at = None
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.error = e
+                job.status = "failed"
+                self._stats["failed"] += 1
+            finally:
+                self._queue.task_done()
+            job.finished_at = time.time()
+            # Results are served to the client; the input is no longer needed
+            job.payload = None
+            
+    def _purge(self) -> None:
+        """Drop finished jobs older than the result TTL."""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self._stats["expired"] += len(expired)
+        
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, busy workers and job counts by status."""
+        self._purge()
+        by_status = {status: 0 for status in JOB_STATUSES}
+        for job in self._jobs.values():
+            by_status[job.status] += 1
+        return dict(
+            self._stats,
+            queue_depth=(self._queue.qsize() if self._queue is not None else 0) + len(self._deferred),
+            workers=self.workers,
+            running=by_status["running"],
+            retained=len(self._jobs),
+            by_status=by_status
+        )
@@ -0,0 +1,223 @@
+from collections import Counter
+from itertools import repeat
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import heapq
+import logging
+import math
+import threading
+from .terms import content_terms
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Okapi BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    """Terms of a text as the lexical index stores them: lowercased content words without possessives."""
+    return content_terms(text)
+
+def _compare(value: Any, condition: Any) -> bool:
+    """Evaluate one ChromaDB field condition, e.g. {"$lt": 3} or a plain value."""
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = value == operand
+        elif operator == "$ne":
+            ok = value != operand
+        elif operator == "$in":
+            ok = value in operand
+        elif operator == "$nin":
+            ok = value not in operand
+        elif value is None:
+            ok = False
+        elif operator == "$lt":
+            ok = value < operand
+        elif operator == "$lte":
+            ok = value <= operand
+        elif operator == "$gt":
+            ok = value > operand
+        elif operator == "$gte":
+            ok = value >= operand
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+def matches(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """Whether a document's metadata satisfies a ChromaDB where filter."""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif not _compare(metadata.get(key), condition):
+            return False
+    return True
+
+def empty_result() -> Dict[str, Any]:
+    """A single-query result with no matches, shaped like VectorStore.query's."""
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+class BM25Index:
+    def __init__(self):
+        """In-process Okapi BM25 index over one collection's documents.
+        
+        Postings map each term to the documents containing it and their term
+        frequency, so a query only scores documents sharing a term with it.
+        Exact names (a character, a prop, a location) rank the passages that
+        literally mention them first, with no embedding call.
+        """
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        
+    def __len__(self) -> int:
+        return len(self._documents)
+        
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._documents
+        
+    def add(
+        self,
+        ids: Iterable[str],
+        documents: Iterable[str],
+        metadatas: Iterable[Dict[str, Any]] = None
+    ) -> None:
+        """Add documents to the index; an existing ID is replaced.
+        
+        Args:
+            ids (Iterable[str]): Document IDs
+            documents (Iterable[str]): Document texts
+            metadatas (Iterable[Dict[str, Any]], optional): Metadata, for where filters
+        """
+        records = zip(ids, documents, metadatas if metadatas is not None else repeat(None))
+        with self._lock:
+            for doc_id, document, metadata in records:
+                self._remove(doc_id)
+                terms = Counter(tokenize(document or ""))
+                self._documents[doc_id] = document
+                self._metadatas[doc_id] = metadata or {}
+                self._terms[doc_id] = terms
+                self._lengths[doc_id] = sum(terms.values())
+                self._total_length += self._lengths[doc_id]
+                for term, frequency in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = frequency
+                    
+    def update_metadatas(self, ids: Iterable[str], metadatas: Iterable[Dict[str, Any]]) -> None:
+        """Replace the metadata of indexed documents; unknown IDs are ignored."""
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                if doc_id in self._metadatas:
+                    self._metadatas[doc_id] = metadata or {}
+                    
+    def remove(self, ids: Iterable[str]) -> None:
+        """Remove documents from the index; unknown IDs are ignored."""
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+                
+    def _remove(self, doc_id: str) -> None:
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return
+        del self._documents[doc_id]
+        del self._metadatas[doc_id]
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                
+    def search(self, query_text: str, n_results: int = 5, where: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Return the documents with the highest BM25 score for the query.
+        
+        Args:
+            query_text (str): Query text
+            n_results (int): Number of results to return
+            where (Dict[str, Any], optional): ChromaDB-style metadata filter
+        
+        Returns:
+            Dict[str, Any]: Single-query result shaped like VectorStore.query's;
+                distances are 1 / (1 + score), so lower is better
+        """
+        terms = set(tokenize(query_text))
+        with self._lock:
+            count = len(self._documents)
+            if not count or not terms:
+                return empty_result()
+            average_length = self._total_length / count
+            
+            scores: Dict[str, float] = {}
+            allowed: Dict[str, bool] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if where:
+                        if doc_id not in allowed:
+                            allowed[doc_id] = matches(self._metadatas[doc_id], where)
+                        if not allowed[doc_id]:
+                            continue
+                    norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / norm
+                    
+            top = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+            return {
+                "ids": [[doc_id for doc_id, _ in top]],
+                "documents": [[self._documents[doc_id] for doc_id, _ in top]],
+                "metadatas": [[self._metadatas[doc_id] for doc_id, _ in top]],
+                "distances": [[1.0 / (1.0 + score) for _, score in top]],
+            }
+
+def reciprocal_rank_fusion(results: List[Dict[str, Any]], n_results: int, k: int = 60) -> Dict[str, Any]:
+    """Fuse ranked single-query results with reciprocal rank fusion.
+    
+    Each document scores sum(1 / (k + rank)) over the rankings it appears
+    in, so one found by both the lexical and the vector search outranks
+    one found by either alone, without comparing BM25 scores to distances.
+    
+    Args:
+        results (List[Dict[str, Any]]): Single-query results, best match first
+        n_results (int): Number of fused results to return
+        k (int): Damping constant; larger values flatten the rank contributions
+    
+    Returns:
+        Dict[str, Any]: Single-query result; distances are 1 minus the fused
+            score relative to ranking first everywhere
+    """
+    fused: Dict[str, float] = {}
+    records: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    for result in results:
+        if not result.get("documents") or not result["documents"][0]:
+            continue
+        documents = result["documents"][0]
+        ids = (result.get("ids") or [None])[0] or documents
+        metadatas = (result.get("metadatas") or [None])[0] or [{}] * len(documents)
+        for rank, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas), start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+            records.setdefault(doc_id, (document, metadata))
+            
+    best = len(results) / (k + 1)
+    top = heapq.nlargest(n_results, fused.items(), key=lambda item: item[1])
+    return {
+        "ids": [[doc_id for doc_id, _ in top]],
+        "documents": [[records[doc_id][0] for doc_id, _ in top]],
+        "metadatas": [[records[doc_id][1] for doc_id, _ in top]],
+        "distances": [[1.0 - score / best for _, score in top]],
+    }
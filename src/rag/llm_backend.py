@@ -0,0 +1,247 @@
+from typing import Any, AsyncIterator, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from ..config.config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class LLMResponse:
+    def __init__(self, text: str):
+        """Response returned by a backend; mirrors the .text attribute of a Gemini response.
+        
+        Args:
+            text (str): Generated text
+        """
+        self.text = text
+
+class LLMBackend:
+    """Interface every analysis stage talks to instead of a concrete model client.
+    
+    Method names and return values follow google.generativeai.GenerativeModel,
+    so the analyzer (and tests that patch its model) work the same regardless
+    of which backend is configured.
+    """
+    
+    model_name = "unknown"
+    
+    def generate_content(self, prompt: str, json_output: bool = False) -> Any:
+        """Generate a response, blocking until it is complete.
+        
+        Args:
+            prompt (str): Fully rendered prompt
+            json_output (bool): Constrain the response to JSON (structured output)
+        
+        Returns:
+            Any: Response object with a .text attribute
+        """
+        raise NotImplementedError
+        
+    async def generate_content_async(self, prompt: str, stream: bool = False, json_output: bool = False) -> Any:
+        """Generate a response without blocking the event loop.
+        
+        Args:
+            prompt (str): Fully rendered prompt
+            stream (bool): Return an async iterator of partial responses instead
+            json_output (bool): Constrain the response to JSON (structured output)
+        
+        Returns:
+            Any: Response object with a .text attribute, or an async iterator of them
+        """
+        raise NotImplementedError
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, model_name: str = 'models/gemini-1.5-flash-latest', api_key: Optional[str] = None):
+        """Backend calling the Gemini API.
+        
+        The client is configured on first use, so importing the analyzer does
+        not require an API key; a missing key is reported by the first call.
+        
+        Args:
+            model_name (str): Gemini model to call
+            api_key (str, optional): API key; defaults to GEMINI_FLASH_API_KEY
+        """
+        self.model_name = model_name
+        self._api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+        
+    def _get_model(self):
+        """Configure the Gemini client and create the model on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    
+                    api_key = self._api_key or os.getenv("GEMINI_FLASH_API_KEY")
+                    if not api_key:
+                        raise ValueError("Gemini API key not found in environment variables.")
+                    genai.configure(api_key=api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+        
+    @staticmethod
+    def _options(stream: bool, json_output: bool) -> dict:
+        options = {}
+        if stream:
+            options["stream"] = True
+        if json_output:
+            options["generation_config"] = {"response_mime_type": "application/json"}
+        return options
+        
+    def generate_content(self, prompt: str, json_output: bool = False) -> Any:
+        return self._get_model().generate_content(prompt, **self._options(False, json_output))
+        
+    async def generate_content_async(self, prompt: str, stream: bool = False, json_output: bool = False) -> Any:
+        return await self._get_model().generate_content_async(prompt, **self._options(stream, json_output))
+
+# Canned responses of the fake backend, one per analysis stage
+FAKE_SYNTHESIS_TEXT = """FLAG: The beat does not yet land with enough emotional weight.
+
+EXPLAIN: Save the Cat expects this beat to change what the protagonist wants or believes; here the change is stated rather than felt, so the beat reads as plot mechanics.
+
+SUGGEST:
+- Show the protagonist's immediate reaction to the event
+- Tie the event to a want established in the Set-Up
+- Raise the cost of ignoring the event"""
+
+FAKE_ELEMENTS_TEXT = """- The protagonist
+- The inciting letter
+- The protagonist's routine"""
+
+FAKE_SETUP_TEXT = """The protagonist and their routine are established earlier in the outline. The inciting letter has no earlier setup; consider foreshadowing it in the Set-Up."""
+
+FAKE_FAST_TEXT = json.dumps({
+    "functional_analysis": "The beat disrupts the status quo and poses the question the protagonist must answer, but its stakes are only implied.",
+    "elements": ["The protagonist", "The inciting letter", "The protagonist's routine"],
+    "setup_analysis": "The inciting letter has no earlier setup; consider foreshadowing it in the Set-Up.",
+    "flag": "The beat does not yet land with enough emotional weight.",
+    "explanation": "Save the Cat expects this beat to change what the protagonist wants or believes; here the change is stated rather than felt.",
+    "suggestions": [
+        "Show the protagonist's immediate reaction to the event",
+        "Tie the event to a want established in the Set-Up",
+        "Raise the cost of ignoring the event"
+    ]
+})
+
+FAKE_ANALYSIS_TEXT = """The beat fulfils its structural role: it disrupts the status quo and poses a question the protagonist must answer. Its placement matches the Save the Cat page count, but its emotional impact depends on stakes that are only implied."""
+
+class FakeBackend(LLMBackend):
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        latency_jitter_ms: float = 50.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        stream_chunks: int = 4,
+        seed: Optional[int] = None
+    ):
+        """Offline backend returning canned text, for load tests and benchmarks.
+        
+        Each call sleeps for a latency drawn from a normal distribution and may
+        fail with an injected server error or a 429 quota error, so the real
+        pipeline code can be exercised without network access.
+        
+        Args:
+            latency_ms (float): Mean simulated latency per call
+            latency_jitter_ms (float): Standard deviation of the latency
+            error_rate (float): Probability of an injected 500 error per call
+            rate_limit_rate (float): Probability of an injected 429 error per call
+            stream_chunks (int): Number of chunks a streamed response is split into
+            seed (int, optional): Seed for reproducible latencies and failures
+        """
+        self.model_name = "fake"
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.stream_chunks = max(stream_chunks, 1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        
+    def _draw(self):
+        """Draw the latency and outcome of one call."""
+        with self._lock:
+            self.calls += 1
+            latency = max(self._random.gauss(self.latency_ms, self.latency_jitter_ms), 0.0) / 1000
+            outcome = self._random.random()
+        return latency, outcome
+        
+    def _respond(self, prompt: str, outcome: float) -> LLMResponse:
+        """Raise the injected failure, if any, or return the canned text for the prompt."""
+        if outcome < self.rate_limit_rate:
+            raise Exception("429 Resource has been exhausted (e.g. check quota). Injected by fake backend.")
+        if outcome < self.rate_limit_rate + self.error_rate:
+            raise Exception("500 An internal error has occurred. Injected by fake backend.")
+        return LLMResponse(self.canned_text(prompt))
+        
+    @staticmethod
+    def canned_text(prompt: str) -> str:
+        """Pick the canned response matching the stage that built the prompt."""
+        if "single JSON object" in prompt:
+            return FAKE_FAST_TEXT
+        if "FLAG, EXPLAIN, SUGGEST" in prompt:
+            return FAKE_SYNTHESIS_TEXT
+        if "bullet point list" in prompt:
+            return FAKE_ELEMENTS_TEXT
+        if "properly set up" in prompt:
+            return FAKE_SETUP_TEXT
+        # Vary the functional analysis slightly so distinct prompts give distinct answers
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"{FAKE_ANALYSIS_TEXT} (ref {digest})"
+        
+    def generate_content(self, prompt: str, json_output: bool = False) -> LLMResponse:
+        latency, outcome = self._draw()
+        time.sleep(latency)
+        return self._respond(prompt, outcome)
+        
+    async def generate_content_async(self, prompt: str, stream: bool = False, json_output: bool = False) -> Any:
+        latency, outcome = self._draw()
+        if not stream:
+            await asyncio.sleep(latency)
+            return self._respond(prompt, outcome)
+            
+        # Time to first chunk is half the latency; the rest is spread over the chunks
+        await asyncio.sleep(latency / 2)
+        text = self._respond(prompt, outcome).text
+        return self._stream(text, latency / 2)
+        
+    async def _stream(self, text: str, duration: float) -> AsyncIterator[LLMResponse]:
+        """Yield the text in roughly equal chunks spread over the given duration."""
+        size = -(-len(text) // self.stream_chunks)
+        for start in range(0, len(text), size):
+            yield LLMResponse(text[start:start + size])
+            await asyncio.sleep(duration / self.stream_chunks)
+
+LLM_BACKENDS = ("gemini", "fake")
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Create the configured LLM backend.
+    
+    Args:
+        name (str, optional): "gemini" or "fake"; defaults to Config.LLM_BACKEND
+    
+    Returns:
+        LLMBackend: Backend instance
+    """
+    name = (name or Config.LLM_BACKEND).lower()
+    if name == "gemini":
+        return GeminiBackend(model_name=Config.GEMINI_MODEL_NAME)
+    if name == "fake":
+        logger.warning("Using the fake LLM backend; analyses return canned text")
+        return FakeBackend(
+            latency_ms=Config.FAKE_LLM_LATENCY_MS,
+            latency_jitter_ms=Config.FAKE_LLM_LATENCY_JITTER_MS,
+            error_rate=Config.FAKE_LLM_ERROR_RATE,
+            rate_limit_rate=Config.FAKE_LLM_RATE_LIMIT_RATE,
+            seed=Config.FAKE_LLM_SEED
+        )
+    raise ValueError(f"Unknown LLM backend: {name}. Expected one of {', '.join(LLM_BACKENDS)}")
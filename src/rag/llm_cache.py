@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class CachedResponse:
+    def __init__(self, text: str):
+        """Minimal stand-in for a Gemini response served from the cache.
+        
+        Args:
+            text (str): Cached response text
+        """
+        self.text = text
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_memory_entries: int = 512,
+        max_disk_bytes: int = 100 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        """Two-tier cache for LLM responses: an in-memory LRU in front of SQLite.
+        
+        Entries are content-addressed (see make_key), so an unchanged prompt
+        always maps to the same entry and a changed template never does.
+        
+        Args:
+            path (str, optional): SQLite file for the disk tier; None keeps the
+                cache in memory only
+            max_memory_entries (int): Maximum number of entries in the LRU tier
+            max_disk_bytes (int): Maximum total size of cached text on disk;
+                least recently used entries are evicted past this size
+            ttl_seconds (float): Entries older than this are treated as missing
+        """
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        # Access times of disk entries read since the last write, flushed with
+        # the next write instead of committing an UPDATE on every hit
+        self._touched: Dict[str, float] = {}
+        # Running size of the disk tier, so a write does not SUM the table
+        self._disk_bytes = 0
+        
+        self._conn = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at)")
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            
+    @property
+    def persistent(self) -> bool:
+        """Whether the cache has a disk tier, i.e. lookups and writes may do file I/O."""
+        return self._conn is not None
+            
+    @staticmethod
+    def make_key(model_name: str, template_version: str, prompt: str) -> str:
+        """Build the content hash identifying a model call.
+        
+        Args:
+            model_name (str): Name of the model the prompt is sent to
+            template_version (str): Identifier of the prompt template and its version
+            prompt (str): Fully rendered prompt
+        
+        Returns:
+            str: Hex digest used as the cache key
+        """
+        digest = hashlib.sha256()
+        for part in (model_name, template_version, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+        
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response text.
+        
+        Args:
+            key (str): Cache key from make_key
+        
+        Returns:
+            Optional[str]: Cached text, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    if self._conn is not None:
+                        self._touched[key] = now
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, size, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, size, created_at = row
+                    if now - created_at <= self.ttl_seconds:
+                        self._touched[key] = now
+                        self._remember(key, value, created_at)
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._disk_bytes -= size
+                    
+            self._stats["misses"] += 1
+            return None
+            
+    def set(self, key: str, value: str) -> None:
+        """Store a response text in both tiers.
+        
+        Args:
+            key (str): Cache key from make_key
+            value (str): Response text to cache
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._stats["writes"] += 1
+            
+            if self._conn is not None:
+                size = len(value.encode("utf-8"))
+                replaced = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._disk_bytes += size - (replaced[0] if replaced else 0)
+                self._touched.pop(key, None)
+                self._flush_touched()
+                self._evict_disk(now)
+                self._conn.commit()
+                
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        """Insert into the LRU tier, evicting the least recently used entry when full."""
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+            
+    def _flush_touched(self) -> None:
+        """Write the access times recorded by get, so eviction sees recent reads."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+            
+    def _evict_disk(self, now: float) -> None:
+        """Drop expired entries, then the least recently used ones until under the size limit."""
+        cutoff = now - self.ttl_seconds
+        expired, expired_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?", (cutoff,)
+        ).fetchone()
+        if expired:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+            self._disk_bytes -= expired_bytes
+            self._stats["evictions"] += expired
+            
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+            
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall():
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk_bytes -= size
+            self._stats["evictions"] += 1
+            
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current tier sizes.
+        
+        Returns:
+            Dict[str, Any]: Counters plus hit_ratio, memory_entries, disk_entries
+                and disk_bytes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = (
+                self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                if self._conn is not None else 0
+            )
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+        
+    def clear(self) -> None:
+        """Remove every entry from both tiers and reset the counters."""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+                self._disk_bytes = 0
+            for name in self._stats:
+                self._stats[name] = 0
@@ -0,0 +1,392 @@
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import random
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Return True for provider errors that mean the quota or rate limit was hit."""
+    error_msg = str(error).lower()
+    return "429" in error_msg or "quota" in error_msg or "resource has been exhausted" in error_msg
+
+class SchedulerOverloadedError(Exception):
+    """Raised when a model call cannot be admitted: the wait queue is full or the wait timed out.
+    
+    The message starts with "Rate limit exceeded" so the API reports it as a 429.
+    """
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        """Token bucket limiting the sustained request rate while allowing short bursts.
+        
+        Args:
+            rate_per_second (float): Tokens added per second (the sustained rate)
+            capacity (float): Maximum number of stored tokens (the burst size)
+        """
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+        
+    def reserve(self) -> float:
+        """Take one token, returning how long the caller must wait before using it.
+        
+        Tokens may be reserved ahead of time, so concurrent callers are spaced
+        out in arrival order instead of all retrying at once.
+        
+        Returns:
+            float: Seconds to wait; 0 when a token was available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_second
+            
+    def available(self) -> float:
+        """Return the number of tokens currently available (negative when reserved ahead)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """A caller queued for a concurrency slot, woken from whichever thread releases one."""
+        self.granted = False
+        self._loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        
+    def wake(self) -> None:
+        """Hand the slot to this waiter; called with the scheduler lock held."""
+        self.granted = True
+        if self.future is not None:
+            self._loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+            
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+class LLMScheduler:
+    def __init__(
+        self,
+        requests_per_minute: float = 300,
+        burst: int = 20,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        max_queue: int = 100,
+        queue_timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        decrease_cooldown: float = 1.0
+    ):
+        """Central admission control for model calls.
+        
+        Every call waits for a concurrency slot (bounded FIFO queue), then for a
+        token from a bucket sized to the provider quota. A 429 releases the
+        slot, halves the concurrency limit (at most once per cooldown, so a
+        burst of 429s from calls already in flight counts once) and retries
+        after a jittered exponential backoff. Each success grows the limit
+        back by roughly one slot per round trip (AIMD).
+        
+        Args:
+            requests_per_minute (float): Sustained request rate allowed by the quota
+            burst (int): Requests that may be sent back to back before the rate applies
+            max_concurrency (int): Upper bound of the adaptive concurrency limit
+            min_concurrency (int): Lower bound of the adaptive concurrency limit
+            max_queue (int): Callers allowed to wait for a slot; more are rejected
+            queue_timeout (float): Maximum seconds a caller waits for a slot
+            max_retries (int): Retries of a call that keeps failing with 429
+            backoff_base (float): Backoff cap for the first retry, doubled per retry
+            backoff_max (float): Maximum backoff cap in seconds
+            decrease_cooldown (float): Minimum seconds between two limit decreases
+        """
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(min_concurrency, 1)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.decrease_cooldown = decrease_cooldown
+        
+        self._lock = threading.Lock()
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._last_decrease = 0.0
+        self._random = random.Random()
+        self._stats = {
+            "calls": 0,
+            "completed": 0,
+            "failed": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "rejected": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+        
+    def _try_admit(self) -> bool:
+        """Take a slot if one is free and nobody is queued ahead; lock held."""
+        if not self._waiters and self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+        
+    def _enqueue(self, loop: Optional[asyncio.AbstractEventLoop]) -> _Waiter:
+        """Queue a waiter, rejecting it when the queue is full; lock held."""
+        if len(self._waiters) >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise SchedulerOverloadedError(
+                f"Rate limit exceeded: {len(self._waiters)} model calls already waiting"
+            )
+        waiter = _Waiter(loop)
+        self._waiters.append(waiter)
+        return waiter
+        
+    def _wake_waiters(self) -> None:
+        """Hand free slots to queued waiters in arrival order; lock held."""
+        while self._waiters and self._in_flight < int(self._limit):
+            self._in_flight += 1
+            self._waiters.popleft().wake()
+            
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Give up waiting; returns True if the slot was granted in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._stats["rejected"] += 1
+            return False
+            
+    def _timeout_error(self) -> SchedulerOverloadedError:
+        return SchedulerOverloadedError(
+            f"Rate limit exceeded: no model call slot freed within {self.queue_timeout}s"
+        )
+        
+    def _acquire(self) -> float:
+        """Block until a slot is free; returns the seconds spent waiting."""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_admit():
+                return 0.0
+            waiter = self._enqueue(None)
+        waiter.event.wait(self.queue_timeout)
+        if not waiter.granted and not self._abandon(waiter):
+            raise self._timeout_error()
+        return time.monotonic() - start
+        
+    async def _acquire_async(self) -> float:
+        """Wait for a slot without blocking the event loop; returns the seconds spent waiting."""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_admit():
+                return 0.0
+            waiter = self._enqueue(asyncio.get_running_loop())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise self._timeout_error()
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self._release()
+            raise
+        return time.monotonic() - start
+        
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._wake_waiters()
+            
+    def _on_success(self) -> None:
+        with self._lock:
+            self._stats["completed"] += 1
+            # Additive increase: about one extra slot per limit's worth of successes
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+            self._wake_waiters()
+            
+    def _on_rate_limited(self) -> None:
+        with self._lock:
+            self._stats["rate_limited"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_cooldown:
+                previous = self._limit
+                self._limit = max(float(self.min_concurrency), self._limit / 2)
+                self._last_decrease = now
+                logger.warning(f"Rate limited; concurrency limit {previous:.1f} -> {self._limit:.1f}")
+                
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt."""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return self._random.uniform(0, cap)
+        
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["wait_seconds_total"] += seconds
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], seconds)
+            
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """Account for a failed call and decide whether to retry it."""
+        if not is_rate_limit_error(error):
+            with self._lock:
+                self._stats["failed"] += 1
+            return False
+        self._on_rate_limited()
+        if attempt >= self.max_retries:
+            with self._lock:
+                self._stats["failed"] += 1
+            return False
+        with self._lock:
+            self._stats["retries"] += 1
+        return True
+        
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking model call under the scheduler.
+        
+        Args:
+            func (Callable): Model call, e.g. backend.generate_content
+            *args, **kwargs: Passed to func
+        
+        Returns:
+            Any: The call's result
+        """
+        attempt = 0
+        while True:
+            waited = self._acquire()
+            delay = self.bucket.reserve()
+            if delay:
+                time.sleep(delay)
+            self._record_wait(waited + delay)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._release()
+                if not self._should_retry(e, attempt):
+                    raise
+                backoff = self._backoff(attempt)
+                attempt += 1
+                logger.info(f"Retrying rate-limited model call in {backoff:.2f}s (attempt {attempt})")
+                time.sleep(backoff)
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+            self._on_success()
+            return result
+            
+    async def call_async(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Async variant of call for coroutine model calls.
+        
+        Args:
+            func (Callable): Coroutine function, e.g. backend.generate_content_async
+            *args, **kwargs: Passed to func
+        
+        Returns:
+            Any: The awaited result
+        """
+        attempt = 0
+        while True:
+            waited = await self._acquire_async()
+            try:
+                delay = self.bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                self._record_wait(waited + delay)
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                self._release()
+                if not self._should_retry(e, attempt):
+                    raise
+                backoff = self._backoff(attempt)
+                attempt += 1
+                logger.info(f"Retrying rate-limited model call in {backoff:.2f}s (attempt {attempt})")
+                await asyncio.sleep(backoff)
+                continue
+            except BaseException:
+                # Cancelled while holding a slot
+                self._release()
+                raise
+            self._release()
+            self._on_success()
+            return result
+            
+    async def stream_async(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """Run a streaming model call under the scheduler, yielding its chunks.
+        
+        The concurrency slot is held until the stream is drained, fails or is
+        closed by the consumer, so streamed calls count against the limit for as
+        long as they run. A 429 before the first chunk is retried like in
+        call_async; a 429 after it still shrinks the limit but is raised, since
+        a retry would repeat chunks the consumer already has.
+        
+        Args:
+            func (Callable): Coroutine function returning an async iterator,
+                e.g. backend.generate_content_async with stream=True
+            *args, **kwargs: Passed to func
+        
+        Yields:
+            Any: The stream's chunks
+        """
+        attempt = 0
+        while True:
+            waited = await self._acquire_async()
+            started = False
+            try:
+                delay = self.bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                self._record_wait(waited + delay)
+                stream = await func(*args, **kwargs)
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._release()
+                if not self._should_retry(e, self.max_retries if started else attempt):
+                    raise
+                backoff = self._backoff(attempt)
+                attempt += 1
+                logger.info(f"Retrying rate-limited model stream in {backoff:.2f}s (attempt {attempt})")
+                await asyncio.sleep(backoff)
+                continue
+            except BaseException:
+                # Cancelled, or closed by the consumer before the end of the stream
+                self._release()
+                raise
+            self._release()
+            self._on_success()
+            return
+            
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, concurrency and wait-time metrics.
+        
+        Returns:
+            Dict[str, Any]: Counters plus queue_depth, in_flight,
+                concurrency_limit, tokens_available and wait_seconds_avg
+        """
+        tokens = self.bucket.available()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._waiters)
+            stats["in_flight"] = self._in_flight
+            stats["concurrency_limit"] = round(self._limit, 2)
+        stats["tokens_available"] = round(tokens, 2)
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
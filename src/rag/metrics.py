@@ -0,0 +1,222 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import logging
+import math
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a local lookup (sub-millisecond) to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# A collected sample: metric name, type, help text, labels and value
+Sample = Tuple[str, str, str, Dict[str, Any], float]
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames) or not all(name in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+        
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+        
+    def collect(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Return the (sample name, labels, value) lines of the metric."""
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. model calls by status."""
+    kind = "counter"
+    
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+    
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+            
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+        
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, e.g. stage latency."""
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        # One bisect and three additions under the lock; cumulative counts are built at scrape time
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+            
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the with block, including when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+            
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+            
+    def collect(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            snapshot = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        lines = []
+        for key, counts, total, observations in snapshot:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            lines.append((f"{self.name}_sum", labels, total))
+            lines.append((f"{self.name}_count", labels, observations))
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        """Metrics of the process, rendered in the Prometheus text format.
+        
+        Counters, gauges and histograms are updated where things happen;
+        collectors read values that other components already track (cache
+        and scheduler stats) only when the metrics are scraped.
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+        
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-imported modules get the already registered metric
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+            
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+        
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+        
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+        
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Register a callable returning samples computed at scrape time.
+        
+        Args:
+            collector (Callable): Returns (name, type, help, labels, value) samples
+        """
+        with self._lock:
+            self._collectors.append(collector)
+            
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+            
+        families: Dict[str, Tuple[str, str, List[Tuple[str, Dict[str, Any], float]]]] = {}
+        for metric in metrics:
+            families[metric.name] = (metric.kind, metric.documentation, metric.collect())
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                # A failing collector must not take the other metrics down with it
+                logger.error(f"Metrics collector {collector!r} failed: {str(e)}")
+                continue
+            for name, kind, documentation, labels, value in samples:
+                families.setdefault(name, (kind, documentation, []))[2].append((name, labels, value))
+                
+        lines = []
+        for name, (kind, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {_escape(documentation)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry served by the /metrics endpoint
+registry = MetricsRegistry()
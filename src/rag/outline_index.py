@@ -0,0 +1,139 @@
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import re
+from .terms import TERM_PATTERN, content_terms, normalize_term
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+def element_terms(element: str) -> List[str]:
+    """Content words of an element, normalized the way the index stores them.
+    
+    Args:
+        element (str): Element as listed by identify_elements, e.g. "The protagonist's routine"
+    
+    Returns:
+        List[str]: Lowercased words without stopwords or possessives
+    """
+    return content_terms(element)
+
+def _find_passage(text: str, passage: str, unique: bool = False) -> Optional[int]:
+    """Return the offset of a passage in a text, allowing any whitespace between its words.
+    
+    With unique, a passage found more than once is treated as not found.
+    """
+    words = passage.split()
+    if not words:
+        return None
+    matches = re.finditer(r"\s+".join(map(re.escape, words)), text)
+    first = next(matches, None)
+    if first is None or (unique and next(matches, None) is not None):
+        return None
+    return first.start()
+
+def locate_beat(outline: str, beat: str) -> Optional[int]:
+    """Return the character offset of the beat in the outline, or None if it is not part of it.
+    
+    Whitespace differences are tolerated, so the beat is also found in the
+    flattened outline. When the whole beat is not found, its first line is
+    looked up, which still places a beat whose later lines differ from the
+    outline; a first line the outline repeats (a slug line, a character
+    name) could be an earlier occurrence, so it must occur exactly once.
+    """
+    offset = _find_passage(outline, beat)
+    if offset is not None:
+        return offset
+    lines = beat.strip().splitlines()
+    return _find_passage(outline, lines[0], unique=True) if lines else None
+
+def outline_through_beat(outline: str, beat: str) -> str:
+    """Return the outline up to the end of the beat, the only part a setup check needs.
+    
+    The whole outline is returned when the beat is not part of it.
+    """
+    offset = locate_beat(outline, beat)
+    if offset is None:
+        return outline
+    beat = beat.strip()
+    beat_end = offset + len(beat) if outline.startswith(beat, offset) else offset
+    paragraph_break = _PARAGRAPH_BREAK.search(outline, beat_end)
+    return outline[:paragraph_break.start()] if paragraph_break else outline
+
+class OutlineIndex:
+    def __init__(self, outline: str):
+        """Inverted index from each term of an outline to where it is mentioned.
+        
+        Built in a single pass over the outline: every term maps to its
+        (paragraph, character offset) postings in outline order, so whether
+        an element is mentioned before a beat is a lookup, not a model call.
+        
+        Args:
+            outline (str): The full screenplay outline
+        """
+        self.outline = outline
+        # Start offsets of the paragraphs, for mapping a character offset to its paragraph
+        self.paragraph_starts = [0] + [match.end() for match in _PARAGRAPH_BREAK.finditer(outline)]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        
+        for match in TERM_PATTERN.finditer(outline):
+            offset = match.start()
+            paragraph = bisect_right(self.paragraph_starts, offset) - 1
+            self.postings.setdefault(normalize_term(match.group(0)), []).append((paragraph, offset))
+            
+    def paragraph_of(self, offset: int) -> int:
+        """Return the index of the paragraph containing a character offset."""
+        return bisect_right(self.paragraph_starts, offset) - 1
+        
+    def locate(self, beat: str) -> Optional[int]:
+        """Return the character offset of the beat in the outline, or None if it is not part of it."""
+        return locate_beat(self.outline, beat)
+        
+    def mentions(self, element: str, before: Optional[int] = None) -> Dict[str, Any]:
+        """Find where an element is mentioned, optionally only before an offset.
+        
+        An element is mentioned in a paragraph when all of its content words
+        occur in that paragraph; paragraphs holding only some of them are
+        reported as partial mentions.
+        
+        Args:
+            element (str): Element text
+            before (int, optional): Only count mentions starting before this offset
+        
+        Returns:
+            Dict with the element's terms, "paragraphs" (full mentions) and
+            "partial" (paragraphs with some of the terms), each a list of
+            {"paragraph", "offset"} in outline order
+        """
+        terms = element_terms(element)
+        found: Dict[int, Dict[str, int]] = {}
+        for term in terms:
+            for paragraph, offset in self.postings.get(term, ()):
+                if before is not None and offset >= before:
+                    break
+                found.setdefault(paragraph, {}).setdefault(term, offset)
+                
+        full, partial = [], []
+        for paragraph in sorted(found):
+            mention = {"paragraph": paragraph, "offset": min(found[paragraph].values())}
+            (full if len(found[paragraph]) == len(set(terms)) else partial).append(mention)
+        return {"terms": terms, "paragraphs": full, "partial": partial}
+        
+    def snippet(self, offset: int, width: int = 120) -> str:
+        """Return the text around an offset, for quoting a mention as evidence."""
+        paragraph = self.paragraph_of(offset)
+        start = max(offset - width // 4, self.paragraph_starts[paragraph])
+        end = len(self.outline)
+        if paragraph + 1 < len(self.paragraph_starts):
+            end = self.paragraph_starts[paragraph + 1]
+        return " ".join(self.outline[start:min(start + width, end)].split())
+
+@lru_cache(maxsize=32)
+def get_outline_index(outline: str) -> OutlineIndex:
+    """Return the index of an outline, building it once and reusing it for every beat of that outline."""
+    index = OutlineIndex(outline)
+    logger.info(f"Indexed outline: {len(index.postings)} terms in {len(index.paragraph_starts)} paragraphs")
+    return index
@@ -0,0 +1,460 @@
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from .vector_store import VectorStore, IN_MEMORY
+from ..config.config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# "shared" keeps every outline's chunks in one collection keyed by outline_id
+# metadata; "per_outline" is the legacy collection-per-outline layout
+OUTLINE_STORAGE_MODES = ("shared", "per_outline")
+LEGACY_PREFIX = "outline_"
+
+# "memory" keeps outline indexes in an in-process ChromaDB client (no disk I/O,
+# gone on restart); "persistent" writes them next to the framework collection
+OUTLINE_STORES = ("memory", "persistent")
+
+def outline_vector_store() -> VectorStore:
+    """Return the VectorStore outline indexes are kept in, per OUTLINE_STORE.
+    
+    The framework collection is read-mostly and always stays on disk; outline
+    chunks only matter while their outline is being analyzed.
+    """
+    if Config.OUTLINE_STORE not in OUTLINE_STORES:
+        raise ValueError(f"Unknown outline store: {Config.OUTLINE_STORE}. Expected one of {OUTLINE_STORES}")
+    if Config.OUTLINE_STORE == "memory":
+        return VectorStore(IN_MEMORY)
+    return VectorStore()
+
+def _storage_mode() -> str:
+    mode = Config.OUTLINE_STORAGE_MODE
+    if mode not in OUTLINE_STORAGE_MODES:
+        raise ValueError(f"Unknown outline storage mode: {mode}. Expected one of {OUTLINE_STORAGE_MODES}")
+    return mode
+
+def outline_content_id(outline: str) -> str:
+    """Return the ID of an outline: a hash of its text with whitespace normalized.
+    
+    Resubmitting the same outline with different indentation, runs of spaces
+    or surrounding blank lines yields the same ID and so reuses its index.
+    Line breaks are kept, so re-wrapping an outline changes its ID.
+    """
+    normalized = "\n".join(" ".join(line.split()) for line in outline.strip().splitlines())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+def flatten_text(text: str) -> str:
+    """Collapse every run of whitespace to one space.
+    
+    Chunk and beat offsets are positions in the flattened outline: every
+    outline with the same ID flattens to the same text, so offsets stored
+    at indexing time hold for any resubmission of it.
+    """
+    return " ".join(text.split())
+
+def chunk_offsets(outline: str, chunks: List[str]) -> List[Optional[Tuple[int, int]]]:
+    """Return the (start, end) offsets of each chunk in the flattened outline.
+    
+    Chunks are searched for in order, each from just after the previous
+    chunk's start, so repeated passages are attributed to the right place.
+    
+    Args:
+        outline (str): The full outline text
+        chunks (List[str]): Its chunks in outline order
+    
+    Returns:
+        List of (start, end) offsets, None for a chunk that is not part of the outline
+    """
+    flat = flatten_text(outline)
+    offsets: List[Optional[Tuple[int, int]]] = []
+    search_from = 0
+    for chunk in chunks:
+        flat_chunk = flatten_text(chunk)
+        start = flat.find(flat_chunk, search_from) if flat_chunk else -1
+        if start < 0:
+            offsets.append(None)
+            continue
+        offsets.append((start, start + len(flat_chunk)))
+        search_from = start + 1
+    return offsets
+
+def trim_to_offset(text: str, start: int, offset: int) -> str:
+    """Cut a chunk at an offset in the flattened outline, keeping the chunk's own whitespace.
+    
+    Args:
+        text (str): Chunk text
+        start (int): Offset of the chunk in the flattened outline (its start metadata)
+        offset (int): Flattened offset to cut at, e.g. where a beat starts
+    
+    Returns:
+        str: The part of the chunk before the offset
+    """
+    length = offset - start
+    used = 0
+    for match in re.finditer(r"\S+", text):
+        if used:
+            # The single space flatten_text puts between two words
+            used += 1
+        if used >= length:
+            return text[:match.start()].rstrip()
+        if used + len(match.group(0)) >= length:
+            return text[:match.start() + length - used]
+        used += len(match.group(0))
+    return text
+
+def has_offsets(found: Dict[str, Any]) -> bool:
+    """Whether an indexed outline (from find_outline) was stored with chunk offsets."""
+    return any("end" in (metadata or {}) for metadata in found["metadatas"])
+
+def outline_collection(outline_id: str) -> str:
+    """Return the name of the collection holding an outline's chunks."""
+    if _storage_mode() == "shared":
+        return Config.OUTLINES_COLLECTION
+    return f"{LEGACY_PREFIX}{outline_id}"
+
+def outline_filter(outline_id: str, where: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Return the metadata filter selecting an outline's chunks, combined with an optional condition.
+    
+    Args:
+        outline_id (str): ID of the outline
+        where (Dict[str, Any], optional): Extra ChromaDB filter, e.g. on chunk_index
+    
+    Returns:
+        Dict[str, Any]: Filter for VectorStore.query, or None when nothing needs filtering
+    """
+    if _storage_mode() == "per_outline":
+        return where
+    if where is None:
+        return {"outline_id": outline_id}
+    return {"$and": [{"outline_id": outline_id}, where]}
+
+def store_outline_chunks(
+    vector_store,
+    outline_id: str,
+    chunks: List[str],
+    offsets: List[Optional[Tuple[int, int]]] = None
+) -> str:
+    """Index an outline's chunks under the configured storage mode.
+    
+    Args:
+        vector_store: VectorStore to write to
+        outline_id (str): ID of the outline
+        chunks (List[str]): Outline chunks in outline order
+        offsets (List[Optional[Tuple[int, int]]], optional): Offsets of the
+            chunks from chunk_offsets, stored as start/end metadata
+    
+    Returns:
+        str: Name of the collection the chunks were added to
+    """
+    collection_name = outline_collection(outline_id)
+    if _storage_mode() == "shared":
+        vector_store.get_or_create_collection(
+            name=collection_name,
+            metadata={"type": "screenplay_outlines"}
+        )
+    else:
+        vector_store.create_collection(
+            name=collection_name,
+            metadata={"type": "screenplay_outline", "id": outline_id}
+        )
+        
+    indexed_at = time.time()
+    metadatas = []
+    for i in range(len(chunks)):
+        metadata = {"chunk_index": i, "outline_id": outline_id, "indexed_at": indexed_at, "last_used_at": indexed_at}
+        if offsets and offsets[i] is not None:
+            metadata["start"], metadata["end"] = offsets[i]
+        metadatas.append(metadata)
+        
+    vector_store.add_documents(
+        collection_name=collection_name,
+        documents=chunks,
+        ids=[f"{outline_id}_chunk_{i}" for i in range(len(chunks))],
+        metadatas=metadatas
+    )
+    return collection_name
+
+def find_outline(vector_store, outline_id: str) -> Optional[Dict[str, Any]]:
+    """Look up an indexed outline.
+    
+    Args:
+        vector_store: VectorStore holding the outline indexes
+        outline_id (str): ID of the outline
+    
+    Returns:
+        Dict with the outline's chunk ids and metadatas and when it was last
+        used, or None when the outline is not indexed
+    """
+    try:
+        collection = vector_store.get_collection(outline_collection(outline_id))
+    except Exception:
+        return None
+    records = collection.get(where=outline_filter(outline_id), include=["metadatas"])
+    if not records["ids"]:
+        return None
+    return {
+        "ids": records["ids"],
+        "metadatas": records["metadatas"],
+        "last_used_at": min((metadata or {}).get("last_used_at", 0.0) for metadata in records["metadatas"]),
+    }
+
+def touch_outline(vector_store, outline_id: str, found: Dict[str, Any], min_interval: float = 0.0) -> bool:
+    """Mark an outline as used now, so the sweeper keeps it.
+    
+    Rewriting the metadata of every chunk on every use would cost more than
+    the lookup it saves, so it is skipped when the outline was marked within
+    the last min_interval seconds.
+    
+    Args:
+        vector_store: VectorStore holding the outline indexes
+        outline_id (str): ID of the outline
+        found (Dict[str, Any]): Result of find_outline
+        min_interval (float): Seconds within which a previous mark is left as is
+    
+    Returns:
+        bool: True if the outline's chunks were updated
+    """
+    now = time.time()
+    if now - found["last_used_at"] < min_interval:
+        return False
+    vector_store.update_metadatas(
+        outline_collection(outline_id),
+        found["ids"],
+        [dict(metadata or {}, last_used_at=now) for metadata in found["metadatas"]]
+    )
+    return True
+
+def _directory_size(path: str) -> int:
+    """Total size in bytes of the files under a directory."""
+    if path == IN_MEMORY:
+        return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Files can disappear while ChromaDB compacts
+                pass
+    return total
+
+def sweep_outline_indexes(vector_store, ttl_seconds: float, now: float = None) -> Dict[str, Any]:
+    """Delete outline indexes that have not been used for ttl_seconds.
+    
+    In the shared collection the expired chunks are deleted by their
+    last_used_at metadata, which every write and migration stamps; in the
+    per-outline layout whole collections are dropped, and ones without
+    last_used_at count as expired. ChromaDB's SQLite file reuses freed pages instead of shrinking,
+    so disk_bytes_reclaimed can be smaller than freed_bytes (documents plus
+    embeddings removed) while still keeping disk growth bounded.
+    
+    Args:
+        vector_store: VectorStore holding the outline indexes
+        ttl_seconds (float): Idle time after which an outline index is deleted
+        now (float, optional): Current time, for tests
+    
+    Returns:
+        Dict[str, Any]: Outlines and chunks deleted, freed_bytes and disk_bytes_reclaimed
+    """
+    now = time.time() if now is None else now
+    cutoff = now - ttl_seconds
+    report = {"outlines_deleted": 0, "chunks_deleted": 0, "freed_bytes": 0, "disk_bytes_reclaimed": 0}
+    disk_before = _directory_size(vector_store.persist_directory)
+    
+    if _storage_mode() == "shared":
+        try:
+            collection = vector_store.get_collection(Config.OUTLINES_COLLECTION)
+        except Exception:
+            # Nothing has been indexed yet
+            return report
+        expired = collection.get(
+            where={"last_used_at": {"$lt": cutoff}},
+            include=["documents", "metadatas", "embeddings"]
+        )
+        if expired["ids"]:
+            vector_store.delete_documents(Config.OUTLINES_COLLECTION, expired["ids"])
+            report["outlines_deleted"] = len({metadata["outline_id"] for metadata in expired["metadatas"]})
+            report["chunks_deleted"] = len(expired["ids"])
+            report["freed_bytes"] = sum(len(document.encode("utf-8")) for document in expired["documents"]) + sum(
+                4 * len(embedding) for embedding in expired["embeddings"]
+            )
+    else:
+        for name in vector_store.list_collections():
+            if not name.startswith(LEGACY_PREFIX):
+                continue
+            records = vector_store.get_collection(name).get(include=["documents", "metadatas", "embeddings"])
+            # Collections indexed before last_used_at was recorded count as expired
+            last_used_at = max([(metadata or {}).get("last_used_at", 0.0) for metadata in records["metadatas"]] or [0.0])
+            if last_used_at >= cutoff:
+                continue
+            vector_store.delete_collection(name)
+            report["outlines_deleted"] += 1
+            report["chunks_deleted"] += len(records["ids"])
+            report["freed_bytes"] += sum(len(document.encode("utf-8")) for document in records["documents"]) + sum(
+                4 * len(embedding) for embedding in records["embeddings"]
+            )
+            
+    report["disk_bytes_reclaimed"] = max(disk_before - _directory_size(vector_store.persist_directory), 0)
+    logger.info(
+        f"Swept {report['outlines_deleted']} outline indexes unused for {ttl_seconds:.0f}s "
+        f"({report['chunks_deleted']} chunks, ~{report['freed_bytes']} bytes freed, "
+        f"{report['disk_bytes_reclaimed']} bytes of disk reclaimed)"
+    )
+    return report
+
+class OutlineIndexSweeper:
+    def __init__(self, vector_store_factory, ttl_seconds: float, interval_seconds: float):
+        """Periodically deletes outline indexes unused for longer than ttl_seconds.
+        
+        Runs on the event loop and does the ChromaDB work on a worker thread.
+        
+        Args:
+            vector_store_factory (Callable): Returns the VectorStore to sweep
+            ttl_seconds (float): Idle time after which an outline index is deleted
+            interval_seconds (float): Seconds between sweeps
+        """
+        self.vector_store_factory = vector_store_factory
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "sweeps": 0,
+            "failures": 0,
+            "outlines_deleted": 0,
+            "chunks_deleted": 0,
+            "freed_bytes": 0,
+            "disk_bytes_reclaimed": 0,
+        }
+        self.last_report: Optional[Dict[str, Any]] = None
+        
+    def start(self) -> None:
+        """Start sweeping on the running event loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Started outline index sweeper (TTL {self.ttl_seconds:.0f}s, every {self.interval_seconds:.0f}s)")
+            
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            
+    def sweep(self) -> Dict[str, Any]:
+        """Run one sweep now and add its results to the totals."""
+        try:
+            report = sweep_outline_indexes(self.vector_store_factory(), self.ttl_seconds)
+        except Exception as e:
+            self._stats["failures"] += 1
+            logger.error(f"Error sweeping outline indexes: {str(e)}")
+            raise
+        self._stats["sweeps"] += 1
+        for field in ("outlines_deleted", "chunks_deleted", "freed_bytes", "disk_bytes_reclaimed"):
+            self._stats[field] += report[field]
+        self.last_report = dict(report, at=time.time())
+        return report
+        
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sweep)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Already logged; try again next interval
+                pass
+            await asyncio.sleep(self.interval_seconds)
+            
+    def stats(self) -> Dict[str, Any]:
+        """Return sweep totals and the last sweep's report."""
+        return dict(self._stats, ttl_seconds=self.ttl_seconds, last_sweep=self.last_report)
+
+def migrate_outline_collections(vector_store, delete: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    """Move every legacy outline_<id> collection into the shared outlines collection.
+    
+    Chunks keep their ids, documents and embeddings (nothing is re-embedded)
+    and gain outline_id metadata when it is missing. They are also stamped as
+    indexed and last used now: chunks without last_used_at never match the
+    sweeper's filter. Chunks migrated before this stamp was written are
+    stamped too. A collection is deleted only after its chunks were added to
+    the shared collection.
+    
+    Args:
+        vector_store: VectorStore holding the collections
+        delete (bool): Delete each legacy collection once migrated
+        dry_run (bool): Only count what would be migrated
+    
+    Returns:
+        Dict[str, Any]: Collections and chunks migrated, shared chunks stamped,
+            and collections that failed
+    """
+    shared_name = Config.OUTLINES_COLLECTION
+    legacy = [
+        name for name in vector_store.list_collections()
+        if name.startswith(LEGACY_PREFIX) and name != shared_name
+    ]
+    report = {"collections": len(legacy), "migrated": 0, "chunks": 0, "deleted": 0, "stamped": 0, "failed": []}
+    logger.info(f"Found {len(legacy)} legacy outline collections")
+    if dry_run:
+        return report
+        
+    migrated_at = time.time()
+    shared = vector_store.get_or_create_collection(name=shared_name, metadata={"type": "screenplay_outlines"}) if legacy else None
+    for name in legacy:
+        try:
+            collection = vector_store.get_collection(name)
+            outline_id = (collection.metadata or {}).get("id") or name[len(LEGACY_PREFIX):]
+            records = collection.get(include=["documents", "metadatas", "embeddings"])
+            ids = records["ids"]
+            if ids:
+                metadatas = [
+                    dict({"indexed_at": migrated_at, "last_used_at": migrated_at}, **(metadata or {}), outline_id=outline_id)
+                    for metadata in records["metadatas"]
+                ]
+                for start in range(0, len(ids), Config.BATCH_SIZE):
+                    end = start + Config.BATCH_SIZE
+                    shared.upsert(
+                        ids=ids[start:end],
+                        documents=records["documents"][start:end],
+                        metadatas=metadatas[start:end],
+                        embeddings=[list(embedding) for embedding in records["embeddings"][start:end]]
+                    )
+            report["migrated"] += 1
+            report["chunks"] += len(ids)
+        except Exception as e:
+            logger.error(f"Error migrating collection {name}: {str(e)}")
+            report["failed"].append(name)
+            continue
+            
+        if delete:
+            vector_store.delete_collection(name)
+            report["deleted"] += 1
+            
+    report["stamped"] = _stamp_last_used(vector_store, shared_name, migrated_at)
+    logger.info(
+        f"Migrated {report['migrated']} outline collections ({report['chunks']} chunks) into {shared_name}, "
+        f"stamped {report['stamped']} chunks, deleted {report['deleted']}, failed {len(report['failed'])}"
+    )
+    return report
+
+def _stamp_last_used(vector_store, collection_name: str, now: float) -> int:
+    """Stamp indexed_at/last_used_at on shared chunks that lack them; returns how many were stamped."""
+    try:
+        collection = vector_store.get_collection(collection_name)
+    except Exception:
+        return 0
+    records = collection.get(include=["metadatas"])
+    ids, metadatas = [], []
+    for chunk_id, metadata in zip(records["ids"], records["metadatas"]):
+        if "last_used_at" not in (metadata or {}):
+            ids.append(chunk_id)
+            metadatas.append(dict({"indexed_at": now}, **(metadata or {}), last_used_at=now))
+    for start in range(0, len(ids), Config.BATCH_SIZE):
+        end = start + Config.BATCH_SIZE
+        vector_store.update_metadatas(collection_name, ids[start:end], metadatas[start:end])
+    return len(ids)
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import time
+from .profiling import bind, track_task
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class Stage:
+    def __init__(self, name: str, func: Callable[..., Any], depends_on: Sequence[str] = ()):
+        """A single step of the analysis pipeline.
+        
+        Args:
+            name (str): Unique name of the stage; used as the key for its result
+            func (Callable): Callable invoked with the results of its dependencies
+                as keyword arguments, named after the dependency stages
+            depends_on (Sequence[str]): Names of the stages that must finish first
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, depends_on={self.depends_on!r})"
+
+def _validate_stages(stages: Sequence[Stage]) -> Dict[str, Stage]:
+    """Check that stage names are unique and the dependency graph is acyclic.
+    
+    Args:
+        stages (Sequence[Stage]): Stages making up the pipeline
+    
+    Returns:
+        Dict[str, Stage]: Stages keyed by name
+    """
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        by_name[stage.name] = stage
+        
+    for stage in stages:
+        for dep in stage.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+                
+    # Kahn's algorithm, only to detect cycles
+    remaining = {stage.name: set(stage.depends_on) for stage in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Cycle detected between stages: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+            
+    return by_name
+
+def run_stages(
+    stages: Sequence[Stage],
+    max_workers: int = None
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Run pipeline stages on a thread pool, starting each as soon as its dependencies finish.
+    
+    Independent stages run concurrently, so wall-clock time follows the critical
+    path of the graph instead of the sum of all stages. The first stage to fail
+    cancels everything not yet started and its exception is re-raised.
+    
+    Args:
+        stages (Sequence[Stage]): Stages making up the pipeline
+        max_workers (int, optional): Thread pool size; defaults to one per stage
+    
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, float]]: Stage results and per-stage
+            wall-clock timings in seconds, both keyed by stage name
+    """
+    by_name = _validate_stages(stages)
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+    
+    def _timed(stage: Stage, kwargs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return stage.func(**kwargs)
+        finally:
+            timings[stage.name] = time.perf_counter() - start
+            
+    pending: List[str] = [stage.name for stage in stages]
+    running = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(stages), 1)) as executor:
+        try:
+            while pending or running:
+                # Submit every stage whose dependencies are satisfied
+                for name in list(pending):
+                    stage = by_name[name]
+                    if all(dep in results for dep in stage.depends_on):
+                        kwargs = {dep: results[dep] for dep in stage.depends_on}
+                        logger.info(f"Starting stage: {name}")
+                        running[executor.submit(bind(_timed), stage, kwargs)] = name
+                        pending.remove(name)
+                        
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    logger.info(f"Completed stage: {name} in {timings[name]:.3f}s")
+        except Exception:
+            for future in running:
+                future.cancel()
+            raise
+            
+    return results, timings
+
+async def run_stages_async(
+    stages: Sequence[Stage],
+    on_complete: Optional[Callable[[str, Any, float], None]] = None
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Run pipeline stages on the event loop, starting each as soon as its dependencies finish.
+    
+    Async counterpart of run_stages: each stage's func must return an awaitable.
+    Nothing blocks the loop, so many analyses can be in flight on one worker.
+    
+    Args:
+        stages (Sequence[Stage]): Stages making up the pipeline
+        on_complete (Callable, optional): Called with the stage name, its result
+            and its duration in seconds as soon as each stage succeeds
+    
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, float]]: Stage results and per-stage
+            wall-clock timings in seconds, both keyed by stage name
+    """
+    _validate_stages(stages)
+    tasks: Dict[str, asyncio.Task] = {}
+    timings: Dict[str, float] = {}
+    
+    async def _run(stage: Stage) -> Any:
+        kwargs = {dep: await tasks[dep] for dep in stage.depends_on}
+        logger.info(f"Starting stage: {stage.name}")
+        start = time.perf_counter()
+        try:
+            result = await stage.func(**kwargs)
+        finally:
+            timings[stage.name] = time.perf_counter() - start
+            logger.info(f"Completed stage: {stage.name} in {timings[stage.name]:.3f}s")
+        if on_complete is not None:
+            on_complete(stage.name, result, timings[stage.name])
+        return result
+            
+    for stage in stages:
+        tasks[stage.name] = track_task(asyncio.ensure_future(_run(stage)))
+        
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        # Let cancelled tasks unwind before propagating
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+        
+    return {name: task.result() for name, task in tasks.items()}, timings
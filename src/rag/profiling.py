@@ -0,0 +1,315 @@
+from collections import Counter
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import asyncio
+import functools
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Samples are kept only for threads running code from this project
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_STDLIB = os.path.realpath(sysconfig.get_paths()["stdlib"])
+
+# The profiler of the call being profiled, inherited by tasks it creates
+_active_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar("active_profiler", default=None)
+
+Frame = Tuple[str, str]
+
+def _frame_label(frame: Frame) -> str:
+    filename, function = frame
+    return f"{os.path.basename(filename)}:{function}"
+
+def _is_stdlib(filename: str) -> bool:
+    return os.path.realpath(filename).startswith(_STDLIB) and "site-packages" not in filename
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        """Wall-clock sampling profiler over the threads and tasks of one call.
+        
+        A background thread records the Python stack of every thread and
+        asyncio task tracked by this profiler every interval seconds. Unlike
+        cProfile it sees time spent blocked on network calls (Gemini,
+        ChromaDB) and work done on pipeline threads, and its cost does not
+        depend on how many functions are called. Threads and tasks serving
+        other requests are never sampled, so concurrent profiles do not mix.
+        
+        Args:
+            interval (float): Seconds between samples
+        """
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._lock = threading.Lock()
+        # Tracked thread idents, tasks, and the futures of calls the tasks handed to a pool
+        self._threads: Counter = Counter()
+        self._tasks: Set[asyncio.Task] = set()
+        self._offloaded: Set[asyncio.Future] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        
+    def start(self) -> None:
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+        
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.seconds = time.perf_counter() - self._started_at
+        
+    @contextmanager
+    def track_thread(self) -> Iterator[None]:
+        """Sample the current thread while the block runs."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+                    
+    def track_task(self, task: asyncio.Task) -> None:
+        """Sample an asyncio task, running or suspended, until it finishes; call it on the task's loop."""
+        with self._lock:
+            self._loop = task.get_loop()
+            self._loop_thread = threading.get_ident()
+            self._tasks.add(task)
+            
+    def track_offloaded(self, future: asyncio.Future) -> None:
+        """Treat a task awaiting future as idle; the pool thread doing the work is sampled instead."""
+        with self._lock:
+            self._offloaded.add(future)
+            
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for stack in self._sample():
+                self.stacks[stack] += 1
+                
+    def _sample(self) -> List[Tuple[Frame, ...]]:
+        with self._lock:
+            threads = set(self._threads)
+            tasks = [task for task in self._tasks if not task.done()]
+            offloaded = set(self._offloaded)
+            loop, loop_thread = self._loop, self._loop_thread
+            
+        frames = sys._current_frames()
+        running = asyncio.current_task(loop) if loop is not None else None
+        stacks = [self._stack(frames[ident]) for ident in threads if ident in frames]
+        for task in tasks:
+            if task is not running:
+                stacks.append(self._task_stack(task, offloaded))
+            elif loop_thread in frames:
+                # On the loop thread right now: its live frames from the task's coroutine down
+                stacks.append(self._stack(frames[loop_thread], root=task.get_coro()))
+        return [stack for stack in stacks if stack is not None]
+        
+    @classmethod
+    def _stack(cls, frame, root=None) -> Optional[Tuple[Frame, ...]]:
+        """Root-first stack of a thread, or None when it is idle or not running project code.
+        
+        With a root coroutine, the event loop frames below it are left out, so a
+        running task has the same stack as when it is sampled suspended.
+        """
+        stack = []
+        while frame is not None:
+            stack.append((frame.f_code.co_filename, frame.f_code.co_name))
+            if root is not None and frame is root.cr_frame:
+                break
+            frame = frame.f_back
+        stack.reverse()
+        return cls._keep(stack)
+        
+    @classmethod
+    def _task_stack(cls, task: asyncio.Task, offloaded: Set[asyncio.Future]) -> Optional[Tuple[Frame, ...]]:
+        """Root-first await chain of a suspended task, or None when it waits on other tasks or threads."""
+        stack = []
+        awaited = task.get_coro()
+        while getattr(awaited, "cr_frame", None) is not None:
+            stack.append((awaited.cr_frame.f_code.co_filename, awaited.cr_frame.f_code.co_name))
+            awaited = awaited.cr_await
+        # A task waiting for stage tasks or pool threads is idle; those are sampled
+        if not stack or awaited in offloaded or isinstance(awaited, (asyncio.Task, asyncio.tasks._GatheringFuture)):
+            return None
+        return cls._keep(stack)
+        
+    @staticmethod
+    def _keep(stack: List[Frame]) -> Optional[Tuple[Frame, ...]]:
+        if not any(filename.startswith(PROJECT_ROOT) and "site-packages" not in filename for filename, _ in stack):
+            return None
+        # A thread waiting for pipeline futures is idle; the stage threads it waits on are sampled
+        leaf_file, leaf_function = stack[-1]
+        if leaf_function == "wait" and leaf_file.endswith("threading.py") and any(
+            filename.endswith(os.path.join("concurrent", "futures", "_base.py")) for filename, _ in stack
+        ):
+            return None
+        return tuple(stack)
+        
+    def collapsed(self) -> str:
+        """Return the samples as collapsed stacks ("a;b;c count"), the input format of flamegraph tools."""
+        lines = [
+            f"{';'.join(_frame_label(frame) for frame in stack)} {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+        
+    def summary(self, top: int = 8) -> List[Tuple[str, float]]:
+        """Return the functions where the most time was spent, with their sampled seconds.
+        
+        Each sample is attributed to its innermost frame outside the standard
+        library, so time blocked in a socket read is charged to the client
+        library or project function that made the call.
+        """
+        totals: Counter = Counter()
+        for stack, count in self.stacks.items():
+            owner = next((frame for frame in reversed(stack) if not _is_stdlib(frame[0])), stack[-1])
+            totals[_frame_label(owner)] += count
+        return [(label, round(count * self.interval, 3)) for label, count in totals.most_common(top)]
+
+def format_summary(summary: List[Tuple[str, float]]) -> str:
+    """Render a summary as a compact, header-safe string: "file.py:function=0.412s, ..."."""
+    return ", ".join(f"{label}={seconds:.3f}s" for label, seconds in summary).encode("ascii", "replace").decode("ascii")
+
+def bind(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap func so the thread it runs on is sampled when the caller is being profiled.
+    
+    Call bind where work is handed to a pool, in the profiled caller's
+    context; pool threads do not inherit it. Outside a profile func is
+    returned unchanged.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return func
+        
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        # Work func hands to further pools is bound to the same profile
+        token = _active_profiler.set(profiler)
+        try:
+            with profiler.track_thread():
+                return func(*args, **kwargs)
+        finally:
+            _active_profiler.reset(token)
+    return run
+
+async def run_in_executor(executor: Optional[Executor], func: Callable[..., Any], *args: Any) -> Any:
+    """loop.run_in_executor for profiled code: the pool thread is sampled and the awaiting task is idle."""
+    future = asyncio.get_running_loop().run_in_executor(executor, bind(func), *args)
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.track_offloaded(future)
+    return await future
+
+def track_task(task: asyncio.Task) -> asyncio.Task:
+    """Sample a task created by a profiled coroutine; returns the task."""
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.track_task(task)
+    return task
+
+def _write_profile(profiler: SamplingProfiler, profile_id: str, output_dir: str) -> Dict[str, Any]:
+    """Write the collapsed stacks to output_dir and return the report."""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{profile_id}.collapsed")
+    with open(path, "w") as f:
+        f.write(profiler.collapsed())
+    logger.info(f"Wrote profile {profile_id} ({profiler.samples} samples over {profiler.seconds:.3f}s) to {path}")
+    return {
+        "id": profile_id,
+        "path": path,
+        "seconds": round(profiler.seconds, 3),
+        "samples": profiler.samples,
+        "summary": profiler.summary(),
+    }
+
+def profile_call(
+    profile_id: str,
+    output_dir: str,
+    func: Callable[..., Any],
+    *args: Any,
+    interval: float = 0.005,
+    **kwargs: Any
+) -> Tuple[Any, Dict[str, Any]]:
+    """Run func under the sampling profiler and write its collapsed stacks to output_dir.
+    
+    The calling thread and the pool threads func hands work to through bind
+    are sampled. The profile is written even when func raises.
+    
+    Args:
+        profile_id (str): Identifier of the profiled request; names the artifact
+        output_dir (str): Directory for the <profile_id>.collapsed file
+        func (Callable): Function to profile, called with args and kwargs
+        interval (float): Seconds between samples
+    
+    Returns:
+        Tuple of func's result and a report with id, path, seconds, samples and summary
+    """
+    profiler = SamplingProfiler(interval=interval)
+    token = _active_profiler.set(profiler)
+    profiler.start()
+    try:
+        with profiler.track_thread():
+            result = func(*args, **kwargs)
+    finally:
+        profiler.stop()
+        _active_profiler.reset(token)
+        report = _write_profile(profiler, profile_id, output_dir)
+    return result, report
+
+async def profile_call_async(
+    profile_id: str,
+    output_dir: str,
+    func: Callable[..., Awaitable[Any]],
+    *args: Any,
+    interval: float = 0.005,
+    **kwargs: Any
+) -> Tuple[Any, Dict[str, Any]]:
+    """Await func under the sampling profiler and write its collapsed stacks to output_dir.
+    
+    Async counterpart of profile_call. The current task, the tasks func
+    creates through track_task and the pool threads it hands work to
+    through run_in_executor or bind are sampled; suspended tasks are sampled on the call they
+    are awaiting, so time waiting on a model call is charged to it. Other
+    requests served by the same event loop are not sampled.
+    
+    Args:
+        profile_id (str): Identifier of the profiled request; names the artifact
+        output_dir (str): Directory for the <profile_id>.collapsed file
+        func (Callable): Coroutine function to profile, called with args and kwargs
+        interval (float): Seconds between samples
+    
+    Returns:
+        Tuple of func's result and a report with id, path, seconds, samples and summary
+    """
+    profiler = SamplingProfiler(interval=interval)
+    token = _active_profiler.set(profiler)
+    profiler.track_task(asyncio.current_task())
+    profiler.start()
+    try:
+        result = await func(*args, **kwargs)
+    finally:
+        profiler.stop()
+        _active_profiler.reset(token)
+        report = await asyncio.get_running_loop().run_in_executor(
+            None, _write_profile, profiler, profile_id, output_dir
+        )
+    return result, report
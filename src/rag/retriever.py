@@ -1,18 +1,30 @@
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import logging
+from .outline_index import locate_beat
+from .outline_store import outline_collection, outline_filter, flatten_text, trim_to_offset
+from .lexical_index import reciprocal_rank_fusion
+from ..config.config import Config
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# "vector" ranks by embedding similarity, "lexical" by BM25 over the exact words
+# (no embedding call), "hybrid" fuses both rankings with reciprocal rank fusion
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
 class Retriever:
-    def __init__(self, vector_store):
+    def __init__(self, vector_store, mode: str = None):
         """Initialize the retriever.
         
         Args:
             vector_store: VectorStore instance for querying documents
+            mode (str, optional): One of RETRIEVAL_MODES, RETRIEVAL_MODE by default
         """
         self.vector_store = vector_store
-        
+        self.mode = mode or Config.RETRIEVAL_MODE
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {self.mode}. Expected one of {RETRIEVAL_MODES}")
+            
     def get_beat_definition(self, beat_type: str) -> Dict[str, Any]:
         """Retrieve the definition for a specific beat from Save the Cat.
         
@@ -21,7 +33,7 @@ class Retriever:
         
         Args:
             beat_type (str): Name of the beat to retrieve
-            
+        
         Returns:
             Dict[str, Any]: Beat definition and metadata
         """
@@ -33,9 +45,9 @@ class Retriever:
             query_text = f"What is the exact definition of the '{beat_type}' beat in Save the Cat? Retrieve only information about the '{beat_type}' beat and no other beats."
             
             # Try to get the exact beat definition using metadata filtering
-            results = self.vector_store.query(
-                collection_name="save_the_cat_beats",
-                query_text=query_text,
+            results = self.search(
+                "save_the_cat_beats",
+                query_text,
                 n_results=3,  # Get top 3 to have backup options
                 where={"beat_type": beat_type}  # Exact metadata match
             )
@@ -52,17 +64,16 @@ class Retriever:
                 }
         except Exception as e:
             logger.warning(f"Error in metadata-filtered query: {str(e)}")
-        
+            
         # If exact metadata filtering failed, try a semantic search
         try:
             # Fall back to a very specific semantic search
             fallback_query = f"ONLY the definition of the '{beat_type}' beat in Save the Cat screenwriting framework. No other beat types."
             
-            results = self.vector_store.query(
-                collection_name="save_the_cat_beats",
-                query_text=fallback_query,
-                n_results=3  # Get top 3 to have backup options
-            )
+            results = self._search_many(
+                "save_the_cat_beats",
+                [{"query_text": fallback_query, "n_results": 3}]  # Get top 3 to have backup options
+            )[0]
             
             logger.info(f"Query results for {beat_type} (semantic): {len(results['documents'] or [])} documents found")
             
@@ -72,14 +83,14 @@ class Retriever:
                     "definition": f"Standard definition for {beat_type} beat (fallback)",
                     "metadata": None
                 }
-            
+                
             # Find the best match among the results
             best_match_idx = 0
             for i, metadata in enumerate(results["metadatas"][0]):
                 if metadata.get("beat_type") == beat_type:
                     best_match_idx = i
                     break
-            
+                    
             logger.info(f"Selected result {best_match_idx} as best match for {beat_type}")
             return {
                 "definition": results["documents"][0][best_match_idx],
@@ -92,6 +103,29 @@ class Retriever:
                 "definition": f"Standard definition for {beat_type} beat (error fallback)",
                 "metadata": None
             }
+            
+    def search(
+        self,
+        collection_name: str,
+        query_text: str,
+        n_results: int = 5,
+        where: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """Query a collection with the retriever's mode.
+        
+        Args:
+            collection_name (str): Name of the collection to query
+            query_text (str): Query text
+            n_results (int): Number of results to return
+            where (Dict[str, Any], optional): Filter conditions
+        
+        Returns:
+            Dict[str, Any]: Query results, shaped like those of VectorStore.query
+        """
+        return self._search_many(
+            collection_name,
+            [{"query_text": query_text, "n_results": n_results, "where": where}]
+        )[0]
         
     def get_outline_context(
         self,
@@ -105,30 +139,42 @@ class Retriever:
             outline_id (str): ID of the outline to search
             beat_text (str): Text of the beat to find context for
             n_chunks (int): Number of relevant chunks to retrieve
-            
+        
         Returns:
             List[Dict[str, Any]]: List of relevant outline chunks with metadata
         """
-        results = self.vector_store.query(
-            collection_name=f"outline_{outline_id}",
-            query_text=beat_text,
-            n_results=n_chunks
-        )
+        results = self._query_outline(outline_id, beat_text, n_chunks)
         
-        contexts = []
-        for doc, metadata in zip(results["documents"], results["metadatas"]):
-            contexts.append({
-                "text": doc,
-                "metadata": metadata
-            })
-            
-        return contexts
+        return self._to_chunks(results)
+        
+    def get_outline_context_many(
+        self,
+        outline_id: str,
+        beat_texts: List[str],
+        n_chunks: int = 3
+    ) -> List[List[Dict[str, Any]]]:
+        """Retrieve relevant outline context for several beats in one round-trip.
+        
+        Args:
+            outline_id (str): ID of the outline to search
+            beat_texts (List[str]): Texts of the beats to find context for
+            n_chunks (int): Number of relevant chunks to retrieve per beat
+        
+        Returns:
+            List[List[Dict[str, Any]]]: Relevant chunks for each beat, in order
+        """
+        results = self._query_outline_many(
+            outline_id,
+            [{"query_text": beat_text, "n_results": n_chunks} for beat_text in beat_texts]
+        )
+        return [self._to_chunks(result) for result in results]
         
     def get_setup_context(
         self,
         outline_id: str,
         beat_text: str,
-        n_chunks: int = 5
+        n_chunks: int = 5,
+        outline: str = None
     ) -> List[Dict[str, Any]]:
         """Retrieve potential setup elements from earlier in the outline.
         
@@ -136,44 +182,258 @@ class Retriever:
             outline_id (str): ID of the outline to search
             beat_text (str): Text of the beat to find setups for
             n_chunks (int): Number of relevant chunks to retrieve
-            
+            outline (str, optional): Outline text, for locating the beat without a query
+        
         Returns:
             List[Dict[str, Any]]: List of potential setup elements with metadata
         """
-        # Query for chunks that appear before the beat
-        results = self.vector_store.query(
-            collection_name=f"outline_{outline_id}",
-            query_text=beat_text,
-            n_results=n_chunks,
-            where={"chunk_index": {"$lt": self._get_beat_chunk_index(outline_id, beat_text)}}
-        )
+        return self.get_setup_context_many(outline_id, [beat_text], n_chunks, outline)[0]
+        
+    def get_setup_context_many(
+        self,
+        outline_id: str,
+        beat_texts: List[str],
+        n_chunks: int = 5,
+        outline: str = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Retrieve potential setup elements for several beats.
+        
+        All setup queries are embedded together; beats with the same
+        "before the beat" filter share one ChromaDB call.
+        
+        Args:
+            outline_id (str): ID of the outline to search
+            beat_texts (List[str]): Texts of the beats to find setups for
+            n_chunks (int): Number of relevant chunks to retrieve per beat
+            outline (str, optional): Outline text, for locating the beats without a query
         
-        setups = []
-        for doc, metadata in zip(results["documents"], results["metadatas"]):
-            setups.append({
-                "text": doc,
-                "metadata": metadata
-            })
+        Returns:
+            List[List[Dict[str, Any]]]: Potential setup chunks for each beat, in order
+        """
+        filters, offsets = self._before_beat_filters(outline_id, beat_texts, outline)
+        # Query for chunks that appear before each beat; nothing precedes a beat without a filter
+        queried = [position for position, where in enumerate(filters) if where is not None]
+        setup_chunks = [[] for _ in beat_texts]
+        if not queried:
+            return setup_chunks
             
-        return setups
+        results = self._query_outline_many(outline_id, [
+            {"query_text": beat_texts[position], "n_results": n_chunks, "where": filters[position]}
+            for position in queried
+        ])
+        for position, result in zip(queried, results):
+            setup_chunks[position] = self._trim_to_beat(self._to_chunks(result), offsets[position])
+        return setup_chunks
         
-    def _get_beat_chunk_index(self, outline_id: str, beat_text: str) -> int:
-        """Get the chunk index where the beat appears in the outline.
+    def get_element_setup_context(
+        self,
+        outline_id: str,
+        beat_text: str,
+        elements: List[str],
+        n_chunks: int = 3,
+        outline: str = None
+    ) -> List[Dict[str, Any]]:
+        """Retrieve the outline chunks before the beat that are relevant to each element.
         
         Args:
-            outline_id (str): ID of the outline
-            beat_text (str): Text of the beat
+            outline_id (str): ID of the outline to search
+            beat_text (str): Text of the beat, used to locate it in the outline
+            elements (List[str]): Story elements that need setup
+            n_chunks (int): Number of chunks to retrieve per element
+            outline (str, optional): Outline text, for locating the beat without a query
+        
+        Returns:
+            List[Dict[str, Any]]: Unique chunks with metadata and best distance,
+                ordered by relevance
+        """
+        (where,), (offset,) = self._before_beat_filters(outline_id, [beat_text], outline)
+        if where is None:
+            # Nothing precedes the beat
+            return []
             
+        # One round-trip for all elements
+        results = self._query_outline_many(outline_id, [
+            {"query_text": element, "n_results": n_chunks, "where": where}
+            for element in elements
+        ])
+        
+        chunks_by_index = {}
+        for result in results:
+            for chunk in self._trim_to_beat(self._to_chunks(result), offset):
+                index = chunk["metadata"]["chunk_index"]
+                known = chunks_by_index.get(index)
+                if known is None or chunk["distance"] < known["distance"]:
+                    chunks_by_index[index] = chunk
+                    
+        return sorted(chunks_by_index.values(), key=lambda chunk: chunk["distance"])
+        
+    def _query_outline(
+        self,
+        outline_id: str,
+        query_text: str,
+        n_results: int,
+        where: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """Query one outline's chunks, wherever the storage mode keeps them.
+        
+        In the shared outlines collection the query is restricted to the
+        outline by its outline_id metadata, combined with any extra filter.
+        
+        Args:
+            outline_id (str): ID of the outline to search
+            query_text (str): Query text
+            n_results (int): Number of results to return
+            where (Dict[str, Any], optional): Extra filter, e.g. on chunk_index
+        
+        Returns:
+            Dict[str, Any]: Query results
+        """
+        return self._query_outline_many(
+            outline_id,
+            [{"query_text": query_text, "n_results": n_results, "where": where}]
+        )[0]
+        
+    def _query_outline_many(
+        self,
+        outline_id: str,
+        queries: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Run several queries against one outline's chunks in a single batch.
+        
+        Args:
+            outline_id (str): ID of the outline to search
+            queries (List[Dict[str, Any]]): Queries for VectorStore.query_many;
+                their where filters are combined with the outline's
+        
         Returns:
-            int: Chunk index where the beat appears
+            List[Dict[str, Any]]: Query results, in order
         """
-        results = self.vector_store.query(
-            collection_name=f"outline_{outline_id}",
-            query_text=beat_text,
-            n_results=1
+        return self._search_many(
+            outline_collection(outline_id),
+            [dict(query, where=outline_filter(outline_id, query.get("where"))) for query in queries]
         )
         
-        if not results["metadatas"]:
-            return -1
+    def _search_many(self, collection_name: str, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run queries against a collection with the retriever's mode.
+        
+        In hybrid mode both searches return twice the requested results, so
+        a chunk ranked just outside one list can still win on the other, and
+        the fused ranking is cut back to n_results.
+        
+        Args:
+            collection_name (str): Name of the collection to query
+            queries (List[Dict[str, Any]]): Queries as for VectorStore.query_many
+        
+        Returns:
+            List[Dict[str, Any]]: Query results, in order
+        """
+        if self.mode == "vector":
+            return self.vector_store.query_many(collection_name=collection_name, queries=queries)
+        if self.mode == "lexical":
+            return self.vector_store.lexical_query_many(collection_name=collection_name, queries=queries)
             
-        return results["metadatas"][0]["chunk_index"] 
\ No newline at end of file
+        candidates = [dict(query, n_results=2 * query.get("n_results", 5)) for query in queries]
+        lexical = self.vector_store.lexical_query_many(collection_name=collection_name, queries=candidates)
+        vector = self.vector_store.query_many(collection_name=collection_name, queries=candidates)
+        return [
+            reciprocal_rank_fusion([lexical_result, vector_result], query.get("n_results", 5), Config.RRF_K)
+            for query, lexical_result, vector_result in zip(queries, lexical, vector)
+        ]
+        
+    @staticmethod
+    def _to_chunks(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Flatten a single-query ChromaDB result into a list of chunks.
+        
+        Args:
+            results (Dict[str, Any]): Result of a query with one query text
+        
+        Returns:
+            List[Dict[str, Any]]: Chunks with text, metadata and distance
+        """
+        if not results.get("documents") or not results["documents"][0]:
+            return []
+            
+        documents = results["documents"][0]
+        metadatas = (results.get("metadatas") or [[]])[0] or [{}] * len(documents)
+        distances = (results.get("distances") or [[]])[0] or [0.0] * len(documents)
+        
+        return [
+            {"text": doc, "metadata": metadata, "distance": distance}
+            for doc, metadata, distance in zip(documents, metadatas, distances)
+        ]
+        
+    @staticmethod
+    def _trim_to_beat(chunks: List[Dict[str, Any]], offset: Optional[int]) -> List[Dict[str, Any]]:
+        """Cut the chunk the beat starts in at the beat, so only text before it is returned.
+        
+        Args:
+            chunks (List[Dict[str, Any]]): Chunks from _to_chunks
+            offset (int, optional): Beat offset in the flattened outline; None leaves chunks as they are
+        
+        Returns:
+            List[Dict[str, Any]]: The chunks, the straddling one with its text trimmed
+        """
+        if offset is None:
+            return chunks
+        return [
+            dict(chunk, text=trim_to_offset(chunk["text"], chunk["metadata"]["start"], offset))
+            if chunk["metadata"] and chunk["metadata"].get("end", 0) > offset else chunk
+            for chunk in chunks
+        ]
+        
+    def _before_beat_filters(
+        self,
+        outline_id: str,
+        beat_texts: List[str],
+        outline: str = None
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[Optional[int]]]:
+        """Return for each beat the filter selecting the chunks that start before it.
+        
+        With the outline text the beat's offset is found locally and compared
+        with the chunk offsets stored at indexing time: exact, even when a
+        later chunk reads much like the beat, and without a query. The chunk
+        the beat starts in is selected too, for the text leading up to the
+        beat; _trim_to_beat cuts it at the beat. Beats that cannot be located
+        that way fall back to guessing the beat's chunk with a semantic query.
+        
+        Args:
+            outline_id (str): ID of the outline
+            beat_texts (List[str]): Texts of the beats
+            outline (str, optional): Outline text the beats were selected from
+        
+        Returns:
+            Tuple of the ChromaDB filters, None for a beat nothing precedes, and
+            the beats' offsets in the flattened outline, None where not located
+        """
+        flat = flatten_text(outline) if outline else None
+        offsets = [locate_beat(flat, beat_text) if flat else None for beat_text in beat_texts]
+        filters: List[Optional[Dict[str, Any]]] = [
+            {"start": {"$lt": offset}} if offset else None for offset in offsets
+        ]
+        
+        unlocated = [position for position, offset in enumerate(offsets) if offset is None]
+        if unlocated:
+            beat_chunk_indexes = self._get_beat_chunk_indexes(outline_id, [beat_texts[position] for position in unlocated])
+            for position, beat_chunk_index in zip(unlocated, beat_chunk_indexes):
+                if beat_chunk_index > 0:
+                    filters[position] = {"chunk_index": {"$lt": beat_chunk_index}}
+        return filters, offsets
+        
+    def _get_beat_chunk_indexes(self, outline_id: str, beat_texts: List[str]) -> List[int]:
+        """Guess the chunk index where each beat appears with one semantic query batch.
+        
+        Args:
+            outline_id (str): ID of the outline
+            beat_texts (List[str]): Texts of the beats
+        
+        Returns:
+            List[int]: Chunk index of each beat, -1 where it was not found
+        """
+        results = self._query_outline_many(
+            outline_id,
+            [{"query_text": beat_text, "n_results": 1} for beat_text in beat_texts]
+        )
+        return [
+            result["metadatas"][0][0]["chunk_index"] if result["metadatas"] and result["metadatas"][0] else -1
+            for result in results
+        ]
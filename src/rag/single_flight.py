@@ -0,0 +1,71 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import asyncio
+import hashlib
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def content_key(*parts: Any) -> str:
+    """Hash request fields into a key identifying identical requests.
+    
+    Args:
+        *parts: Request fields; None and strings are hashed unambiguously
+    
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class SingleFlight:
+    def __init__(self):
+        """Coalesces concurrent calls with the same key into one computation.
+        
+        The first caller for a key starts the work; callers arriving while it
+        is still running wait on the same task and receive the same result or
+        exception. Nothing is cached: once the work finishes, the next call
+        with that key runs it again. A task can only be awaited on the loop
+        it runs on, so calls are coalesced per event loop.
+        """
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Task] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+        
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func, or join the in-flight run with the same key.
+        
+        The work runs in its own task, so a caller that disconnects does not
+        cancel it for the callers still waiting.
+        
+        Args:
+            key (str): Identity of the computation, e.g. from content_key
+            func (Callable): Coroutine function starting the work
+        
+        Returns:
+            Any: Result of the shared computation
+        """
+        flight = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(flight)
+        if task is None:
+            self._stats["leaders"] += 1
+            task = asyncio.ensure_future(func())
+            self._tasks[flight] = task
+            task.add_done_callback(lambda _: self._forget(flight, task))
+        else:
+            self._stats["coalesced"] += 1
+            logger.info(f"Joining in-flight computation {key[:12]}")
+        return await asyncio.shield(task)
+        
+    def _forget(self, flight: Tuple[asyncio.AbstractEventLoop, str], task: asyncio.Task) -> None:
+        if self._tasks.get(flight) is task:
+            del self._tasks[flight]
+        # Retrieve the exception so a run whose callers all left is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+            
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of computations started, calls coalesced and computations in flight."""
+        return dict(self._stats, in_flight=len(self._tasks))
@@ -0,0 +1,27 @@
+from typing import List
+import re
+
+# A word or number, keeping inner apostrophes and hyphens ("John's", "run-down")
+TERM_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9'\-]*")
+
+# Function words that carry no meaning when matching text by its terms
+STOPWORDS = frozenset("""
+a an the and or but of in on at to for from with by as into onto about over under his her their its our my
+your this that these those is are was were be been being who whom which what when where how why
+""".split())
+
+def normalize_term(word: str) -> str:
+    """Lowercase a word and drop a trailing possessive."""
+    word = word.lower()
+    return word[:-2] if word.endswith("'s") else word
+
+def content_terms(text: str) -> List[str]:
+    """Content words of a text, in order: lowercased, without stopwords or possessives.
+    
+    Args:
+        text (str): Text to split, e.g. "The protagonist's routine"
+    
+    Returns:
+        List[str]: Normalized terms, e.g. ["protagonist", "routine"]
+    """
+    return [term for term in (normalize_term(word) for word in TERM_PATTERN.findall(text)) if term not in STOPWORDS]
@@ -0,0 +1,248 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import re
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Words, numbers and individual punctuation marks: a close, dependency-free
+# approximation of how subword tokenizers split English prose
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of model tokens in a text without calling the API.
+    
+    Args:
+        text (str): Text to measure
+    
+    Returns:
+        int: Estimated token count
+    """
+    if not text:
+        return 0
+    return len(_TOKEN_PATTERN.findall(text))
+
+def fit_to_budget(chunks: List[str], token_budget: int) -> List[str]:
+    """Greedily keep chunks, most important first, while they fit in the token budget.
+    
+    A chunk too large for the remaining budget is skipped so smaller, less
+    important chunks can still use the space.
+    
+    Args:
+        chunks (List[str]): Candidate chunks, most important first
+        token_budget (int): Maximum total tokens to keep
+    
+    Returns:
+        List[str]: Kept chunks, in their original order
+    """
+    kept = []
+    used = 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if used + tokens > token_budget:
+            continue
+        kept.append(chunk)
+        used += tokens
+    return kept
+
+class PromptTooLargeError(ValueError):
+    """Raised when a rendered prompt still exceeds the model limit after compaction."""
+
+def ensure_within_limit(prompt: str, max_tokens: int, stage: str) -> int:
+    """Refuse to send a prompt that exceeds the model's token limit.
+    
+    Args:
+        prompt (str): Rendered prompt
+        max_tokens (int): Maximum estimated prompt tokens accepted by the model
+        stage (str): Pipeline stage, for the error message
+    
+    Returns:
+        int: Estimated prompt tokens
+    """
+    tokens = estimate_tokens(prompt)
+    if tokens > max_tokens:
+        raise PromptTooLargeError(
+            f"Prompt for {stage} is too large: about {tokens} tokens, limit is {max_tokens}"
+        )
+    return tokens
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text after roughly max_tokens tokens, keeping the original formatting.
+    
+    Args:
+        text (str): Text to truncate
+        max_tokens (int): Maximum estimated tokens to keep
+    
+    Returns:
+        str: The truncated text
+    """
+    if max_tokens <= 0:
+        return ""
+    for count, match in enumerate(_TOKEN_PATTERN.finditer(text), start=1):
+        if count == max_tokens:
+            return text[:match.end()]
+    return text
+
+def normalize_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines without merging paragraphs."""
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+# An act heading on its own line, optionally followed by a title ("ACT TWO: Fun and Games")
+_ACT_HEADING = re.compile(
+    r'^[ \t]*ACT[ \t]+(ONE|TWO|THREE|FOUR|FIVE|[IVX]+|\d+)\b[ \t]*(?:[:\-\u2013\u2014].*)?$',
+    re.IGNORECASE | re.MULTILINE
+)
+_OMITTED = "[... section omitted ...]"
+
+def _join_sections(rendered: List[Optional[str]]) -> str:
+    """Join sections, collapsing each run of dropped (None) sections into one marker."""
+    parts = []
+    previous = ""
+    for part in rendered:
+        if part is None:
+            if previous is not None:
+                parts.append(_OMITTED)
+        elif part:
+            parts.append(part)
+        previous = part
+    return '\n\n'.join(parts)
+
+def split_sections(text: str) -> List[str]:
+    """Split an outline into acts, or into paragraphs when it has no act headings.
+    
+    Args:
+        text (str): Whitespace-normalized outline
+    
+    Returns:
+        List[str]: Sections in outline order
+    """
+    starts = [match.start() for match in _ACT_HEADING.finditer(text)]
+    if len(starts) >= 2:
+        if starts[0] > 0:
+            starts.insert(0, 0)
+        bounds = starts + [len(text)]
+        return [text[bounds[i]:bounds[i + 1]].strip() for i in range(len(starts))]
+    return [paragraph for paragraph in text.split('\n\n') if paragraph.strip()]
+
+def locate_section(sections: List[str], beat: str) -> int:
+    """Return the index of the section containing the beat.
+    
+    Uses an exact match on normalized text first and falls back to the section
+    sharing the most words with the beat.
+    """
+    needle = normalize_whitespace(beat).lower()
+    for i, section in enumerate(sections):
+        if needle and needle in section.lower():
+            return i
+            
+    beat_words = set(re.findall(r'\w+', needle))
+    overlaps = [len(beat_words & set(re.findall(r'\w+', section.lower()))) for section in sections]
+    return overlaps.index(max(overlaps)) if overlaps else 0
+
+@lru_cache(maxsize=1024)
+def summarize_section(section: str, max_sentences_per_paragraph: int = 1) -> str:
+    """Extractive summary of a section: its heading plus the opening sentence of each paragraph.
+    
+    Summaries are cached, so sections that stay unchanged between requests are
+    only summarized once.
+    """
+    summary = []
+    for paragraph in section.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if _ACT_HEADING.match(paragraph) and '\n' not in paragraph:
+            summary.append(paragraph)
+            continue
+        sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+        summary.append(' '.join(sentences[:max_sentences_per_paragraph]))
+    return '[Summary] ' + '\n'.join(summary)
+
+def compact_outline(outline: str, beat: str, token_budget: int) -> Tuple[str, Dict[str, Any]]:
+    """Shrink an outline to fit a token budget while keeping the text around the beat.
+    
+    Steps are applied only until the outline fits:
+    1. Normalize whitespace
+    2. Replace the sections farthest from the beat with cached summaries
+    3. Drop the farthest sections entirely
+    4. Truncate what is left, keeping the beat's own section first
+    
+    Args:
+        outline (str): Full outline
+        beat (str): Designated beat, used to find the section to keep intact
+        token_budget (int): Maximum estimated tokens for the outline
+    
+    Returns:
+        Tuple[str, Dict[str, Any]]: Compacted outline and a report with the
+            original and final token counts and the steps applied
+    """
+    report = {"original_tokens": estimate_tokens(outline), "steps": []}
+    
+    def done(text: str) -> Tuple[str, Dict[str, Any]]:
+        report["final_tokens"] = estimate_tokens(text)
+        return text, report
+        
+    if report["original_tokens"] <= token_budget:
+        return done(outline)
+        
+    text = normalize_whitespace(outline)
+    report["steps"].append("whitespace")
+    if estimate_tokens(text) <= token_budget:
+        return done(text)
+        
+    sections = split_sections(text)
+    beat_index = locate_section(sections, beat or "")
+    # Farthest sections from the beat are compacted first
+    farthest_first = sorted(
+        (i for i in range(len(sections)) if i != beat_index),
+        key=lambda i: abs(i - beat_index),
+        reverse=True
+    )
+    rendered = list(sections)
+    # Sections are joined by blank lines, so the outline's token count is the sum
+    # of its sections' counts plus one omission marker per run of dropped sections
+    counts = [estimate_tokens(section) for section in sections]
+    marker_tokens = estimate_tokens(_OMITTED)
+    total = sum(counts)
+        
+    for i in farthest_first:
+        if total <= token_budget:
+            break
+        rendered[i] = summarize_section(sections[i])
+        tokens = estimate_tokens(rendered[i])
+        total += tokens - counts[i]
+        counts[i] = tokens
+        if "summaries" not in report["steps"]:
+            report["steps"].append("summaries")
+            
+    for i in farthest_first:
+        if total <= token_budget:
+            break
+        # A new run of dropped sections adds a marker; bridging two runs removes one
+        dropped_neighbours = sum(1 for j in (i - 1, i + 1) if 0 <= j < len(rendered) and rendered[j] is None)
+        total += marker_tokens * (1 - dropped_neighbours) - counts[i]
+        rendered[i] = None
+        counts[i] = 0
+        if "dropped_sections" not in report["steps"]:
+            report["steps"].append("dropped_sections")
+            
+    if total > token_budget:
+        # Only the beat's section (and omission markers) are left; keep as much of it as fits
+        markers = total - counts[beat_index]
+        remaining = max(token_budget - markers, 0)
+        section = rendered[beat_index]
+        needle = normalize_whitespace(beat or "").lower()
+        position = section.lower().find(needle) if needle else -1
+        if position > 0:
+            # Keep the text leading up to and including the beat
+            end = position + len(needle)
+            head = section[:end]
+            skip = max(estimate_tokens(head) - remaining, 0)
+            starts = [match.start() for match in _TOKEN_PATTERN.finditer(head)]
+            section = head[starts[skip]:] if skip < len(starts) else ""
+        rendered[beat_index] = truncate_to_tokens(section, remaining)
+        report["steps"].append("truncated")
+        
+    return done(_join_sections(rendered))
@@ -1,24 +1,246 @@
 import chromadb
 from chromadb.config import Settings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, repeat
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+import functools
+import json
 import os
 import logging
+import threading
+import time
+from .metrics import registry as metrics
+from .lexical_index import BM25Index
+from .profiling import bind
+from ..config.config import Config
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+DEFAULT_PERSIST_DIRECTORY = "./chroma_db"
+
+# persist_directory of the in-memory store: nothing is written to disk and
+# its collections live as long as the process
+IN_MEMORY = ":memory:"
+
+# Process-wide registry: one client per persist directory and cached collection
+# handles, so requests do not reopen the SQLite-backed client on every call
+_clients: Dict[str, Any] = {}
+_collections: Dict[Tuple[str, str], "CollectionHandle"] = {}
+# BM25 indexes kept beside collections, under the same keys; built from the
+# collection on first lexical query and kept in step by the writes made
+# through its handle
+_lexical_indexes: Dict[Tuple[str, str], BM25Index] = {}
+# Writes made while an index is being built, one list per build in progress,
+# replayed on the built index before it is registered
+_lexical_builds: Dict[Tuple[str, str], List[list]] = {}
+_registry_lock = threading.RLock()
+
+# Labelled by caller rather than collection: outline collections are one per outline
+chroma_query_seconds = metrics.histogram(
+    "script_doctor_chroma_query_seconds",
+    "Duration of ChromaDB queries",
+    ["caller"]
+)
+
+lexical_query_seconds = metrics.histogram(
+    "script_doctor_lexical_query_seconds",
+    "Duration of in-process BM25 queries",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+# Per-query result fields of a ChromaDB query, truncated to each query's n_results
+_RESULT_FIELDS = ("ids", "documents", "metadatas", "distances", "embeddings", "uris", "data")
+
+# Batch of (documents, ids, metadatas) passed to one collection.add call
+Batch = Tuple[List[str], List[str], List[Dict[str, Any]]]
+
+def _batches(
+    documents: Iterable[str],
+    ids: Iterable[str],
+    metadatas: Iterable[Dict[str, Any]],
+    batch_size: int
+) -> Iterator[Batch]:
+    """Group documents, ids and metadatas into batches, consuming the inputs lazily."""
+    records = zip(documents, ids, metadatas if metadatas is not None else repeat(None))
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        batch_documents, batch_ids, batch_metadatas = (list(column) for column in zip(*batch))
+        yield batch_documents, batch_ids, batch_metadatas if metadatas is not None else None
+
+def _registry_key(persist_directory: str) -> str:
+    """Normalize a persist directory so equivalent paths share one client."""
+    if persist_directory == IN_MEMORY:
+        return IN_MEMORY
+    return os.path.realpath(persist_directory)
+
+def get_client(persist_directory: str = DEFAULT_PERSIST_DIRECTORY):
+    """Get the shared ChromaDB client for a persist directory, creating it on first use.
+    
+    Args:
+        persist_directory (str): Directory the client persists to, or IN_MEMORY
+            for an ephemeral client that never touches the disk
+    
+    Returns:
+        chromadb.ClientAPI: Client shared by every VectorStore on that directory
+    """
+    key = _registry_key(persist_directory)
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            if key == IN_MEMORY:
+                logger.info("Opening in-memory ChromaDB client")
+                client = chromadb.EphemeralClient()
+            else:
+                Path(persist_directory).mkdir(parents=True, exist_ok=True)
+                logger.info(f"Opening ChromaDB client for {key}")
+                client = chromadb.PersistentClient(path=persist_directory)
+            _clients[key] = client
+        return client
+
+def reset_clients(persist_directory: str = None) -> None:
+    """Drop cached clients and collection handles.
+    
+    Intended for tests and for tooling that deletes a persist directory:
+    the next get_client call opens a fresh client.
+    
+    Args:
+        persist_directory (str, optional): Only reset this directory; resets all when omitted
+    """
+    with _registry_lock:
+        keys = [_registry_key(persist_directory)] if persist_directory else list(_clients)
+        for key in keys:
+            _clients.pop(key, None)
+            for cached in [c for c in _collections if c[0] == key]:
+                del _collections[cached]
+            for cached in [c for c in _lexical_indexes if c[0] == key]:
+                del _lexical_indexes[cached]
+                
+        # Chroma keeps its own per-path system cache; clear it so the files are released
+        try:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception as e:
+            logger.debug(f"Could not clear ChromaDB system cache: {str(e)}")
+
+def _apply_write(lexical_index: BM25Index, method: str, args: tuple, kwargs: Dict[str, Any]) -> bool:
+    """Apply a collection write to a lexical index.
+    
+    Returns:
+        bool: False when the write cannot be mirrored (a delete by filter, a
+            document update) and the index must be dropped instead
+    """
+    ids = kwargs.get("ids")
+    if args or ids is None:
+        return False
+    ids = [ids] if isinstance(ids, str) else ids
+    documents = kwargs.get("documents")
+    documents = [documents] if isinstance(documents, str) else documents
+    metadatas = kwargs.get("metadatas")
+    metadatas = [metadatas] if isinstance(metadatas, dict) else metadatas
+    if method in ("add", "upsert") and documents is not None:
+        lexical_index.add(ids, documents, metadatas)
+        return True
+    if method == "update" and documents is None:
+        if metadatas is not None:
+            lexical_index.update_metadatas(ids, metadatas)
+        return True
+    if method == "delete" and kwargs.get("where") is None and kwargs.get("where_document") is None:
+        lexical_index.remove(ids)
+        return True
+    return False
+
+def _mirror_write(cache_key: Tuple[str, str], method: str, args: tuple = (), kwargs: Dict[str, Any] = None) -> None:
+    """Keep a collection's lexical index in step with a write just made to the collection.
+    
+    Builds in progress record the write to replay it. A write the index
+    cannot follow drops it, and it is rebuilt on the next lexical query.
+    """
+    kwargs = kwargs or {}
+    with _registry_lock:
+        for pending in _lexical_builds.get(cache_key, ()):
+            pending.append((method, args, kwargs))
+        lexical_index = _lexical_indexes.get(cache_key)
+        if lexical_index is not None and not _apply_write(lexical_index, method, args, kwargs):
+            logger.info(f"Dropping lexical index of {cache_key[1]} after {method}; it is rebuilt on next use")
+            del _lexical_indexes[cache_key]
+
+# Collection methods whose writes are mirrored into the lexical index
+_WRITE_METHODS = frozenset({"add", "upsert", "update", "delete"})
+
+def is_missing_collection_error(error: Exception) -> bool:
+    """Whether ChromaDB rejected a call because the collection no longer exists."""
+    return "does not exist" in str(error)
+
+class CollectionHandle:
+    def __init__(self, client: Any, registry_key: str, collection: chromadb.Collection):
+        """Cached collection handle that survives the collection being recreated elsewhere.
+        
+        Re-ingesting from another process drops and recreates a collection
+        under a new ID, after which ChromaDB rejects every call on the old
+        handle with "does not exist". The first such call evicts the stale
+        handle, fetches the collection again by name and is retried once; if
+        the collection is really gone the error is raised as before. Writes
+        (add, upsert, update, delete) are mirrored into the collection's
+        lexical index. Other attributes are those of the wrapped
+        chromadb.Collection.
+        
+        Args:
+            client: ChromaDB client the collection belongs to
+            registry_key (str): Registry key of the client's persist directory
+            collection (chromadb.Collection): Collection to wrap
+        """
+        self._client = client
+        self._registry_key = registry_key
+        self._collection = collection
+        
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self._collection, attr)
+        if attr.startswith("_") or not callable(value):
+            return value
+            
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            collection = self._collection
+            try:
+                result = getattr(collection, attr)(*args, **kwargs)
+            except Exception as e:
+                if not is_missing_collection_error(e):
+                    raise
+                result = getattr(self._refetch(collection), attr)(*args, **kwargs)
+            if attr in _WRITE_METHODS:
+                _mirror_write((self._registry_key, collection.name), attr, args, kwargs)
+            return result
+        return call
+        
+    def _refetch(self, stale: chromadb.Collection) -> chromadb.Collection:
+        """Replace a stale collection with the one now under its name; concurrent callers refetch once."""
+        with _registry_lock:
+            if self._collection is stale:
+                logger.warning(f"Collection {stale.name} was recreated outside this process; refetching it")
+                # Its documents changed with it; the lexical index is rebuilt on next use
+                _mirror_write((self._registry_key, stale.name), "refetch")
+                self._collection = self._client.get_collection(name=stale.name)
+            return self._collection
+
 class VectorStore:
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = DEFAULT_PERSIST_DIRECTORY):
         """Initialize the vector store with ChromaDB.
         
+        The underlying client comes from the process-wide registry, so creating
+        a VectorStore is cheap and does not open a new database connection.
+        
         Args:
-            persist_directory (str): Directory to persist the vector store
+            persist_directory (str): Directory to persist the vector store, or
+                IN_MEMORY to keep its collections in memory only
         """
         self.persist_directory = persist_directory
-        Path(persist_directory).mkdir(parents=True, exist_ok=True)
-        
-        self.client = chromadb.PersistentClient(path=persist_directory)
+        self._registry_key = _registry_key(persist_directory)
+        self.client = get_client(persist_directory)
         
     def create_collection(self, name: str, metadata: Dict[str, Any] = None) -> chromadb.Collection:
         """Create a new collection in the vector store.
@@ -26,7 +248,7 @@ class VectorStore:
         Args:
             name (str): Name of the collection
             metadata (Dict[str, Any], optional): Metadata for the collection
-            
+        
         Returns:
             chromadb.Collection: The created collection
         """
@@ -35,25 +257,68 @@ class VectorStore:
             logger.info(f"Collection {name} already exists. Deleting it.")
             self.delete_collection(name)
             
-        return self.client.create_collection(name=name, metadata=metadata)
-    
+        collection = CollectionHandle(
+            self.client, self._registry_key, self.client.create_collection(name=name, metadata=metadata)
+        )
+        with _registry_lock:
+            _collections[(self._registry_key, name)] = collection
+            # Built alongside the collection as documents are added
+            _lexical_indexes[(self._registry_key, name)] = BM25Index()
+        return collection
+        
+    def get_or_create_collection(self, name: str, metadata: Dict[str, Any] = None) -> chromadb.Collection:
+        """Get a collection, creating it if it does not exist yet.
+        
+        Unlike create_collection, an existing collection and its documents are kept.
+        
+        Args:
+            name (str): Name of the collection
+            metadata (Dict[str, Any], optional): Metadata used when the collection is created
+        
+        Returns:
+            chromadb.Collection: The collection
+        """
+        cache_key = (self._registry_key, name)
+        collection = _collections.get(cache_key)
+        if collection is None:
+            collection = CollectionHandle(
+                self.client, self._registry_key, self.client.get_or_create_collection(name=name, metadata=metadata)
+            )
+            # A new collection starts with an empty index, as with create_collection;
+            # an existing one gets its index built on first lexical query
+            empty = collection.count() == 0
+            with _registry_lock:
+                _collections[cache_key] = collection
+                if empty:
+                    _lexical_indexes.setdefault(cache_key, BM25Index())
+        return collection
+        
     def get_collection(self, name: str) -> chromadb.Collection:
         """Get an existing collection by name.
         
+        The handle is cached; it refetches the collection if another process
+        has recreated it since.
+        
         Args:
             name (str): Name of the collection
-            
+        
         Returns:
             chromadb.Collection: The requested collection
         """
-        return self.client.get_collection(name=name)
-    
+        cache_key = (self._registry_key, name)
+        collection = _collections.get(cache_key)
+        if collection is None:
+            collection = CollectionHandle(self.client, self._registry_key, self.client.get_collection(name=name))
+            with _registry_lock:
+                _collections[cache_key] = collection
+        return collection
+        
     def collection_exists(self, name: str) -> bool:
         """Check if a collection exists.
         
         Args:
             name (str): Name of the collection
-            
+        
         Returns:
             bool: True if the collection exists, False otherwise
         """
@@ -62,7 +327,7 @@ class VectorStore:
             return True
         except Exception:
             return False
-    
+            
     def list_collections(self) -> List[str]:
         """List all collections in the vector store.
         
@@ -70,42 +335,90 @@ class VectorStore:
             List[str]: List of collection names
         """
         collections = self.client.list_collections()
-        return [collection.name for collection in collections]
-    
+        # Newer ChromaDB versions return names instead of collection objects
+        return [getattr(collection, "name", collection) for collection in collections]
+        
     def delete_collection(self, name: str) -> None:
         """Delete a collection from the vector store.
         
         Args:
             name (str): Name of the collection to delete
         """
+        with _registry_lock:
+            _collections.pop((self._registry_key, name), None)
+            _mirror_write((self._registry_key, name), "delete_collection")
         try:
             self.client.delete_collection(name=name)
             logger.info(f"Collection {name} deleted successfully")
         except Exception as e:
             logger.error(f"Error deleting collection {name}: {str(e)}")
-    
+            
     def add_documents(
         self,
         collection_name: str,
-        documents: List[str],
-        ids: List[str],
-        metadatas: List[Dict[str, Any]] = None
-    ) -> None:
-        """Add documents to a collection.
+        documents: Iterable[str],
+        ids: Iterable[str],
+        metadatas: Iterable[Dict[str, Any]] = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Dict[str, Any]:
+        """Add documents to a collection in batches.
+        
+        Batches are embedded in parallel with the collection's embedding
+        function while earlier batches are written, so embedding and ChromaDB
+        writes overlap. The inputs may be generators: they are consumed one
+        batch at a time and at most max_workers + 1 batches are held in memory,
+        however large the corpus.
         
         Args:
             collection_name (str): Name of the collection
-            documents (List[str]): List of document texts
-            ids (List[str]): List of document IDs
-            metadatas (List[Dict[str, Any]], optional): List of metadata dictionaries
+            documents (Iterable[str]): Document texts
+            ids (Iterable[str]): Document IDs
+            metadatas (Iterable[Dict[str, Any]], optional): Metadata dictionaries
+            batch_size (int, optional): Documents per batch, BATCH_SIZE by default
+            max_workers (int, optional): Batches embedded at once, MAX_WORKERS by default
+        
+        Returns:
+            Dict[str, Any]: Chunks and batches added, elapsed seconds and chunks per second
         """
+        batch_size = batch_size or Config.BATCH_SIZE
+        max_workers = max_workers or Config.MAX_WORKERS
         collection = self.get_collection(collection_name)
-        collection.add(
-            documents=documents,
-            ids=ids,
-            metadatas=metadatas
-        )
-    
+        # Not public API; without it each add call embeds its own batch
+        embed = getattr(collection, "_embedding_function", None)
+        
+        report = {"chunks": 0, "batches": 0}
+        start = time.perf_counter()
+        pending = deque()
+        
+        def write_oldest():
+            (batch_documents, batch_ids, batch_metadatas), embedding = pending.popleft()
+            collection.add(
+                documents=batch_documents,
+                ids=batch_ids,
+                metadatas=batch_metadatas,
+                embeddings=embedding.result() if embedding is not None else None
+            )
+            report["chunks"] += len(batch_ids)
+            report["batches"] += 1
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Added {report['chunks']} chunks to {collection_name} "
+                f"({report['chunks'] / elapsed if elapsed else 0.0:.1f} chunks/s)"
+            )
+            
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed") as executor:
+            for batch in _batches(documents, ids, metadatas, batch_size):
+                pending.append((batch, executor.submit(bind(embed), batch[0]) if embed is not None else None))
+                if len(pending) > max_workers:
+                    write_oldest()
+            while pending:
+                write_oldest()
+                
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        report["chunks_per_second"] = round(report["chunks"] / report["seconds"], 1) if report["seconds"] else 0.0
+        return report
+        
     def query(
         self,
         collection_name: str,
@@ -120,25 +433,197 @@ class VectorStore:
             query_text (str): Query text
             n_results (int): Number of results to return
             where (Dict[str, Any], optional): Filter conditions
-            
+        
         Returns:
             Dict[str, Any]: Query results containing documents, distances, and metadata
         """
         collection = self.get_collection(collection_name)
-        results = collection.query(
-            query_texts=[query_text],
-            n_results=n_results,
-            where=where
+        with chroma_query_seconds.time(caller="vector_store"):
+            results = collection.query(
+                query_texts=[query_text],
+                n_results=n_results,
+                where=where
+            )
+        return results
+        
+    def query_many(
+        self,
+        collection_name: str,
+        queries: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Run several queries against a collection in as few calls as possible.
+        
+        All query texts are embedded in one batch. ChromaDB applies one filter
+        and one n_results to a whole query call, so queries sharing a where
+        filter go in one call (asking for the largest n_results among them)
+        and each result is cut back to its own n_results.
+        
+        Args:
+            collection_name (str): Name of the collection to query
+            queries (List[Dict[str, Any]]): Queries, each with "query_text" and
+                optional "n_results" (default 5) and "where"
+        
+        Returns:
+            List[Dict[str, Any]]: One result per query, in order, shaped like
+                the result of query()
+        """
+        if not queries:
+            return []
+        collection = self.get_collection(collection_name)
+        texts = [query["query_text"] for query in queries]
+        # Not public API; without it each query call embeds its own texts
+        embed = getattr(collection, "_embedding_function", None)
+        
+        groups: Dict[str, List[int]] = {}
+        for position, query in enumerate(queries):
+            groups.setdefault(json.dumps(query.get("where"), sort_keys=True), []).append(position)
+            
+        results: List[Dict[str, Any]] = [None] * len(queries)
+        with chroma_query_seconds.time(caller="vector_store_many"):
+            embeddings = embed(texts) if embed is not None else None
+            for members in groups.values():
+                if embeddings is not None:
+                    inputs = {"query_embeddings": [embeddings[position] for position in members]}
+                else:
+                    inputs = {"query_texts": [texts[position] for position in members]}
+                batch = collection.query(
+                    n_results=max(queries[position].get("n_results", 5) for position in members),
+                    where=queries[members[0]].get("where"),
+                    **inputs
+                )
+                for row, position in enumerate(members):
+                    n_results = queries[position].get("n_results", 5)
+                    result = dict(batch)
+                    for field in _RESULT_FIELDS:
+                        if batch.get(field) is not None:
+                            result[field] = [batch[field][row][:n_results]]
+                    results[position] = result
+        return results
+        
+    def delete_documents(self, collection_name: str, ids: List[str]) -> None:
+        """Delete documents from a collection and from its lexical index.
+        
+        Args:
+            collection_name (str): Name of the collection
+            ids (List[str]): IDs of the documents to delete
+        """
+        self.get_collection(collection_name).delete(ids=ids)
+        
+    def update_metadatas(self, collection_name: str, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of documents in a collection and in its lexical index.
+        
+        Args:
+            collection_name (str): Name of the collection
+            ids (List[str]): IDs of the documents to update
+            metadatas (List[Dict[str, Any]]): New metadata, one per ID
+        """
+        self.get_collection(collection_name).update(ids=ids, metadatas=metadatas)
+        
+    def lexical_index(self, collection_name: str) -> BM25Index:
+        """Get the BM25 index of a collection, building it from the collection when needed.
+        
+        A registered index is returned as is, without asking the collection
+        for its size: writes through the collection's handle keep it in step,
+        and those made while it is being built are replayed on it. Documents
+        written by another process are added by sync_lexical_index.
+        
+        Args:
+            collection_name (str): Name of the collection
+        
+        Returns:
+            BM25Index: Index of the collection's documents
+        """
+        cache_key = (self._registry_key, collection_name)
+        lexical_index = _lexical_indexes.get(cache_key)
+        if lexical_index is not None:
+            return lexical_index
+            
+        collection = self.get_collection(collection_name)
+        pending = []
+        with _registry_lock:
+            _lexical_builds.setdefault(cache_key, []).append(pending)
+        try:
+            start = time.perf_counter()
+            records = collection.get(include=["documents", "metadatas"])
+            built = BM25Index()
+            built.add(records["ids"], records["documents"], records["metadatas"])
+        finally:
+            with _registry_lock:
+                builds = [build for build in _lexical_builds[cache_key] if build is not pending]
+                if builds:
+                    _lexical_builds[cache_key] = builds
+                else:
+                    del _lexical_builds[cache_key]
+                    
+        with _registry_lock:
+            registered = _lexical_indexes.get(cache_key)
+            if registered is not None:
+                return registered
+            # Writes already in the records are replayed to the same result
+            if not all(_apply_write(built, method, args, kwargs) for method, args, kwargs in pending):
+                # Left unregistered: the next query builds it again
+                logger.info(f"Collection {collection_name} changed while its lexical index was built")
+                return built
+            _lexical_indexes[cache_key] = built
+        logger.info(
+            f"Built lexical index of {collection_name}: {len(built)} documents "
+            f"in {time.perf_counter() - start:.3f}s"
         )
+        return built
+        
+    def sync_lexical_index(self, collection_name: str, ids: List[str]) -> int:
+        """Add documents another process wrote to a collection to its registered lexical index.
+        
+        Only the IDs the index does not hold are fetched; when no index is
+        registered yet nothing is fetched, the first lexical query builds it.
+        
+        Args:
+            collection_name (str): Name of the collection
+            ids (List[str]): IDs known to be in the collection
+        
+        Returns:
+            int: Number of documents added to the index
+        """
+        lexical_index = _lexical_indexes.get((self._registry_key, collection_name))
+        if lexical_index is None:
+            return 0
+        missing = [doc_id for doc_id in ids if doc_id not in lexical_index]
+        if not missing:
+            return 0
+        records = self.get_collection(collection_name).get(ids=missing, include=["documents", "metadatas"])
+        lexical_index.add(records["ids"], records["documents"], records["metadatas"])
+        logger.info(f"Added {len(records['ids'])} documents written elsewhere to the lexical index of {collection_name}")
+        return len(records["ids"])
+        
+    def lexical_query_many(
+        self,
+        collection_name: str,
+        queries: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Run queries against a collection's BM25 index, without embedding anything.
+        
+        Args:
+            collection_name (str): Name of the collection to query
+            queries (List[Dict[str, Any]]): Queries as for query_many
+        
+        Returns:
+            List[Dict[str, Any]]: One result per query, in order, shaped like
+                the result of query()
+        """
+        lexical_index = self.lexical_index(collection_name)
+        results = []
+        for query in queries:
+            with lexical_query_seconds.time():
+                results.append(lexical_index.search(query["query_text"], query.get("n_results", 5), query.get("where")))
         return results
 
 # Global function to get a collection by name
 def get_collection(name: str) -> chromadb.Collection:
-    """Get a ChromaDB collection by name.
+    """Get a ChromaDB collection by name from the shared default client.
     
     Args:
         name (str): Name of the collection
-        
+    
     Returns:
         chromadb.Collection: The requested collection
     """
@@ -1,18 +1,31 @@
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import os
 import tempfile
 import shutil
+import asyncio
+import threading
 import google.generativeai as genai
 
 from src.rag.analyzer import (
     analyze_beat,
+    analyze_beat_async,
+    analyze_beat_stream,
     get_beat_definition,
     analyze_functional_aspects,
     check_setups,
     synthesize_analysis,
-    index_outline
+    index_outline,
+    get_token_usage,
+    _log_token_usage,
+    _parse_fast_analysis
 )
+from src.rag.llm_cache import ResponseCache
+from src.rag.llm_backend import FakeBackend, LLMResponse
+from src.rag.llm_scheduler import LLMScheduler
+from src.rag.beat_definitions import BeatDefinitionTable
+
+BEATS_JSON = os.path.join(os.path.dirname(__file__), "..", "data", "save_the_cat", "beats.json")
 
 @pytest.fixture(autouse=True)
 def mock_genai_setup():
@@ -20,6 +33,36 @@ def mock_genai_setup():
     with patch('google.generativeai.configure') as mock_configure:
         yield mock_configure
 
+@pytest.fixture(autouse=True)
+def response_cache():
+    """Use a fresh in-memory response cache so tests never share cached responses."""
+    cache = ResponseCache()
+    with patch('src.rag.analyzer.response_cache', cache):
+        yield cache
+
+@pytest.fixture(autouse=True)
+def stage_cache():
+    """Use a fresh stage cache so tests never reuse another test's stage results."""
+    cache = ResponseCache()
+    with patch('src.rag.analyzer.stage_cache', cache):
+        yield cache
+
+@pytest.fixture(autouse=True)
+def scheduler():
+    """Use a fresh scheduler so earlier tests never use up this test's rate-limit tokens."""
+    fresh = LLMScheduler(requests_per_minute=60000, burst=1000)
+    with patch('src.rag.analyzer.scheduler', fresh):
+        yield fresh
+
+@pytest.fixture(autouse=True)
+def definition_table():
+    """Serve beat definitions from the bundled beats JSON instead of ChromaDB."""
+    table = BeatDefinitionTable(collection_name="missing", json_path=BEATS_JSON)
+    with patch('src.rag.beat_definitions.get_collection', side_effect=Exception("no collection")):
+        table.load()
+    with patch('src.rag.analyzer.definition_table', table):
+        yield table
+
 @pytest.fixture(autouse=True)
 def mock_genai_model():
     """Mock the Gemini Pro model responses."""
@@ -35,6 +78,7 @@ SUGGEST:
     
     mock_model = MagicMock()
     mock_model.generate_content.return_value = mock_response
+    mock_model.generate_content_async = AsyncMock(return_value=mock_response)
     
     with patch('src.rag.analyzer.model', mock_model):
         yield mock_model
@@ -72,19 +116,22 @@ def sample_beat():
     return "John receives a mysterious letter inviting him to join an exclusive adventure club."
 
 def test_get_beat_definition(mock_collection):
-    """Test retrieving beat definitions from ChromaDB."""
-    definition = get_beat_definition("Catalyst", mock_collection)
+    """Test retrieving beat definitions through the retriever."""
+    mock_retriever = MagicMock()
+    mock_retriever.search.return_value = mock_collection.query.return_value
+    definition = get_beat_definition("Catalyst", mock_retriever)
     
     # Verify the definition was retrieved
     assert definition is not None
     assert "Catalyst" in definition
     assert "Inciting Incident" in definition
     
-    # Verify the collection was queried correctly
-    mock_collection.query.assert_called_once()
-    query_args = mock_collection.query.call_args[1]
-    assert "Catalyst" in query_args['query_texts'][0]
-    assert query_args['n_results'] == 1
+    # Verify the framework collection was searched with the retriever's mode
+    mock_retriever.search.assert_called_once()
+    collection_name, query_text = mock_retriever.search.call_args[0]
+    assert collection_name == "save_the_cat"
+    assert "Catalyst" in query_text
+    assert mock_retriever.search.call_args.kwargs['n_results'] == 1
 
 def test_analyze_functional_aspects(mock_genai_model, sample_outline, sample_beat):
     """Test the functional analysis of a beat."""
@@ -167,6 +214,62 @@ def test_full_analysis_pipeline(mock_genai_model, mock_collection, sample_outlin
         assert "Save the Cat" in result["explanation"]
         assert len(result["suggestions"]) >= 1
 
+def test_resubmitted_outline_reuses_its_index():
+    """Test that an outline already indexed is not chunked or embedded again."""
+    found = {"ids": ["abc_chunk_0"], "metadatas": [{"last_used_at": 0.0, "start": 0, "end": 29}], "last_used_at": 0.0}
+    with patch('src.rag.analyzer.outline_vector_store'), \
+         patch('src.rag.analyzer.find_outline', side_effect=[None, found]), \
+         patch('src.rag.analyzer.touch_outline') as mock_touch, \
+         patch('src.rag.analyzer.store_outline_chunks', return_value="outlines") as mock_store:
+        first = index_outline("CATALYST: The letter arrives.")
+        second = index_outline("CATALYST:  The letter arrives.\n")
+        
+    assert first == second
+    assert mock_store.call_count == 1
+    mock_touch.assert_called_once()
+
+def test_unrelated_outlines_index_concurrently():
+    """Test that indexing one outline does not wait for another, while the same outline is indexed once."""
+    both_storing = threading.Barrier(2, timeout=5)
+    stored = []
+    indexed = set()
+    
+    def store(vector_store, outline_id, chunks, offsets):
+        if outline_id not in indexed:
+            # Both distinct outlines must be inside the store at once
+            if len(stored) < 2:
+                stored.append(outline_id)
+                both_storing.wait()
+            indexed.add(outline_id)
+        return "outlines"
+        
+    def find(vector_store, outline_id):
+        return {"ids": ["x"], "metadatas": [{"end": 1}], "last_used_at": 0.0} if outline_id in indexed else None
+        
+    with patch('src.rag.analyzer.outline_vector_store'), \
+         patch('src.rag.analyzer.find_outline', side_effect=find), \
+         patch('src.rag.analyzer.touch_outline'), \
+         patch('src.rag.analyzer.store_outline_chunks', side_effect=store):
+        threads = [threading.Thread(target=index_outline, args=(f"CATALYST: Outline {i}.",)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+            
+    assert not both_storing.broken
+    assert len(set(stored)) == 2
+
+def test_outline_indexed_without_offsets_is_reindexed():
+    """Test that an index from before chunk offsets were stored is replaced, offsets included."""
+    found = {"ids": ["abc_chunk_0"], "metadatas": [{"last_used_at": 0.0}], "last_used_at": 0.0}
+    with patch('src.rag.analyzer.outline_vector_store') as mock_store_factory, \
+         patch('src.rag.analyzer.find_outline', return_value=found), \
+         patch('src.rag.analyzer.store_outline_chunks', return_value="outlines") as mock_store:
+        index_outline("CATALYST: The letter arrives.")
+        
+    mock_store_factory.return_value.delete_documents.assert_called_once_with("outlines", ["abc_chunk_0"])
+    assert mock_store.call_args.args[3] == [(0, 29)]
+
 def test_index_outline():
     """Test the dynamic indexing of outlines."""
     # Create a temporary directory for ChromaDB
@@ -180,4 +283,312 @@ def test_index_outline():
         assert len(collection_name) > len("outline_")  # Should include a UUID
         
         # Clean up
-        shutil.rmtree(temp_dir) 
\ No newline at end of file
+        shutil.rmtree(temp_dir) 
+def test_pipeline_reports_stage_timings(mock_genai_model, mock_collection, sample_outline, sample_beat):
+    """Test that the staged pipeline reports per-stage timings in the raw block."""
+    with patch('src.rag.analyzer.get_collection', return_value=mock_collection):
+        result = analyze_beat(
+            outline=sample_outline,
+            beat=sample_beat,
+            beat_type="Catalyst"
+        )
+        
+        timings = result["raw"]["timings"]
+        for stage in ["definition", "functional_analysis", "elements", "setup_analysis", "synthesis", "total"]:
+            assert stage in timings
+            
+        # Functional analysis, element identification, setup check and synthesis
+        assert mock_genai_model.generate_content.call_count == 4
+
+def test_async_pipeline_uses_async_api(mock_genai_model, mock_collection, sample_outline, sample_beat):
+    """Test that the async pipeline awaits the async Gemini API and never blocks on the sync one."""
+    with patch('src.rag.analyzer.get_collection', return_value=mock_collection):
+        result = asyncio.run(analyze_beat_async(
+            outline=sample_outline,
+            beat=sample_beat,
+            beat_type="Catalyst"
+        ))
+        
+        assert result["analysis"]["flag"]
+        assert "timings" in result["raw"]
+        assert mock_genai_model.generate_content_async.await_count == 4
+        mock_genai_model.generate_content.assert_not_called()
+
+def test_repeated_analysis_is_served_from_cache(mock_genai_model, mock_collection, response_cache, sample_outline, sample_beat):
+    """Test that resubmitting an unchanged outline and beat makes no model calls."""
+    # Bypass the stage cache, which would otherwise serve the repeat before the response cache
+    with patch('src.rag.analyzer.get_collection', return_value=mock_collection), \
+         patch('src.rag.analyzer.stage_cache', None):
+        first = analyze_beat(outline=sample_outline, beat=sample_beat, beat_type="Catalyst")
+        calls_after_first = mock_genai_model.generate_content.call_count
+        
+        second = analyze_beat(outline=sample_outline, beat=sample_beat, beat_type="Catalyst")
+        
+        assert mock_genai_model.generate_content.call_count == calls_after_first
+        assert second["analysis"] == first["analysis"]
+        assert response_cache.stats()["memory_hits"] == 4
+
+def test_definition_lookup_skips_vector_query(mock_genai_model, mock_collection, sample_outline, sample_beat):
+    """Test that known beat types are served from the definition table without a ChromaDB query."""
+    with patch('src.rag.analyzer.get_collection', return_value=mock_collection) as mock_get:
+        result = analyze_beat(
+            outline=sample_outline,
+            beat=sample_beat,
+            beat_type="catalyst"
+        )
+        
+        assert result["definition"].startswith("BEAT TYPE: Catalyst")
+        mock_get.assert_not_called()
+        mock_collection.query.assert_not_called()
+
+def test_retrieval_mode_sends_only_setup_chunks(mock_genai_model, sample_outline, sample_beat):
+    """Test that retrieval mode replaces the outline in the setup prompt and reports tokens saved."""
+    mock_retriever = MagicMock()
+    mock_retriever.get_element_setup_context.return_value = [
+        {"text": "SET-UP: We see John's daily routine.", "metadata": {"chunk_index": 0}, "distance": 0.1}
+    ]
+    
+    with patch('src.rag.analyzer._index_outline_for_setup', return_value="abc"), \
+         patch('src.rag.analyzer.outline_vector_store'), \
+         patch('src.rag.analyzer.Retriever', return_value=mock_retriever):
+        result = analyze_beat(
+            outline=sample_outline,
+            beat=sample_beat,
+            beat_type="Catalyst",
+            context_mode="retrieval"
+        )
+        
+    setup_context = result["raw"]["setup_context"]
+    assert setup_context["mode"] == "retrieval"
+    assert setup_context["chunks"] == 1
+    assert setup_context["tokens_saved"] > 0
+    
+    setup_prompts = [
+        call.args[0] for call in mock_genai_model.generate_content.call_args_list
+        if "properly set up" in call.args[0]
+    ]
+    assert len(setup_prompts) == 1
+    assert "daily routine" in setup_prompts[0]
+    assert "DEBATE" not in setup_prompts[0]
+
+def test_stream_emits_stage_events_then_synthesis_tokens(mock_genai_model, sample_outline, sample_beat):
+    """Test that streaming analysis reports each stage before streaming synthesis tokens."""
+    stage_response = mock_genai_model.generate_content_async.return_value
+    synthesis_chunks = ["FLAG: Weak catalyst.\n\n", "EXPLAIN: It lacks stakes.\n\n", "SUGGEST:\n- Raise the stakes"]
+    
+    async def stream_chunks():
+        for text in synthesis_chunks:
+            yield MagicMock(text=text)
+            
+    async def generate(prompt, stream=False):
+        return stream_chunks() if stream else stage_response
+        
+    mock_genai_model.generate_content_async = AsyncMock(side_effect=generate)
+    
+    async def collect():
+        return [event async for event in analyze_beat_stream(
+            outline=sample_outline,
+            beat=sample_beat,
+            beat_type="Catalyst"
+        )]
+        
+    events = asyncio.run(collect())
+    names = [name for name, _ in events]
+    
+    assert names[0] == "started"
+    assert set(names[1:5]) == {"definition", "functional_analysis", "elements", "setup_analysis"}
+    assert names[5:8] == ["synthesis_token"] * 3
+    assert names[-1] == "result"
+    
+    result = events[-1][1]
+    assert result["id"] == events[0][1]["id"]
+    assert result["analysis"]["flag"] == "Weak catalyst."
+    assert result["analysis"]["suggestions"] == ["Raise the stakes"]
+    assert "synthesis" in result["raw"]["timings"]
+
+def test_pipeline_runs_on_fake_backend(sample_outline, sample_beat):
+    """Test that the whole pipeline runs offline against the fake LLM backend."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    with patch('src.rag.analyzer.model', backend):
+        result = asyncio.run(analyze_beat_async(
+            outline=sample_outline,
+            beat=sample_beat,
+            beat_type="Catalyst"
+        ))
+        
+    assert result["analysis"]["flag"] == "The beat does not yet land with enough emotional weight."
+    assert len(result["analysis"]["suggestions"]) == 3
+    assert backend.calls == 4
+
+def test_model_calls_go_through_scheduler(mock_genai_model, scheduler, sample_outline, sample_beat):
+    """Test that every stage's model call is admitted by the scheduler and retried on 429."""
+    response = mock_genai_model.generate_content_async.return_value
+    mock_genai_model.generate_content_async.side_effect = [Exception("429 quota")] + [response] * 4
+    scheduler.backoff_base = 0.0
+    
+    result = asyncio.run(analyze_beat_async(
+        outline=sample_outline,
+        beat=sample_beat,
+        beat_type="Catalyst"
+    ))
+    
+    stats = scheduler.stats()
+    assert result["analysis"]["flag"]
+    assert stats["completed"] == 4
+    assert stats["retries"] == 1
+
+def test_fast_tier_makes_one_call_with_same_result_shape(sample_outline, sample_beat):
+    """Test that the fast tier answers all four stages with one structured-output call."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    with patch('src.rag.analyzer.model', backend):
+        fast = asyncio.run(analyze_beat_async(sample_outline, sample_beat, "Catalyst", tier="fast"))
+        thorough = analyze_beat(sample_outline, sample_beat, "Catalyst", tier="thorough")
+        
+    assert backend.calls == 1 + 4
+    assert set(fast) == set(thorough)
+    assert set(fast["analysis"]) == {"flag", "explanation", "suggestions"}
+    assert fast["analysis"]["flag"] == "The beat does not yet land with enough emotional weight."
+    assert len(fast["analysis"]["suggestions"]) == 3
+    assert fast["raw"]["tier"] == "fast"
+    assert "inciting letter" in fast["raw"]["setup_analysis"]
+    assert set(fast["raw"]["timings"]) == {"definition", "fast_analysis", "total"}
+
+def test_fast_tier_parses_fenced_json_and_plain_text():
+    """Test that the fast response parser accepts fenced JSON and falls back to the FLAG headings."""
+    fenced = LLMResponse('```json\n{"flag": "Weak stakes", "explanation": "Why", "suggestions": ["Fix it"]}\n```')
+    parsed = _parse_fast_analysis(fenced, "Catalyst")
+    
+    assert parsed["synthesis"] == {"flag": "Weak stakes", "explanation": "Why", "suggestions": ["Fix it"]}
+    
+    plain = LLMResponse("FLAG: Weak stakes\n\nEXPLAIN: Why\n\nSUGGEST:\n- Fix it")
+    parsed = _parse_fast_analysis(plain, "Catalyst")
+    
+    assert parsed["synthesis"]["flag"] == "Weak stakes"
+    assert parsed["synthesis"]["suggestions"] == ["Fix it"]
+    
+    with pytest.raises(ValueError):
+        analyze_beat("outline", "beat", "Catalyst", tier="instant")
+
+def test_local_element_extractor_skips_elements_call():
+    """Test that the local extractor replaces the elements call and falls back when it finds too little."""
+    with open(os.path.join(os.path.dirname(__file__), "..", "data", "uat_samples", "well_structured_outline.txt")) as f:
+        outline = f.read()
+    beat = next(p for p in outline.split("\n\n") if p.startswith("CATALYST:"))
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    with patch('src.rag.analyzer.model', backend), \
+         patch('src.rag.analyzer.response_cache', None), \
+         patch('src.rag.analyzer.stage_cache', None), \
+         patch('src.config.config.Config.SETUP_PRECHECK_ENABLED', False), \
+         patch('src.config.config.Config.ELEMENT_EXTRACTOR', 'local'):
+        result = analyze_beat(outline, beat, "Catalyst")
+        assert backend.calls == 3
+        
+        with patch('src.config.config.Config.ELEMENT_EXTRACTOR_MIN_CANDIDATES', 50):
+            analyze_beat(outline, beat, "Catalyst")
+        assert backend.calls == 3 + 4
+        
+    assert result["analysis"]["flag"]
+
+def test_outline_edit_after_beat_reuses_unaffected_stages():
+    """Test that re-analyzing after an edit past the beat only reruns the stages that read the whole outline."""
+    with open(os.path.join(os.path.dirname(__file__), "..", "data", "uat_samples", "well_structured_outline.txt")) as f:
+        outline = f.read()
+    paragraphs = outline.split("\n\n")
+    beat_index = next(i for i, p in enumerate(paragraphs) if p.startswith("CATALYST:"))
+    beat = paragraphs[beat_index]
+    paragraphs[beat_index + 2] += " Later, the rain finally stops."
+    edited = "\n\n".join(paragraphs)
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    with patch('src.rag.analyzer.model', backend), \
+         patch('src.rag.analyzer.response_cache', None):
+        first = analyze_beat(outline, beat, "Catalyst")
+        first_calls = backend.calls
+        second = analyze_beat(edited, beat, "Catalyst")
+        
+    assert first["raw"]["reused_stages"] == []
+    # Functional analysis reads the whole outline, and synthesis reads its result
+    assert backend.calls - first_calls == 2
+    assert second["raw"]["reused_stages"] == ["elements", "setup_analysis"]
+    assert second["analysis"] == first["analysis"]
+
+def test_reingested_definition_is_not_served_from_the_stage_cache(sample_outline, sample_beat):
+    """Test that a new framework definition reaches the stages that use it after a re-ingest."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    with patch('src.rag.analyzer.model', backend), \
+         patch('src.rag.analyzer.response_cache', None):
+        with patch('src.rag.analyzer.lookup_beat_definition', return_value="OLD DEFINITION"):
+            analyze_beat(sample_outline, sample_beat, "Catalyst")
+        with patch('src.rag.analyzer.lookup_beat_definition', return_value="NEW DEFINITION"):
+            second = analyze_beat(sample_outline, sample_beat, "Catalyst")
+            
+    assert second["definition"] == "NEW DEFINITION"
+    assert "definition" not in second["raw"]["reused_stages"]
+    assert "functional_analysis" not in second["raw"]["reused_stages"]
+
+def test_stages_built_on_a_fallback_definition_are_not_cached(sample_outline, sample_beat):
+    """Test that a ChromaDB failure does not pin the fallback definition or the analyses built on it."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    fallback = "Standard definition for Catalyst beat (error fallback)"
+    
+    with patch('src.rag.analyzer.model', backend), \
+         patch('src.rag.analyzer.response_cache', None), \
+         patch('src.rag.analyzer.lookup_beat_definition', return_value=fallback):
+        analyze_beat(sample_outline, sample_beat, "Catalyst")
+        second = analyze_beat(sample_outline, sample_beat, "Catalyst")
+        
+    assert "functional_analysis" not in second["raw"]["reused_stages"]
+    assert "synthesis" not in second["raw"]["reused_stages"]
+
+def test_setup_precheck_settles_elements_without_the_model(sample_outline, sample_beat):
+    """Test that elements never or repeatedly mentioned before the beat skip the setup call."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    with patch('src.rag.analyzer.model', backend), \
+         patch('src.rag.analyzer.identify_elements', return_value="- John\n- The dragon"):
+        result = analyze_beat(sample_outline, sample_beat, "Catalyst")
+        
+    precheck = result["raw"]["setup_precheck"]
+    statuses = {entry["element"]: entry["status"] for entry in precheck["elements"]}
+    assert statuses == {"John": "established", "The dragon": "missing"}
+    assert all(mention["offset"] < precheck["beat_offset"] for mention in precheck["elements"][0]["mentions"])
+    assert "The dragon: never mentioned before this beat" in result["raw"]["setup_analysis"]
+    # Functional analysis and synthesis only
+    assert backend.calls == 2
+
+def test_setup_precheck_sends_only_ambiguous_elements_with_evidence(mock_genai_model, sample_outline, sample_beat):
+    """Test that ambiguous elements go to the model together with their earlier mentions."""
+    with patch('src.rag.analyzer.identify_elements', return_value="- The dragon\n- John's boss"):
+        analyze_beat(sample_outline, sample_beat, "Catalyst")
+        
+    setup_prompts = [
+        call.args[0] for call in mock_genai_model.generate_content.call_args_list
+        if "properly set up" in call.args[0]
+    ]
+    assert len(setup_prompts) == 1
+    assert "- John's boss" in setup_prompts[0]
+    assert "- The dragon" not in setup_prompts[0]
+    assert "paragraph 3, offset" in setup_prompts[0]
+
+def test_token_usage_counts_every_concurrent_call():
+    """Test that model calls finishing on many threads at once are all counted."""
+    before = get_token_usage()
+    response = LLMResponse("four words of text")
+    
+    def record():
+        for _ in range(500):
+            _log_token_usage("functional", 10, response)
+            
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+        
+    after = get_token_usage()
+    assert after["calls"] - before["calls"] == 4000
+    assert after["prompt_tokens"] - before["prompt_tokens"] == 40000
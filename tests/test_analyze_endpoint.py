@@ -5,6 +5,8 @@ import tempfile
 import shutil
 from unittest.mock import patch, MagicMock
 import json
+import threading
+import time
 
 from src.rag.api import app
 from src.rag.analyzer import analyze_beat, get_collection
@@ -68,7 +70,7 @@ def sample_beat():
 @pytest.fixture
 def mock_analyze_beat():
     """Mock the analyze_beat function to return a predictable result."""
-    with patch('src.rag.api.analyze_beat') as mock:
+    with patch('src.rag.api.analyze_beat_async') as mock:
         mock.return_value = {
             "flag": "The Catalyst lacks sufficient emotional impact",
             "explanation": "According to Save the Cat, the Catalyst should create a significant emotional reaction in the protagonist that forces them to consider change.",
@@ -128,7 +130,8 @@ def test_analyze_endpoint_success(mock_analyze_beat, sample_outline, sample_beat
     mock_analyze_beat.assert_called_once_with(
         outline=sample_outline,
         beat=sample_beat,
-        beat_type="Catalyst"
+        beat_type="Catalyst",
+        context_mode=None
     )
 
 def test_analyze_endpoint_missing_fields():
@@ -175,7 +178,8 @@ def test_analyze_endpoint_invalid_beat_type(mock_get_collection, mock_analyze_be
     mock_analyze_beat.assert_called_once_with(
         outline="Sample outline",
         beat="Sample beat",
-        beat_type="InvalidBeatType"
+        beat_type="InvalidBeatType",
+        context_mode=None
     )
 
 def test_analyze_endpoint_error_handling(mock_analyze_beat):
@@ -202,4 +206,180 @@ def test_analyze_endpoint_error_handling(mock_analyze_beat):
     
     # Verify the error message
     assert "detail" in data
-    assert "Test error" in data["detail"] 
\ No newline at end of file
+    assert "Test error" in data["detail"] 
+
+def _parse_sse(body):
+    """Split a Server-Sent Events body into (event, data) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_analyze_stream_endpoint(sample_outline, sample_beat):
+    """Test that /analyze/stream sends stage events, synthesis tokens and the final response."""
+    async def fake_stream(outline, beat, beat_type, context_mode, tier):
+        yield "started", {"id": "abc", "beat_type": beat_type}
+        yield "definition", {"result": "Catalyst definition", "seconds": 0.01}
+        yield "synthesis_token", {"text": "FLAG: Weak"}
+        yield "result", {"analysis": {"flag": "Weak", "explanation": "Why", "suggestions": ["Fix"]}}
+        
+    with patch('src.rag.api.analyze_beat_stream', fake_stream):
+        response = client.post("/analyze/stream", json={
+            "full_outline": sample_outline,
+            "designated_beat": sample_beat,
+            "beat_type": "Catalyst"
+        })
+        
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    
+    events = _parse_sse(response.text)
+    assert [name for name, _ in events] == ["started", "definition", "synthesis_token", "result"]
+    # The final event carries exactly the /analyze response body
+    assert events[-1][1] == {"analysis": {"flag": "Weak", "explanation": "Why", "suggestions": ["Fix"]}}
+
+def test_analyze_stream_endpoint_reports_errors_as_events():
+    """Test that failures after the stream starts are sent as an error event."""
+    async def failing_stream(outline, beat, beat_type, context_mode, tier):
+        yield "started", {"id": "abc", "beat_type": beat_type}
+        raise Exception("429 You exceeded your current quota")
+        
+    with patch('src.rag.api.analyze_beat_stream', failing_stream):
+        response = client.post("/analyze/stream", json={
+            "full_outline": "Sample outline",
+            "designated_beat": "Sample beat",
+            "beat_type": "Catalyst"
+        })
+        
+    events = _parse_sse(response.text)
+    assert events[-1] == ("error", {"status_code": 429, "detail": "API rate limit exceeded. Please try again later."})
+
+def test_analysis_job_lifecycle(mock_analyze_beat, sample_outline, sample_beat):
+    """Test that /analyze/jobs returns a job id at once and serves the result when done."""
+    mock_analyze_beat.return_value = {
+        "analysis": {"flag": "Weak", "explanation": "Why", "suggestions": ["Fix"]}
+    }
+    
+    with TestClient(app) as job_client:
+        response = job_client.post("/analyze/jobs", json={
+            "full_outline": sample_outline,
+            "designated_beat": sample_beat,
+            "beat_type": "Catalyst"
+        })
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        
+        for _ in range(100):
+            job = job_client.get(f"/analyze/jobs/{job_id}").json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(0.01)
+            
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"analysis": {"flag": "Weak", "explanation": "Why", "suggestions": ["Fix"]}}
+
+def test_unknown_analysis_job():
+    """Test that unknown or expired job ids are reported as 404."""
+    response = client.get("/analyze/jobs/does-not-exist")
+    
+    assert response.status_code == 404
+
+def test_analyze_endpoint_passes_tier(mock_analyze_beat, sample_outline, sample_beat):
+    """Test that the requested analysis tier reaches the pipeline and unknown tiers are rejected."""
+    mock_analyze_beat.return_value = {
+        "analysis": {"flag": "Weak", "explanation": "Why", "suggestions": ["Fix"]}
+    }
+    
+    response = client.post("/analyze", json={
+        "full_outline": sample_outline,
+        "designated_beat": sample_beat,
+        "beat_type": "Catalyst",
+        "tier": "fast"
+    })
+    
+    assert response.status_code == 200
+    assert mock_analyze_beat.call_args.kwargs["tier"] == "fast"
+    
+    response = client.post("/analyze", json={
+        "full_outline": sample_outline,
+        "designated_beat": sample_beat,
+        "beat_type": "Catalyst",
+        "tier": "instant"
+    })
+    
+    assert response.status_code == 422
+
+def test_metrics_endpoint_reports_stages_and_model_calls(sample_outline, sample_beat):
+    """Test that an analysis shows up in /metrics as stage latencies, model calls and tokens."""
+    from src.rag.llm_backend import FakeBackend
+    from src.rag.llm_cache import ResponseCache
+    
+    with patch('src.rag.analyzer.model', FakeBackend(latency_ms=0, latency_jitter_ms=0)), \
+         patch('src.rag.analyzer.response_cache', ResponseCache()), \
+         patch('src.rag.analyzer.stage_cache', None):
+        response = client.post("/analyze", json={
+            "full_outline": sample_outline,
+            "designated_beat": sample_beat,
+            "beat_type": "Catalyst"
+        })
+        assert response.status_code == 200
+        
+        response = client.get("/metrics")
+        
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE script_doctor_stage_seconds histogram" in lines
+    for stage in ("definition", "functional_analysis", "elements", "setup_analysis", "synthesis", "total"):
+        assert any(line.startswith(f'script_doctor_stage_seconds_count{{stage="{stage}"}}') for line in lines)
+    assert any(line.startswith('script_doctor_llm_requests_total{template="synthesis",status="ok"}') for line in lines)
+    assert any(line.startswith('script_doctor_llm_tokens_total{template="functional",direction="prompt"}') for line in lines)
+    assert 'script_doctor_cache_hit_ratio{cache="llm"} 0' in lines
+    assert any(line.startswith('script_doctor_http_request_seconds_count{method="POST",route="/analyze",status="200"}') for line in lines)
+    # The scrape itself is in flight while the metrics are rendered
+    assert "script_doctor_http_requests_in_flight 1" in lines
+
+def test_profiled_analysis_returns_summary_and_writes_artifact(tmp_path, sample_outline, sample_beat):
+    """Test that a profiling flag is ignored unless enabled and produces a profile when it is."""
+    from src.rag.llm_backend import FakeBackend
+    
+    payload = {"full_outline": sample_outline, "designated_beat": sample_beat, "beat_type": "Catalyst"}
+    with patch('src.rag.analyzer.model', FakeBackend(latency_ms=30, latency_jitter_ms=0)), \
+         patch('src.rag.analyzer.response_cache', None), \
+         patch('src.rag.analyzer.stage_cache', None), \
+         patch('src.config.config.Config.PROFILE_OUTPUT_DIR', str(tmp_path)):
+        response = client.post("/analyze", json=payload, headers={"X-Profile": "1"})
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+        
+        with patch('src.config.config.Config.PROFILING_ENABLED', True):
+            response = client.post("/analyze?profile=1", json=payload)
+            
+    assert response.status_code == 200
+    assert response.json()["analysis"]["flag"]
+    profile_id = response.headers["X-Profile-Id"]
+    assert response.headers["X-Profile-Artifact"] == os.path.join(str(tmp_path), f"{profile_id}.collapsed")
+    assert os.path.getsize(response.headers["X-Profile-Artifact"]) > 0
+    # The async path production uses is the one profiled, including time awaiting the model
+    assert "llm_backend.py:generate_content_async=" in response.headers["X-Profile-Summary"]
+
+def test_health_check_counts_off_the_event_loop():
+    """Test that /health queries ChromaDB on a worker thread, not on the event loop."""
+    threads = {}
+    
+    def count():
+        threads["count"] = threading.get_ident()
+        return 3
+        
+    def cache_stats():
+        threads["loop"] = threading.get_ident()
+        return {}
+        
+    with patch('src.rag.api.get_collection', return_value=MagicMock(count=count)), \
+         patch('src.rag.api.get_cache_stats', cache_stats):
+        response = client.get("/health")
+        
+    assert response.status_code == 200
+    assert response.json()["components"]["chromadb"] == "healthy"
+    assert threads["count"] != threads["loop"]
@@ -0,0 +1,68 @@
+import pytest
+import os
+from unittest.mock import patch, MagicMock
+
+from src.rag.beat_definitions import BeatDefinitionTable, normalize_beat_type
+
+BEATS_JSON = os.path.join(os.path.dirname(__file__), "..", "data", "save_the_cat", "beats.json")
+
+@pytest.fixture
+def framework_collection():
+    """Mock framework collection holding two beats and one fallback chunk."""
+    mock = MagicMock()
+    mock.get.return_value = {
+        'documents': [
+            'BEAT TYPE: Catalyst\n\nDEFINITION: The life-changing event.',
+            'BEAT TYPE: All Is Lost\n\nDEFINITION: The false defeat.',
+            'Unstructured text chunk',
+        ],
+        'metadatas': [
+            {'beat_type': 'Catalyst', 'index': 0},
+            {'beat_type': 'All Is Lost', 'index': 1},
+            {'beat_type': 'chunk_0', 'index': 2},
+        ]
+    }
+    return mock
+
+def test_normalize_beat_type():
+    """Test that case, spacing and punctuation do not affect lookups."""
+    assert normalize_beat_type("Break Into Two") == normalize_beat_type("break into two")
+    assert normalize_beat_type("Break-Into-Two") == normalize_beat_type("Break Into Two")
+    assert normalize_beat_type("Set-Up") == normalize_beat_type("Setup")
+    assert normalize_beat_type("All Is Lost") != normalize_beat_type("Dark Night of the Soul")
+
+def test_load_from_collection_uses_single_get(framework_collection):
+    """Test that the table is built from one metadata get and never runs a query."""
+    with patch('src.rag.beat_definitions.get_collection', return_value=framework_collection):
+        table = BeatDefinitionTable()
+        
+        assert table.get("catalyst").startswith("BEAT TYPE: Catalyst")
+        assert "false defeat" in table.get("ALL IS LOST")
+        assert table.get("chunk_0") is None
+        
+        # Subsequent lookups are dict accesses
+        table.get("Catalyst")
+        framework_collection.get.assert_called_once()
+        framework_collection.query.assert_not_called()
+
+def test_falls_back_to_json_when_collection_is_empty():
+    """Test that the beats JSON file is used when the collection has no beat metadata."""
+    empty = MagicMock()
+    empty.get.return_value = {'documents': [], 'metadatas': []}
+    
+    with patch('src.rag.beat_definitions.get_collection', return_value=empty):
+        table = BeatDefinitionTable(json_path=BEATS_JSON)
+        
+        assert "BEAT TYPE: Midpoint" in table.get("Midpoint")
+        assert table.stats()["definitions"] >= 15
+
+def test_invalidate_forces_reload(framework_collection):
+    """Test that invalidation makes the next lookup reload the definitions."""
+    with patch('src.rag.beat_definitions.get_collection', return_value=framework_collection):
+        table = BeatDefinitionTable()
+        table.get("Catalyst")
+        table.invalidate()
+        
+        assert not table.is_loaded()
+        table.get("Catalyst")
+        assert framework_collection.get.call_count == 2
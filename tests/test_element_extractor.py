@@ -0,0 +1,51 @@
+import pytest
+import os
+import time
+
+from src.rag.element_extractor import extract_elements
+
+OUTLINE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "uat_samples", "well_structured_outline.txt")
+
+@pytest.fixture
+def outline():
+    with open(OUTLINE_PATH, "r") as f:
+        return f.read()
+
+def _beat(outline, label):
+    return next(p for p in outline.split("\n\n") if p.startswith(label + ":"))
+
+def test_extracts_names_and_shared_objects(outline):
+    """Test that characters, places and objects mentioned elsewhere in the outline are found."""
+    elements = extract_elements(_beat(outline, "CATALYST"), outline)
+    
+    assert elements[:2] == ["Sarah", "Maine"]
+    assert "letter" in elements
+    assert "Catalyst" not in elements
+    assert len(elements) <= 5
+
+def test_sentence_initial_words_are_not_names():
+    """Test that capitalized sentence openers are only names when never used in lowercase."""
+    beat = "Initially Sarah hesitates. Rachel calls. Sarah finds the sketchbook and keeps the sketchbook. Dr. Nathan Park waits."
+    outline = "They initially agree. " + beat
+    
+    elements = extract_elements(beat, outline)
+    
+    assert "Initially" not in elements
+    assert {"Sarah", "Rachel", "Dr Nathan Park", "sketchbook"} <= set(elements)
+
+def test_unsupported_phrases_are_dropped():
+    """Test that noun phrases neither repeated in the beat nor found in the outline are skipped."""
+    assert extract_elements("Sarah opens a door.", "Sarah opens a door.") == ["Sarah"]
+    assert extract_elements("", "") == []
+
+def test_extraction_is_fast_on_long_outlines(outline):
+    """Test that extraction stays in the low milliseconds on an outline far larger than the samples."""
+    long_outline = outline * 10
+    beat = _beat(outline, "CATALYST")
+    
+    start = time.perf_counter()
+    for _ in range(10):
+        extract_elements(beat, long_outline)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / 10
+    
+    assert elapsed_ms < 50
@@ -11,6 +11,7 @@ import google.generativeai as genai
 from src.rag.api import app
 from src.rag.analyzer import analyze_beat, get_collection, get_beat_definition
 from src.rag.vector_store import VectorStore
+from src.rag.beat_definitions import BeatDefinitionTable
 
 # Create a TestClient instance
 client = TestClient(app)
@@ -55,7 +56,7 @@ def mock_vector_store(mock_collection):
 @pytest.fixture
 def mock_analyze_beat():
     """Mock the analyze_beat function."""
-    with patch('src.rag.api.analyze_beat') as mock:
+    with patch('src.rag.api.analyze_beat_async') as mock:
         mock.return_value = {
             "flag": "Test flag",
             "explanation": "Test explanation",
@@ -108,6 +109,20 @@ def test_api_rate_limiting(mock_vector_store, mock_analyze_beat):
     data = response.json()
     assert "rate limit exceeded" in data["detail"].lower()
 
+def test_prompt_too_large(mock_vector_store, mock_analyze_beat):
+    """Test that prompts over the model limit are reported as 413."""
+    from src.rag.token_budget import PromptTooLargeError
+    mock_analyze_beat.side_effect = PromptTooLargeError("Prompt for functional:v1 is too large")
+    
+    response = client.post("/analyze", json={
+        "full_outline": "Sample outline",
+        "designated_beat": "Sample beat",
+        "beat_type": "Catalyst"
+    })
+    
+    assert response.status_code == 413
+    assert "too large" in response.json()["detail"]
+
 def test_chromadb_connection_failures():
     """Test handling of ChromaDB connection failures."""
     # Mock ChromaDB to simulate connection failure
@@ -125,23 +140,20 @@ def test_chromadb_connection_failures():
         assert "Connection failed" in data["detail"]
 
 def test_collection_not_found():
-    """Test handling of non-existent ChromaDB collection."""
+    """Test that a missing framework collection falls back to the beats JSON file."""
     with patch('src.rag.vector_store.VectorStore.get_collection') as mock_get_collection:
         mock_get_collection.side_effect = NotFoundError("Collection not found")
         
-        response = client.post("/analyze", json={
-            "full_outline": "Sample outline",
-            "designated_beat": "Sample beat",
-            "beat_type": "Catalyst"
-        })
+        table = BeatDefinitionTable()
+        definition = table.get("Catalyst")
         
-        assert response.status_code == 500
-        data = response.json()
-        assert "Collection not found" in data["detail"]
+        assert definition is not None
+        assert "BEAT TYPE: Catalyst" in definition
+        assert table.stats()["source"].startswith("json:")
 
 def test_malformed_gemini_response(mock_vector_store):
     """Test handling of malformed Gemini API responses."""
-    with patch('google.generativeai.GenerativeModel.generate_content') as mock_genai:
+    with patch('google.generativeai.GenerativeModel.generate_content_async') as mock_genai:
         # Mock a malformed response
         mock_response = MagicMock()
         mock_response.text = None  # Simulating missing text in response
@@ -0,0 +1,143 @@
+import pytest
+import asyncio
+from unittest.mock import patch
+
+from src.rag.jobs import JobQueue, JobQueueFullError
+
+async def _wait_for(queue, job_id, statuses=("succeeded", "failed"), timeout=1.0):
+    """Poll a job until it reaches one of the given statuses."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while queue.get(job_id).status not in statuses:
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.005)
+    return queue.get(job_id)
+
+def test_jobs_run_in_background():
+    """Test that submit returns at once and the worker stores the result."""
+    async def handler(payload):
+        await asyncio.sleep(0.02)
+        return payload * 2
+        
+    async def run():
+        queue = JobQueue(handler, workers=2)
+        job = queue.submit(21)
+        assert job.status == "queued"
+        finished = await _wait_for(queue, job.id)
+        await queue.stop()
+        return finished
+        
+    job = asyncio.run(run())
+    
+    assert job.status == "succeeded"
+    assert job.result == 42
+    assert job.started_at >= job.created_at
+    assert job.finished_at >= job.started_at
+
+def test_failed_jobs_keep_their_error():
+    """Test that a handler exception marks the job failed without stopping the worker."""
+    async def handler(payload):
+        if payload == "bad":
+            raise ValueError("bad input")
+        return "ok"
+        
+    async def run():
+        queue = JobQueue(handler, workers=1)
+        bad = queue.submit("bad")
+        good = queue.submit("good")
+        results = await _wait_for(queue, bad.id), await _wait_for(queue, good.id)
+        stats = queue.stats()
+        await queue.stop()
+        return results, stats
+        
+    (bad, good), stats = asyncio.run(run())
+    
+    assert bad.status == "failed"
+    assert isinstance(bad.error, ValueError)
+    assert good.status == "succeeded"
+    assert stats["succeeded"] == 1 and stats["failed"] == 1
+
+def test_queue_is_bounded():
+    """Test that submissions beyond the queue capacity are rejected."""
+    release = None
+    
+    async def handler(payload):
+        await release.wait()
+        
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        queue = JobQueue(handler, workers=1, max_queue=1)
+        queue.submit(1)
+        await asyncio.sleep(0.01)  # the worker picks up the first job
+        queue.submit(2)
+        with pytest.raises(JobQueueFullError):
+            queue.submit(3)
+        stats = queue.stats()
+        release.set()
+        await queue.stop()
+        return stats
+        
+    stats = asyncio.run(run())
+    
+    assert stats["queue_depth"] == 1
+    assert stats["running"] == 1
+    assert stats["rejected"] == 1
+
+def test_finished_jobs_expire():
+    """Test that results are dropped once their TTL has passed."""
+    async def handler(payload):
+        return payload
+        
+    async def run():
+        queue = JobQueue(handler, result_ttl=60)
+        job = queue.submit("x")
+        await _wait_for(queue, job.id)
+        with patch('src.rag.jobs.time.time', return_value=job.finished_at + 61):
+            expired = queue.get(job.id)
+            stats = queue.stats()
+        await queue.stop()
+        return expired, stats
+        
+    expired, stats = asyncio.run(run())
+    
+    assert expired is None
+    assert stats["expired"] == 1
+
+def test_restart_defers_jobs_beyond_queue_capacity():
+    """Test that more carried-over jobs than the queue holds are run in order instead of failing start."""
+    release = None
+    finished = []
+    
+    async def handler(payload):
+        await release.wait()
+        finished.append(payload)
+        
+    async def first_loop(queue):
+        nonlocal release
+        release = asyncio.Event()
+        jobs = [queue.submit(1)]
+        await asyncio.sleep(0.01)  # the worker picks up the first job
+        jobs += [queue.submit(2), queue.submit(3)]
+        await queue.stop()
+        return jobs
+        
+    async def second_loop(queue, jobs):
+        nonlocal release
+        release = asyncio.Event()
+        queue.start()
+        stats = queue.stats()
+        with pytest.raises(JobQueueFullError):
+            queue.submit(4)
+        release.set()
+        for job in jobs:
+            await _wait_for(queue, job.id)
+        await queue.stop()
+        return stats
+        
+    queue = JobQueue(handler, workers=1, max_queue=2)
+    jobs = asyncio.run(first_loop(queue))
+    stats = asyncio.run(second_loop(queue, jobs))
+    
+    # The interrupted job and both waiting ones are requeued, one more than fits
+    assert stats["queue_depth"] == 3
+    assert finished == [1, 2, 3]
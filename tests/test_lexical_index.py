@@ -0,0 +1,128 @@
+import pytest
+from unittest.mock import patch
+
+from src.rag.lexical_index import BM25Index, matches, reciprocal_rank_fusion
+from src.rag.vector_store import VectorStore, IN_MEMORY, reset_clients
+
+@pytest.fixture
+def index():
+    """Index over a few outline paragraphs with chunk metadata."""
+    index = BM25Index()
+    index.add(
+        ["c0", "c1", "c2", "c3"],
+        [
+            "Sarah's red bicycle leans against the garage.",
+            "Sarah argues with her father about the move.",
+            "The family packs the truck in silence.",
+            "Sarah rides the red bicycle to the lake one last time.",
+        ],
+        [{"chunk_index": i, "outline_id": "abc"} for i in range(4)]
+    )
+    return index
+
+def test_exact_names_rank_the_chunks_that_mention_them(index):
+    """Test that BM25 ranks the chunks containing the query terms, best match first."""
+    result = index.search("the red bicycle", n_results=3)
+    
+    assert result["ids"] == [["c0", "c3"]]
+    assert result["distances"][0][0] <= result["distances"][0][1]
+    assert index.search("Sarah's bicycle")["ids"][0][0] in ("c0", "c3")
+    assert index.search("spaceship")["ids"] == [[]]
+
+def test_where_filters_follow_chromadb_semantics(index):
+    """Test that the same filters as the vector search restrict lexical results."""
+    where = {"$and": [{"outline_id": "abc"}, {"end": {"$lte": 100}}]}
+    assert not matches({"outline_id": "abc"}, where)
+    assert matches({"outline_id": "abc", "end": 80}, where)
+    assert matches({"beat_type": "Catalyst"}, {"beat_type": {"$in": ["Catalyst", "Debate"]}})
+    
+    result = index.search("Sarah bicycle", n_results=5, where={"chunk_index": {"$lt": 3}})
+    assert "c3" not in result["ids"][0]
+    assert result["ids"][0][0] == "c0"
+
+def test_removed_and_replaced_documents_leave_the_index(index):
+    """Test that removal drops a document's postings and re-adding an ID replaces it."""
+    index.remove(["c0"])
+    index.add(["c3"], ["The lake is calm."], [{"chunk_index": 3}])
+    
+    assert len(index) == 3
+    assert index.search("bicycle")["ids"] == [[]]
+    assert index.search("lake")["ids"] == [["c3"]]
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """Test that a document found by both rankings outranks one found by either alone."""
+    def ranking(ids):
+        return {"ids": [ids], "documents": [[f"doc {i}" for i in ids]], "metadatas": [[{"id": i} for i in ids]]}
+        
+    fused = reciprocal_rank_fusion([ranking(["a", "b"]), ranking(["c", "b"])], n_results=2, k=60)
+    
+    assert fused["ids"][0][0] == "b"
+    assert fused["metadatas"][0][0] == {"id": "b"}
+    assert 0.0 <= fused["distances"][0][0] < fused["distances"][0][1] < 1.0
+
+def test_vector_store_keeps_lexical_index_in_step():
+    """Test that the lexical index is built with the collection and follows adds and deletes."""
+    store = VectorStore(IN_MEMORY)
+    store.create_collection("framework")
+    try:
+        store.add_documents("framework", ["The Catalyst is the call to adventure."], ["catalyst"], [{"beat_type": "Catalyst"}])
+        store.delete_documents("framework", ["catalyst"])
+        store.add_documents("framework", ["The Midpoint raises the stakes."], ["midpoint"], [{"beat_type": "Midpoint"}])
+        
+        (result,) = store.lexical_query_many("framework", [{"query_text": "stakes", "n_results": 1}])
+        assert result["ids"] == [["midpoint"]]
+        assert store.lexical_query_many("framework", [{"query_text": "adventure"}])[0]["ids"] == [[]]
+        
+        # A collection written outside this process gets its index built on first use
+        store.client.create_collection("existing").add(documents=["Finale."], ids=["finale"])
+        assert len(store.lexical_index("existing")) == 1
+        assert store.lexical_index("existing") is store.lexical_index("existing")
+    finally:
+        reset_clients(IN_MEMORY)
+
+def test_lexical_index_follows_writes_through_the_collection_handle():
+    """Test that writes made on the collection handle, not through VectorStore, reach the index."""
+    store = VectorStore(IN_MEMORY)
+    collection = store.create_collection("outlines")
+    try:
+        store.add_documents("outlines", ["John finds the compass."], ["a_chunk_0"], [{"outline_id": "a", "last_used_at": 1.0}])
+        collection.add(documents=["Mary hides the lantern."], ids=["b_chunk_0"], metadatas=[{"outline_id": "b"}])
+        
+        assert store.lexical_query_many("outlines", [{"query_text": "lantern"}])[0]["ids"] == [["b_chunk_0"]]
+        
+        store.update_metadatas("outlines", ["a_chunk_0"], [{"outline_id": "a", "last_used_at": 2.0}])
+        result = store.lexical_query_many("outlines", [{"query_text": "compass", "where": {"last_used_at": {"$gt": 1.5}}}])[0]
+        assert result["ids"] == [["a_chunk_0"]]
+        
+        # A delete by filter cannot be mirrored: the index is dropped and rebuilt
+        collection.delete(where={"outline_id": "b"})
+        assert store.lexical_query_many("outlines", [{"query_text": "lantern"}])[0]["ids"] == [[]]
+    finally:
+        reset_clients(IN_MEMORY)
+
+def test_lexical_queries_do_not_count_the_collection():
+    """Test that a registered index is used as is, with no collection call per query."""
+    store = VectorStore(IN_MEMORY)
+    collection = store.get_or_create_collection("framework")
+    try:
+        collection.add(documents=["The Catalyst is the call to adventure."], ids=["catalyst"])
+        with patch.object(collection._collection, "count", side_effect=AssertionError("count")), \
+             patch.object(collection._collection, "get", side_effect=AssertionError("get")):
+            result = store.lexical_query_many("framework", [{"query_text": "adventure"}])[0]
+        assert result["ids"] == [["catalyst"]]
+    finally:
+        reset_clients(IN_MEMORY)
+
+def test_sync_adds_chunks_written_by_another_process():
+    """Test that chunks written around the handle (as by another worker process) are added on sync."""
+    store = VectorStore(IN_MEMORY)
+    store.create_collection("outlines")
+    try:
+        store.client.get_collection("outlines").add(documents=["Mary hides the lantern."], ids=["b_chunk_0"])
+        assert store.lexical_query_many("outlines", [{"query_text": "lantern"}])[0]["ids"] == [[]]
+        
+        assert store.sync_lexical_index("outlines", ["b_chunk_0"]) == 1
+        assert store.sync_lexical_index("outlines", ["b_chunk_0"]) == 0
+        assert store.lexical_query_many("outlines", [{"query_text": "lantern"}])[0]["ids"] == [["b_chunk_0"]]
+    finally:
+        reset_clients(IN_MEMORY)
@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+import time
+from unittest.mock import patch
+
+from src.rag.llm_backend import FakeBackend, GeminiBackend, create_backend, FAKE_SYNTHESIS_TEXT
+
+def test_fake_backend_returns_canned_text_per_stage():
+    """Test that the fake backend answers each stage's prompt in the format the stage expects."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0)
+    
+    synthesis = backend.generate_content("Your response MUST include these EXACT headings (FLAG, EXPLAIN, SUGGEST)")
+    elements = backend.generate_content("Format your response as a simple bullet point list")
+    
+    assert synthesis.text == FAKE_SYNTHESIS_TEXT
+    assert elements.text.startswith("- ")
+    assert backend.calls == 2
+
+def test_fake_backend_injects_rate_limits_and_errors():
+    """Test that injected failures look like Gemini quota and server errors."""
+    with pytest.raises(Exception, match="429"):
+        FakeBackend(latency_ms=0, latency_jitter_ms=0, rate_limit_rate=1.0).generate_content("prompt")
+        
+    with pytest.raises(Exception, match="500"):
+        FakeBackend(latency_ms=0, latency_jitter_ms=0, error_rate=1.0).generate_content("prompt")
+
+def test_fake_backend_is_reproducible_with_seed():
+    """Test that the same seed gives the same sequence of failures."""
+    def outcomes(seed):
+        backend = FakeBackend(latency_ms=0, latency_jitter_ms=0, error_rate=0.5, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                backend.generate_content("prompt")
+                results.append("ok")
+            except Exception:
+                results.append("error")
+        return results
+        
+    assert outcomes(7) == outcomes(7)
+    assert "ok" in outcomes(7) and "error" in outcomes(7)
+
+def test_fake_backend_async_latency_overlaps():
+    """Test that concurrent async calls share the simulated latency instead of queueing."""
+    backend = FakeBackend(latency_ms=100, latency_jitter_ms=0)
+    
+    async def run():
+        return await asyncio.gather(*(backend.generate_content_async("prompt") for _ in range(10)))
+        
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    
+    assert len(responses) == 10
+    assert time.perf_counter() - start < 0.5
+
+def test_fake_backend_streams_chunks():
+    """Test that a streamed response reassembles into the full canned text."""
+    backend = FakeBackend(latency_ms=0, latency_jitter_ms=0, stream_chunks=3)
+    
+    async def run():
+        stream = await backend.generate_content_async("(FLAG, EXPLAIN, SUGGEST)", stream=True)
+        return [chunk.text async for chunk in stream]
+        
+    chunks = asyncio.run(run())
+    
+    assert len(chunks) == 3
+    assert "".join(chunks) == FAKE_SYNTHESIS_TEXT
+
+def test_gemini_backend_requires_key_on_first_call():
+    """Test that a missing API key is reported by the first call, not at construction."""
+    with patch.dict('os.environ', {}, clear=True):
+        backend = GeminiBackend()
+        with pytest.raises(ValueError, match="API key"):
+            backend.generate_content("prompt")
+
+def test_create_backend():
+    """Test backend selection by name."""
+    assert isinstance(create_backend("fake"), FakeBackend)
+    assert isinstance(create_backend("gemini"), GeminiBackend)
+    
+    with pytest.raises(ValueError, match="Unknown LLM backend"):
+        create_backend("other")
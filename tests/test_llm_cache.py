@@ -0,0 +1,104 @@
+import pytest
+import os
+import tempfile
+import time
+
+from src.rag.llm_cache import ResponseCache
+
+@pytest.fixture
+def cache_path():
+    """Temporary SQLite file for the disk tier."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield os.path.join(temp_dir, "llm_cache.sqlite")
+
+def test_key_depends_on_model_template_and_prompt():
+    """Test that any change to model, template version or prompt changes the key."""
+    key = ResponseCache.make_key("gemini", "functional:v1", "prompt")
+    
+    assert key == ResponseCache.make_key("gemini", "functional:v1", "prompt")
+    assert key != ResponseCache.make_key("gemini-pro", "functional:v1", "prompt")
+    assert key != ResponseCache.make_key("gemini", "functional:v2", "prompt")
+    assert key != ResponseCache.make_key("gemini", "functional:v1", "prompt!")
+
+def test_memory_tier_hits_and_misses():
+    """Test hit/miss counting on the in-memory tier."""
+    cache = ResponseCache()
+    
+    assert cache.get("k") is None
+    cache.set("k", "cached text")
+    assert cache.get("k") == "cached text"
+    
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+def test_memory_tier_is_lru():
+    """Test that the least recently used entry is evicted first."""
+    cache = ResponseCache(max_memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_disk_tier_survives_restart(cache_path):
+    """Test that responses persist on disk and are served by a new cache instance."""
+    ResponseCache(path=cache_path).set("k", "persisted")
+    
+    cache = ResponseCache(path=cache_path)
+    assert cache.get("k") == "persisted"
+    assert cache.stats()["disk_hits"] == 1
+    
+    # Promoted to the memory tier after the first disk hit
+    assert cache.get("k") == "persisted"
+    assert cache.stats()["memory_hits"] == 1
+
+def test_ttl_expiry(cache_path):
+    """Test that expired entries are treated as misses in both tiers."""
+    cache = ResponseCache(path=cache_path, ttl_seconds=0.05)
+    cache.set("k", "short lived")
+    time.sleep(0.1)
+    
+    assert cache.get("k") is None
+    assert cache.stats()["disk_entries"] == 0
+
+def test_disk_size_limit_evicts_least_recently_used(cache_path):
+    """Test that the disk tier stays under its byte budget."""
+    cache = ResponseCache(path=cache_path, max_memory_entries=1, max_disk_bytes=25)
+    cache.set("a", "x" * 10)
+    time.sleep(0.01)
+    cache.set("b", "y" * 10)
+    time.sleep(0.01)
+    cache.set("c", "z" * 10)
+    
+    assert cache.stats()["disk_entries"] == 2
+    assert cache.get("a") is None
+    assert cache.get("c") == "z" * 10
+
+def test_disk_size_is_tracked_across_replace_and_restart(cache_path):
+    """Test that the running byte total follows replaced entries and is restored on open."""
+    cache = ResponseCache(path=cache_path)
+    cache.set("a", "x" * 10)
+    cache.set("a", "x" * 4)
+    cache.set("b", "y" * 6)
+    assert cache.stats()["disk_bytes"] == 10
+    
+    assert ResponseCache(path=cache_path).stats()["disk_bytes"] == 10
+
+def test_disk_hit_refreshes_recency_on_next_write(cache_path):
+    """Test that a read entry survives eviction even though its access time is written lazily."""
+    ResponseCache(path=cache_path).set("a", "x" * 10)
+    time.sleep(0.01)
+    ResponseCache(path=cache_path).set("b", "y" * 10)
+    
+    cache = ResponseCache(path=cache_path, max_memory_entries=1, max_disk_bytes=25)
+    time.sleep(0.01)
+    assert cache.get("a") == "x" * 10
+    cache.set("c", "z" * 10)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
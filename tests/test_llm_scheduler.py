@@ -0,0 +1,185 @@
+import pytest
+import asyncio
+import threading
+import time
+
+from src.rag.llm_scheduler import LLMScheduler, SchedulerOverloadedError, TokenBucket, is_rate_limit_error
+
+def _scheduler(**kwargs):
+    """Scheduler with no rate limit and instant backoff unless overridden."""
+    options = dict(requests_per_minute=60000, burst=1000, backoff_base=0.0, backoff_max=0.0)
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    """Test that the bucket serves its burst immediately and then waits per token."""
+    bucket = TokenBucket(rate_per_second=10, capacity=2)
+    
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.02)
+
+def test_rate_limited_calls_are_retried():
+    """Test that 429s are retried with backoff and shrink the concurrency limit."""
+    scheduler = _scheduler(max_concurrency=8)
+    attempts = []
+    
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        return "ok"
+        
+    assert scheduler.call(flaky) == "ok"
+    
+    stats = scheduler.stats()
+    assert stats["retries"] == 2
+    assert stats["rate_limited"] == 2
+    # Two 429s within the cooldown count as one decrease
+    assert stats["concurrency_limit"] < 8
+    assert stats["concurrency_limit"] >= 4
+
+def test_other_errors_and_exhausted_retries_are_raised():
+    """Test that non-rate-limit errors are not retried and retries are bounded."""
+    scheduler = _scheduler(max_retries=2)
+    calls = []
+    
+    def broken():
+        calls.append(1)
+        raise RuntimeError("500 internal")
+        
+    with pytest.raises(RuntimeError):
+        scheduler.call(broken)
+    assert len(calls) == 1
+    
+    def limited():
+        calls.append(1)
+        raise Exception("429 quota")
+        
+    with pytest.raises(Exception, match="429"):
+        scheduler.call(limited)
+    assert len(calls) == 1 + 3
+    assert scheduler.stats()["in_flight"] == 0
+
+def test_limit_grows_back_after_successes():
+    """Test additive increase of the concurrency limit once 429s stop."""
+    scheduler = _scheduler(max_concurrency=4, max_retries=0)
+    
+    with pytest.raises(Exception):
+        scheduler.call(lambda: (_ for _ in ()).throw(Exception("429 quota")))
+    assert scheduler.stats()["concurrency_limit"] == 2
+    
+    for _ in range(10):
+        scheduler.call(lambda: None)
+    assert scheduler.stats()["concurrency_limit"] == 4
+
+def test_full_queue_is_rejected():
+    """Test that callers beyond the wait queue are rejected with a rate-limit error."""
+    scheduler = _scheduler(max_concurrency=1, max_queue=0)
+    started = threading.Event()
+    release = threading.Event()
+    
+    def hold():
+        started.set()
+        release.wait(1)
+        
+    worker = threading.Thread(target=scheduler.call, args=(hold,))
+    worker.start()
+    started.wait(1)
+    
+    with pytest.raises(SchedulerOverloadedError, match="Rate limit exceeded"):
+        scheduler.call(lambda: None)
+        
+    release.set()
+    worker.join()
+    assert scheduler.stats()["rejected"] == 1
+
+def test_async_calls_respect_concurrency_limit():
+    """Test that queued async calls wait for a slot and report their wait time."""
+    scheduler = _scheduler(max_concurrency=2)
+    active = []
+    peak = []
+    
+    async def work():
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.05)
+        active.pop()
+        return "done"
+        
+    async def run():
+        return await asyncio.gather(*(scheduler.call_async(work) for _ in range(6)))
+        
+    results = asyncio.run(run())
+    stats = scheduler.stats()
+    
+    assert results == ["done"] * 6
+    assert max(peak) == 2
+    assert stats["queue_depth"] == 0
+    assert stats["completed"] == 6
+    assert stats["wait_seconds_max"] >= 0.09
+
+def test_stream_holds_slot_until_drained_or_closed():
+    """Test that a streamed call keeps its slot while the consumer reads it."""
+    scheduler = _scheduler(max_concurrency=1)
+    
+    async def chunks():
+        for text in ("a", "b", "c"):
+            yield text
+            
+    async def open_stream():
+        return chunks()
+        
+    async def run():
+        stream = scheduler.stream_async(open_stream)
+        first = await stream.__anext__()
+        in_flight = scheduler.stats()["in_flight"]
+        await stream.aclose()
+        drained = [chunk async for chunk in scheduler.stream_async(open_stream)]
+        return first, in_flight, drained
+        
+    first, in_flight, drained = asyncio.run(run())
+    
+    assert first == "a"
+    assert in_flight == 1
+    assert drained == ["a", "b", "c"]
+    assert scheduler.stats()["in_flight"] == 0
+    assert scheduler.stats()["completed"] == 1
+
+def test_stream_rate_limits_are_retried_only_before_the_first_chunk():
+    """Test that a 429 is retried before any output but only accounted once chunks were sent."""
+    scheduler = _scheduler(max_concurrency=8)
+    opened = []
+    
+    async def chunks(fail_after):
+        for i, text in enumerate(("a", "b")):
+            if i == fail_after:
+                raise Exception("429 quota")
+            yield text
+            
+    async def open_stream(failures):
+        opened.append(1)
+        return chunks(failures.pop(0) if failures else None)
+        
+    async def collect(failures):
+        return [chunk async for chunk in scheduler.stream_async(open_stream, failures)]
+        
+    assert asyncio.run(collect([0])) == ["a", "b"]
+    assert len(opened) == 2
+    assert scheduler.stats()["retries"] == 1
+    
+    with pytest.raises(Exception, match="429"):
+        asyncio.run(collect([1]))
+    stats = scheduler.stats()
+    assert len(opened) == 3
+    assert stats["retries"] == 1
+    assert stats["rate_limited"] == 2
+    assert stats["concurrency_limit"] < 8
+    assert stats["in_flight"] == 0
+
+def test_is_rate_limit_error():
+    """Test detection of Gemini quota errors."""
+    assert is_rate_limit_error(Exception("429 Too Many Requests"))
+    assert is_rate_limit_error(Exception("You exceeded your current quota"))
+    assert not is_rate_limit_error(Exception("500 internal"))
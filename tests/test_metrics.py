@@ -0,0 +1,72 @@
+import pytest
+import threading
+
+from src.rag.metrics import MetricsRegistry
+
+def test_histogram_renders_cumulative_buckets():
+    """Test that observations land in cumulative buckets with sum and count."""
+    registry = MetricsRegistry()
+    latency = registry.histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0))
+    
+    latency.observe(0.05, stage="synthesis")
+    latency.observe(0.5, stage="synthesis")
+    latency.observe(3.0, stage="synthesis")
+    
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP stage_seconds Stage latency", "# TYPE stage_seconds histogram"]
+    assert lines[2:] == [
+        'stage_seconds_bucket{stage="synthesis",le="0.1"} 1',
+        'stage_seconds_bucket{stage="synthesis",le="1"} 2',
+        'stage_seconds_bucket{stage="synthesis",le="+Inf"} 3',
+        'stage_seconds_sum{stage="synthesis"} 3.55',
+        'stage_seconds_count{stage="synthesis"} 3',
+    ]
+
+def test_counters_gauges_and_collectors():
+    """Test labelled counters, gauges, escaping and scrape-time collectors."""
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls", ["status"])
+    in_flight = registry.gauge("in_flight", "In flight")
+    registry.add_collector(lambda: [("cache_hit_ratio", "gauge", "Hit ratio", {"cache": 'say "hi"'}, 0.25)])
+    registry.add_collector(lambda: 1 / 0)
+    
+    calls.inc(status="ok")
+    calls.inc(2, status="error")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    
+    output = registry.render()
+    assert 'calls_total{status="error"} 2\ncalls_total{status="ok"} 1\n' in output
+    assert "in_flight 1\n" in output
+    # A failing collector is skipped without hiding the other metrics
+    assert 'cache_hit_ratio{cache="say \\"hi\\""} 0.25\n' in output
+    
+    with pytest.raises(ValueError):
+        calls.inc(outcome="ok")
+
+def test_registering_twice_returns_the_same_metric():
+    """Test that re-registering a metric reuses it and conflicting types are rejected."""
+    registry = MetricsRegistry()
+    first = registry.counter("calls_total", "Calls", ["status"])
+    
+    assert registry.counter("calls_total", "Calls", ["status"]) is first
+    with pytest.raises(ValueError):
+        registry.gauge("calls_total", "Calls", ["status"])
+
+def test_concurrent_observations_are_not_lost():
+    """Test that recording from many threads keeps exact counts."""
+    registry = MetricsRegistry()
+    latency = registry.histogram("seconds", "Latency", ["stage"])
+    
+    def record():
+        for _ in range(1000):
+            latency.observe(0.01, stage="elements")
+            
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+        
+    assert latency.count(stage="elements") == 8000
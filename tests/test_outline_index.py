@@ -0,0 +1,66 @@
+import pytest
+
+from src.rag.outline_index import OutlineIndex, element_terms, get_outline_index, locate_beat, outline_through_beat
+
+OUTLINE = """ACT ONE
+          
+OPENING IMAGE: Sarah's studio sits empty. Her easel is covered.
+          
+SETUP: Sarah works at the office. Rachel visits the studio.
+          
+CATALYST: A letter from the art school arrives for Sarah.
+          
+DEBATE: Sarah rereads the letter."""
+
+def test_postings_map_terms_to_paragraphs_and_offsets():
+    """Test that each term maps to every paragraph and offset where it occurs."""
+    index = OutlineIndex(OUTLINE)
+    
+    assert [paragraph for paragraph, _ in index.postings["sarah"]] == [1, 2, 3, 4]
+    for paragraph, offset in index.postings["studio"]:
+        assert OUTLINE[offset:offset + 6] == "studio"
+        assert index.paragraph_of(offset) == paragraph
+
+def test_mentions_before_the_beat():
+    """Test full and partial mentions limited to the text before an offset."""
+    index = OutlineIndex(OUTLINE)
+    beat_offset = index.locate("A letter from the art school arrives for Sarah.")
+    
+    assert index.mentions("Sarah's studio", before=beat_offset)["paragraphs"] == [
+        {"paragraph": 1, "offset": OUTLINE.index("Sarah")},
+        {"paragraph": 2, "offset": OUTLINE.index("Sarah works")},
+    ]
+    assert index.mentions("The letter", before=beat_offset)["paragraphs"] == []
+    assert [m["paragraph"] for m in index.mentions("Rachel's easel", before=beat_offset)["partial"]] == [1, 2]
+
+def test_locate_and_terms():
+    """Test beat lookup and element normalization."""
+    index = OutlineIndex(OUTLINE)
+    
+    assert index.locate("Not in the outline") is None
+    assert index.locate("  DEBATE: Sarah rereads the letter.\n") == OUTLINE.index("DEBATE")
+    assert element_terms("The protagonist's routine") == ["protagonist", "routine"]
+
+def test_locate_beat_tolerates_whitespace_and_edited_later_lines():
+    """Test that a beat is found whatever its line wrapping, or by its first line."""
+    outline = "John waits.\n\nThe  letter\narrives."
+    
+    assert locate_beat(outline, "The letter arrives.") == 13
+    assert locate_beat(" ".join(outline.split()), "The letter\n  arrives.") == 12
+    assert locate_beat(outline, "The letter\nEdited later line.") == 13
+    assert locate_beat(outline, "FADE OUT.") is None
+    assert locate_beat(outline, "   ") is None
+
+def test_repeated_first_line_does_not_place_the_beat():
+    """Test that an edited beat whose first line the outline repeats is not placed at an earlier occurrence."""
+    outline = "INT. OFFICE - DAY\nJohn files reports.\n\nINT. OFFICE - DAY\nJohn opens the letter."
+    beat = "INT. OFFICE - DAY\nJohn opens the letter slowly."
+    
+    assert locate_beat(outline, beat) is None
+    assert outline_through_beat(outline, beat) == outline
+    # The exact beat is still found at its own occurrence
+    assert locate_beat(outline, "INT. OFFICE - DAY\nJohn opens the letter.") == outline.rindex("INT.")
+
+def test_index_is_built_once_per_outline():
+    """Test that the same outline reuses its index."""
+    assert get_outline_index(OUTLINE) is get_outline_index(OUTLINE)
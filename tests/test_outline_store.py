@@ -0,0 +1,205 @@
+import pytest
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+from src.rag.outline_store import (
+    outline_collection,
+    outline_filter,
+    outline_content_id,
+    store_outline_chunks,
+    chunk_offsets,
+    flatten_text,
+    trim_to_offset,
+    find_outline,
+    touch_outline,
+    sweep_outline_indexes,
+    migrate_outline_collections,
+    OutlineIndexSweeper
+)
+
+def _legacy_collection(outline_id, chunks):
+    """Mock outline_<id> collection holding chunks with their embeddings."""
+    collection = MagicMock()
+    collection.metadata = {"type": "screenplay_outline", "id": outline_id}
+    collection.get.return_value = {
+        "ids": [f"{outline_id}_chunk_{i}" for i in range(len(chunks))],
+        "documents": chunks,
+        "metadatas": [{"chunk_index": i} for i in range(len(chunks))],
+        "embeddings": [[0.1 * i, 0.2] for i in range(len(chunks))],
+    }
+    return collection
+
+def test_shared_mode_filters_by_outline_id():
+    """Test the collection and filter an outline's chunks are found under in each mode."""
+    assert outline_collection("abc") == "outlines"
+    assert outline_filter("abc") == {"outline_id": "abc"}
+    assert outline_filter("abc", {"chunk_index": {"$lt": 2}}) == {
+        "$and": [{"outline_id": "abc"}, {"chunk_index": {"$lt": 2}}]
+    }
+    
+    with patch('src.config.config.Config.OUTLINE_STORAGE_MODE', 'per_outline'):
+        assert outline_collection("abc") == "outline_abc"
+        assert outline_filter("abc") is None
+        
+    with patch('src.config.config.Config.OUTLINE_STORAGE_MODE', 'sharded'):
+        with pytest.raises(ValueError):
+            outline_collection("abc")
+
+def test_store_outline_chunks_appends_to_the_shared_collection():
+    """Test that indexing never recreates the shared collection and tags chunks with their outline."""
+    vector_store = MagicMock()
+    
+    assert store_outline_chunks(vector_store, "abc", ["one", "two"]) == "outlines"
+    
+    vector_store.get_or_create_collection.assert_called_once()
+    vector_store.create_collection.assert_not_called()
+    added = vector_store.add_documents.call_args.kwargs
+    assert added["ids"] == ["abc_chunk_0", "abc_chunk_1"]
+    assert [metadata["outline_id"] for metadata in added["metadatas"]] == ["abc", "abc"]
+    assert [metadata["chunk_index"] for metadata in added["metadatas"]] == [0, 1]
+
+def test_chunk_offsets_follow_outline_order_in_repetitive_outlines():
+    """Test that repeated passages get the offsets of their own occurrence, whatever the whitespace."""
+    outline = "INT. KITCHEN - DAY\n\nJohn waits.\n\nINT. KITCHEN - DAY\n\nThe  letter\narrives."
+    chunks = ["INT. KITCHEN - DAY", "John waits.", "INT. KITCHEN - DAY", "The letter arrives.", "Not in the outline."]
+    
+    offsets = chunk_offsets(outline, chunks)
+    
+    assert offsets[0] == (0, 18)
+    assert offsets[2] == (31, 49)
+    assert offsets[3][0] == 50
+    assert offsets[4] is None
+
+def test_trim_to_offset_cuts_at_a_flattened_offset():
+    """Test that a chunk is cut where a flattened offset falls, keeping its own line breaks."""
+    chunk = "John waits.\n\nThe  letter\narrives."
+    start = 19
+    beat = flatten_text("INT. KITCHEN - DAY " + chunk).index("The letter")
+    
+    assert trim_to_offset(chunk, start, beat) == "John waits."
+    assert trim_to_offset(chunk, start, beat + 6) == "John waits.\n\nThe  le"
+    assert trim_to_offset(chunk, start, start + 100) == chunk
+
+def test_store_outline_chunks_records_offsets():
+    """Test that chunk offsets are stored as start/end metadata."""
+    vector_store = MagicMock()
+    
+    store_outline_chunks(vector_store, "abc", ["one", "two"], [(0, 3), None])
+    
+    metadatas = vector_store.add_documents.call_args.kwargs["metadatas"]
+    assert (metadatas[0]["start"], metadatas[0]["end"]) == (0, 3)
+    assert "end" not in metadatas[1]
+
+def test_migration_copies_embeddings_and_deletes_legacy_collections():
+    """Test that legacy collections are copied with their embeddings, then deleted; failures are kept."""
+    vector_store = MagicMock()
+    shared = MagicMock()
+    # One chunk copied by an earlier migration that did not stamp last_used_at
+    shared.get.return_value = {
+        "ids": ["z_chunk_0", "y_chunk_0"],
+        "metadatas": [{"chunk_index": 0, "outline_id": "z"}, {"outline_id": "y", "last_used_at": 5.0}],
+    }
+    legacy = {"outline_a": _legacy_collection("a", ["A1", "A2"]), "outline_b": _legacy_collection("b", ["B1"])}
+    broken = MagicMock()
+    broken.get.side_effect = Exception("corrupt")
+    legacy["outline_c"] = broken
+    vector_store.list_collections.return_value = ["save_the_cat", "outlines"] + list(legacy)
+    vector_store.get_collection.side_effect = lambda name: shared if name == "outlines" else legacy.get(name)
+    vector_store.get_or_create_collection.return_value = shared
+    
+    assert migrate_outline_collections(vector_store, dry_run=True)["collections"] == 3
+    shared.upsert.assert_not_called()
+    
+    report = migrate_outline_collections(vector_store)
+    
+    assert report == {"collections": 3, "migrated": 2, "chunks": 3, "deleted": 2, "stamped": 1, "failed": ["outline_c"]}
+    first = shared.upsert.call_args_list[0].kwargs
+    assert first["ids"] == ["a_chunk_0", "a_chunk_1"]
+    assert first["embeddings"] == [[0.0, 0.2], [0.1, 0.2]]
+    migrated_at = first["metadatas"][0]["last_used_at"]
+    assert first["metadatas"] == [
+        {"chunk_index": i, "outline_id": "a", "indexed_at": migrated_at, "last_used_at": migrated_at} for i in range(2)
+    ]
+    # Migrated chunks become sweepable, including ones from an earlier migration
+    vector_store.update_metadatas.assert_called_once_with(
+        "outlines", ["z_chunk_0"],
+        [{"chunk_index": 0, "outline_id": "z", "indexed_at": migrated_at, "last_used_at": migrated_at}]
+    )
+    deleted = [call.args[0] for call in vector_store.delete_collection.call_args_list]
+    assert deleted == ["outline_a", "outline_b"]
+
+def test_outline_id_ignores_whitespace_differences():
+    """Test that the content hash survives indentation and trailing spaces but not edits."""
+    outline = "CATALYST: The letter arrives.\n\nDEBATE: John hesitates."
+    
+    assert outline_content_id(outline) == outline_content_id("  CATALYST:  The letter arrives. \n\nDEBATE: John hesitates.\n")
+    assert outline_content_id(outline) != outline_content_id(outline.replace("hesitates", "agrees"))
+
+def test_touch_marks_outline_used_at_most_once_per_interval():
+    """Test that reuse refreshes last_used_at only when the previous mark is old enough."""
+    collection = MagicMock()
+    collection.get.return_value = {
+        "ids": ["abc_chunk_0", "abc_chunk_1"],
+        "metadatas": [{"chunk_index": 0, "last_used_at": 100.0}, {"chunk_index": 1, "last_used_at": 100.0}],
+    }
+    vector_store = MagicMock()
+    vector_store.get_collection.return_value = collection
+    
+    found = find_outline(vector_store, "abc")
+    assert found["last_used_at"] == 100.0
+    assert collection.get.call_args.kwargs["where"] == {"outline_id": "abc"}
+    
+    assert touch_outline(vector_store, "abc", found, min_interval=3600)
+    collection_name, ids, metadatas = vector_store.update_metadatas.call_args.args
+    assert (collection_name, ids) == ("outlines", ["abc_chunk_0", "abc_chunk_1"])
+    assert all(metadata["last_used_at"] > 100.0 for metadata in metadatas)
+    assert [metadata["chunk_index"] for metadata in metadatas] == [0, 1]
+    
+    assert not touch_outline(vector_store, "abc", dict(found, last_used_at=time.time()), min_interval=3600)
+    assert vector_store.update_metadatas.call_count == 1
+    
+    collection.get.return_value = {"ids": [], "metadatas": []}
+    assert find_outline(vector_store, "missing") is None
+
+def test_sweep_deletes_expired_chunks_and_reports_space(tmp_path):
+    """Test that chunks unused past the TTL are deleted and the freed space is reported."""
+    collection = MagicMock()
+    collection.get.return_value = {
+        "ids": ["a_chunk_0", "a_chunk_1", "b_chunk_0"],
+        "documents": ["x" * 100, "y" * 50, "z" * 10],
+        "metadatas": [{"outline_id": "a"}, {"outline_id": "a"}, {"outline_id": "b"}],
+        "embeddings": [[0.0] * 8] * 3,
+    }
+    vector_store = MagicMock()
+    vector_store.persist_directory = str(tmp_path)
+    vector_store.get_collection.return_value = collection
+    
+    report = sweep_outline_indexes(vector_store, ttl_seconds=60, now=1000.0)
+    
+    assert collection.get.call_args.kwargs["where"] == {"last_used_at": {"$lt": 940.0}}
+    vector_store.delete_documents.assert_called_once_with("outlines", ["a_chunk_0", "a_chunk_1", "b_chunk_0"])
+    assert report == {"outlines_deleted": 2, "chunks_deleted": 3, "freed_bytes": 160 + 3 * 32, "disk_bytes_reclaimed": 0}
+
+def test_sweeper_runs_in_background_and_keeps_totals(tmp_path):
+    """Test that the sweeper sweeps on start and accumulates its reports."""
+    vector_store = MagicMock()
+    vector_store.persist_directory = str(tmp_path)
+    vector_store.get_collection.return_value.get.return_value = {
+        "ids": ["a_chunk_0"], "documents": ["x"], "metadatas": [{"outline_id": "a"}], "embeddings": [[0.0]]
+    }
+    sweeper = OutlineIndexSweeper(lambda: vector_store, ttl_seconds=60, interval_seconds=3600)
+    
+    async def run():
+        sweeper.start()
+        for _ in range(100):
+            if sweeper.stats()["sweeps"]:
+                break
+            await asyncio.sleep(0.01)
+        await sweeper.stop()
+        
+    asyncio.run(run())
+    stats = sweeper.stats()
+    assert stats["sweeps"] == 1
+    assert stats["outlines_deleted"] == 1
+    assert stats["last_sweep"]["chunks_deleted"] == 1
@@ -39,7 +39,7 @@ def sample_outlines():
 @pytest.fixture
 def mock_analyze_beat():
     """Mock the analyze_beat function to simulate different response times."""
-    with patch('src.rag.api.analyze_beat') as mock:
+    with patch('src.rag.api.analyze_beat_async') as mock:
         # Default response with no delay
         mock.return_value = {
             "flag": "Test flag",
@@ -0,0 +1,115 @@
+import pytest
+import time
+import threading
+import asyncio
+
+from src.rag.pipeline import Stage, run_stages, run_stages_async
+
+def test_independent_stages_run_concurrently():
+    """Test that stages without dependencies between them overlap in time."""
+    def slow(value):
+        def _run(**kwargs):
+            time.sleep(0.1)
+            return value
+        return _run
+        
+    stages = [
+        Stage("a", slow("a")),
+        Stage("b", slow("b")),
+        Stage("c", lambda a, b: a + b, depends_on=["a", "b"]),
+    ]
+    
+    start = time.perf_counter()
+    results, timings = run_stages(stages)
+    elapsed = time.perf_counter() - start
+    
+    # Both 100ms stages run side by side, so the total is well under 200ms
+    assert results["c"] == "ab"
+    assert elapsed < 0.18
+    assert set(timings) == {"a", "b", "c"}
+    assert timings["a"] >= 0.1
+
+def test_dependencies_receive_upstream_results():
+    """Test that a stage only starts after its dependencies and receives their results."""
+    order = []
+    lock = threading.Lock()
+    
+    def record(name, value):
+        def _run(**kwargs):
+            with lock:
+                order.append(name)
+            return value
+        return _run
+        
+    stages = [
+        Stage("synthesis", lambda functional, setup: f"{functional}+{setup}", depends_on=["functional", "setup"]),
+        Stage("setup", lambda elements: f"setup({elements})", depends_on=["elements"]),
+        Stage("elements", record("elements", "el")),
+        Stage("functional", record("functional", "fn")),
+    ]
+    
+    results, _ = run_stages(stages)
+    
+    assert results["setup"] == "setup(el)"
+    assert results["synthesis"] == "fn+setup(el)"
+
+def test_stage_failure_propagates():
+    """Test that an exception in one stage is raised from run_stages."""
+    def fail():
+        raise RuntimeError("429 quota")
+        
+    stages = [
+        Stage("a", fail),
+        Stage("b", lambda a: a, depends_on=["a"]),
+    ]
+    
+    with pytest.raises(RuntimeError, match="429"):
+        run_stages(stages)
+
+def test_invalid_graphs_are_rejected():
+    """Test that unknown dependencies and cycles are reported before running anything."""
+    with pytest.raises(ValueError, match="unknown stage"):
+        run_stages([Stage("a", lambda missing: missing, depends_on=["missing"])])
+        
+    with pytest.raises(ValueError, match="Cycle"):
+        run_stages([
+            Stage("a", lambda b: b, depends_on=["b"]),
+            Stage("b", lambda a: a, depends_on=["a"]),
+        ])
+
+def test_async_stages_run_concurrently():
+    """Test that the async runner overlaps independent stages on a single event loop."""
+    async def slow(value):
+        await asyncio.sleep(0.1)
+        return value
+        
+    async def combine(a, b):
+        return a + b
+        
+    stages = [
+        Stage("a", lambda: slow("a")),
+        Stage("b", lambda: slow("b")),
+        Stage("c", combine, depends_on=["a", "b"]),
+    ]
+    
+    start = time.perf_counter()
+    results, timings = asyncio.run(run_stages_async(stages))
+    elapsed = time.perf_counter() - start
+    
+    assert results["c"] == "ab"
+    assert elapsed < 0.18
+    assert set(timings) == {"a", "b", "c"}
+
+def test_async_stage_failure_propagates():
+    """Test that a failing async stage cancels the rest and re-raises."""
+    async def fail():
+        raise RuntimeError("boom")
+        
+    async def never(a):
+        return a
+        
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(run_stages_async([
+            Stage("a", fail),
+            Stage("b", never, depends_on=["a"]),
+        ]))
@@ -0,0 +1,113 @@
+import pytest
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.rag.pipeline import Stage, run_stages_async
+from src.rag.profiling import bind, format_summary, profile_call, profile_call_async, run_in_executor
+
+def slow_model_call():
+    time.sleep(0.15)
+    return "response"
+
+def fast_prompt_building():
+    time.sleep(0.03)
+
+def pipeline():
+    """Stand-in for run_stages: stages on pool threads, the caller waiting on their futures."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(bind(slow_model_call)), executor.submit(bind(fast_prompt_building))]
+        return [future.result() for future in futures]
+
+def test_profile_call_writes_collapsed_stacks_and_summary(tmp_path):
+    """Test that time on pool threads is attributed to the functions that spent it."""
+    result, report = profile_call("req-1", str(tmp_path), pipeline, interval=0.002)
+    
+    assert result == ["response", None]
+    assert report["path"] == os.path.join(str(tmp_path), "req-1.collapsed")
+    with open(report["path"]) as f:
+        lines = f.read().splitlines()
+    assert any("test_profiling.py:slow_model_call" in line.split()[0].split(";")[-1] for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    
+    # Sampled seconds depend on how often the sampler thread gets to run, so
+    # compare functions with each other rather than with the wall clock
+    summary = dict(report["summary"])
+    slow = summary["test_profiling.py:slow_model_call"]
+    assert slow > 2 * summary.get("test_profiling.py:fast_prompt_building", 0)
+    # The caller blocked on the futures is idle, not a hotspot
+    assert summary.get("test_profiling.py:pipeline", 0) < slow / 4
+
+def test_profile_is_written_when_the_call_fails(tmp_path):
+    """Test that a failing call still leaves its profile behind."""
+    def failing():
+        slow_model_call()
+        raise RuntimeError("boom")
+        
+    with pytest.raises(RuntimeError):
+        profile_call("req-2", str(tmp_path), failing, interval=0.002)
+        
+    assert os.path.getsize(os.path.join(str(tmp_path), "req-2.collapsed")) > 0
+
+def other_request():
+    time.sleep(0.15)
+
+def test_threads_outside_the_profiled_call_are_not_sampled(tmp_path):
+    """Test that a concurrent request on another thread does not show up in the profile."""
+    other = threading.Thread(target=other_request)
+    other.start()
+    try:
+        _, report = profile_call("req-3", str(tmp_path), slow_model_call, interval=0.002)
+    finally:
+        other.join()
+        
+    summary = dict(report["summary"])
+    assert "test_profiling.py:slow_model_call" in summary
+    assert "test_profiling.py:other_request" not in summary
+
+async def async_model_call(prompt):
+    await asyncio.sleep(0.15)
+    return prompt.upper()
+
+def blocking_lookup():
+    time.sleep(0.05)
+    return "definition"
+
+async def other_async_request():
+    await asyncio.sleep(0.15)
+
+def test_profile_call_async_samples_only_the_profiled_tasks(tmp_path):
+    """Test that stage tasks, their executor calls and awaited model calls are sampled, and other tasks are not."""
+    async def blocking_stage():
+        return await run_in_executor(None, blocking_lookup)
+        
+    async def analysis():
+        results, _ = await run_stages_async([
+            Stage("definition", blocking_stage),
+            Stage("synthesis", lambda definition: async_model_call(definition), depends_on=["definition"]),
+        ])
+        return results["synthesis"]
+        
+    async def main():
+        other = asyncio.ensure_future(other_async_request())
+        result = await profile_call_async("req-4", str(tmp_path), analysis, interval=0.002)
+        await other
+        return result
+        
+    result, report = asyncio.run(main())
+    
+    assert result == "DEFINITION"
+    summary = dict(report["summary"])
+    assert summary["test_profiling.py:async_model_call"] > summary["test_profiling.py:blocking_lookup"] > 0
+    assert "test_profiling.py:other_async_request" not in summary
+    # Tasks waiting on stage tasks or on executor threads are idle
+    assert "test_profiling.py:analysis" not in summary
+    assert "test_profiling.py:blocking_stage" not in summary
+
+def test_format_summary_is_header_safe():
+    """Test the compact header rendering of a summary."""
+    assert format_summary([("analyzer.py:_generate", 0.4123), ("outline_index.py:__init__", 0.01)]) == (
+        "analyzer.py:_generate=0.412s, outline_index.py:__init__=0.010s"
+    )
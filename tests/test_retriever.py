@@ -0,0 +1,191 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.rag.document_loader import DocumentLoader
+from src.rag.outline_store import outline_vector_store
+from src.rag.retriever import Retriever
+from src.rag.vector_store import VectorStore, IN_MEMORY, reset_clients
+
+def _result(chunks):
+    """Build a single-query ChromaDB result from (text, chunk_index, distance) tuples."""
+    return {
+        'documents': [[text for text, _, _ in chunks]],
+        'metadatas': [[{'chunk_index': index, 'outline_id': 'abc'} for _, index, _ in chunks]],
+        'distances': [[distance for _, _, distance in chunks]]
+    }
+
+@pytest.fixture(autouse=True)
+def vector_mode():
+    """Rank by embeddings only, so the mocks below answer every query."""
+    with patch('src.config.config.Config.RETRIEVAL_MODE', 'vector'):
+        yield
+
+@pytest.fixture
+def mock_vector_store():
+    """Mock VectorStore answering the beat lookup and per-element queries."""
+    store = MagicMock()
+    responses = {
+        "The letter arrives.": _result([("The letter arrives.", 3, 0.0)]),
+        "the letter": _result([("John checks the mail.", 1, 0.2), ("John's routine.", 0, 0.6)]),
+        "the adventure club": _result([("An ad for the club.", 2, 0.1), ("John checks the mail.", 1, 0.4)]),
+    }
+    store.query.side_effect = lambda collection_name, query_text, n_results=5, where=None: responses[query_text]
+    store.query_many.side_effect = lambda collection_name, queries: [responses[query["query_text"]] for query in queries]
+    return store
+
+def test_element_setup_context_only_returns_earlier_chunks(mock_vector_store):
+    """Test that element queries are filtered to chunks before the beat and de-duplicated."""
+    retriever = Retriever(mock_vector_store)
+    
+    chunks = retriever.get_element_setup_context(
+        "abc", "The letter arrives.", ["the letter", "the adventure club"]
+    )
+    
+    # Ordered by best distance, each chunk once
+    assert [chunk["metadata"]["chunk_index"] for chunk in chunks] == [2, 1, 0]
+    assert chunks[1]["distance"] == 0.2
+    
+    # One batch locating the beat, one for all elements
+    beat_lookup, element_queries = mock_vector_store.query_many.call_args_list
+    assert beat_lookup.kwargs["queries"][0]["where"] == {"outline_id": "abc"}
+    
+    # Every query is restricted to the outline inside the shared outlines collection
+    assert element_queries.kwargs["collection_name"] == "outlines"
+    assert len(element_queries.kwargs["queries"]) == 2
+    for query in element_queries.kwargs["queries"]:
+        assert query["where"] == {"$and": [{"outline_id": "abc"}, {"chunk_index": {"$lt": 3}}]}
+
+def test_per_outline_storage_queries_the_outline_collection(mock_vector_store):
+    """Test that the legacy layout queries the outline's own collection without an outline filter."""
+    with patch('src.config.config.Config.OUTLINE_STORAGE_MODE', 'per_outline'):
+        Retriever(mock_vector_store).get_element_setup_context("abc", "The letter arrives.", ["the letter"])
+        
+    last = mock_vector_store.query_many.call_args_list[-1]
+    assert last.kwargs["collection_name"] == "outline_abc"
+    assert last.kwargs["queries"][0]["where"] == {"chunk_index": {"$lt": 3}}
+
+def test_element_setup_context_empty_when_beat_is_first(mock_vector_store):
+    """Test that a beat in the first chunk has no setup context."""
+    mock_vector_store.query_many.side_effect = None
+    mock_vector_store.query_many.return_value = [_result([("The letter arrives.", 0, 0.0)])]
+    
+    assert Retriever(mock_vector_store).get_element_setup_context("abc", "The letter arrives.", ["x"]) == []
+
+def test_setup_context_many_locates_all_beats_in_one_batch(mock_vector_store):
+    """Test that the batch variant answers like the single-beat method with one lookup for every beat."""
+    mock_vector_store.query_many.side_effect = lambda collection_name, queries: [
+        _result([("The letter arrives.", 3, 0.0)]) if query.get("n_results") == 1 else _result([("Earlier.", 1, 0.3)])
+        for query in queries
+    ]
+    retriever = Retriever(mock_vector_store)
+    
+    batched = retriever.get_setup_context_many("abc", ["The letter arrives.", "He reads it."])
+    
+    assert batched == [retriever.get_setup_context("abc", "The letter arrives.")] * 2
+    assert len(mock_vector_store.query_many.call_args_list[0].kwargs["queries"]) == 2
+
+def test_beat_is_located_in_the_outline_without_a_query(mock_vector_store):
+    """Test that with the outline text the beat lookup is local and filters on chunk offsets."""
+    outline = "John checks the mail.\n\nAn ad for the club.\n\nThe letter arrives.\n\nThe letter arrives again."
+    
+    chunks = Retriever(mock_vector_store).get_element_setup_context(
+        "abc", "The letter arrives.", ["the letter", "the adventure club"], outline=outline
+    )
+    
+    assert [chunk["metadata"]["chunk_index"] for chunk in chunks] == [2, 1, 0]
+    # A single batch: the element queries, no semantic beat lookup
+    (call,) = mock_vector_store.query_many.call_args_list
+    assert [query["query_text"] for query in call.kwargs["queries"]] == ["the letter", "the adventure club"]
+    assert call.kwargs["queries"][0]["where"] == {"$and": [{"outline_id": "abc"}, {"start": {"$lt": 42}}]}
+
+def test_chunk_holding_the_beat_is_trimmed_at_the_beat(mock_vector_store):
+    """Test that text before a beat in the first chunk is returned, without the beat itself."""
+    outline = "John checks the mail.\n\nAn ad for the club.\n\nThe letter arrives.\n\nMore."
+    first_chunk = outline[:outline.index("\n\nMore.")]
+    mock_vector_store.query_many.side_effect = None
+    mock_vector_store.query_many.return_value = [{
+        "documents": [[first_chunk]],
+        "metadatas": [[{"chunk_index": 0, "outline_id": "abc", "start": 0, "end": 61}]],
+        "distances": [[0.1]],
+    }]
+    
+    chunks = Retriever(mock_vector_store).get_element_setup_context(
+        "abc", "The letter arrives.", ["the letter"], outline=outline
+    )
+    
+    assert [chunk["text"] for chunk in chunks] == ["John checks the mail.\n\nAn ad for the club."]
+
+def test_beat_at_the_start_of_the_outline_has_no_setup(mock_vector_store):
+    """Test that a beat opening the outline needs no query at all."""
+    retriever = Retriever(mock_vector_store)
+    
+    assert retriever.get_setup_context("abc", "The letter arrives.", outline="The letter arrives.\n\nMore.") == []
+    mock_vector_store.query_many.assert_not_called()
+
+@pytest.fixture
+def outline_store():
+    """In-memory store holding one outline whose early chunk literally introduces a prop."""
+    store = VectorStore(IN_MEMORY)
+    store.create_collection("outlines")
+    store.add_documents(
+        "outlines",
+        documents=[
+            "John keeps his grandfather's brass compass in a drawer.",
+            "John feels lost and longs for direction in his life.",
+            "John sets out to find his direction in life.",
+        ],
+        ids=["abc_chunk_0", "abc_chunk_1", "abc_chunk_2"],
+        metadatas=[{"chunk_index": i, "outline_id": "abc"} for i in range(3)]
+    )
+    yield store
+    reset_clients(IN_MEMORY)
+
+def test_beat_definition_filtered_query_uses_the_retrieval_mode():
+    """Test that the beat_type-filtered definition query goes through the lexical index in lexical mode."""
+    store = MagicMock()
+    store.lexical_query_many.return_value = [{"documents": [["The Catalyst..."]], "metadatas": [[{"beat_type": "Catalyst"}]]}]
+    
+    result = Retriever(store, mode="lexical").get_beat_definition("Catalyst")
+    
+    assert result["definition"] == "The Catalyst..."
+    store.query.assert_not_called()
+    assert store.lexical_query_many.call_args.kwargs["queries"][0]["where"] == {"beat_type": "Catalyst"}
+
+def test_lexical_mode_answers_exact_names_without_embedding(outline_store):
+    """Test that lexical retrieval finds the chunk naming the element and never runs a vector query."""
+    with patch.object(outline_store, "query_many", side_effect=AssertionError("embedding query")):
+        chunks = Retriever(outline_store, mode="lexical").get_outline_context("abc", "the brass compass", n_chunks=2)
+        
+    assert chunks[0]["metadata"]["chunk_index"] == 0
+    assert len(chunks) == 1
+
+def test_hybrid_mode_fuses_lexical_and_vector_rankings(outline_store):
+    """Test that a chunk ranked first by BM25 beats one ranked first only by the vector search."""
+    vector_ranking = [{
+        "ids": [["abc_chunk_1", "abc_chunk_2", "abc_chunk_0"]],
+        "documents": [["lost", "direction", "compass"]],
+        "metadatas": [[{"chunk_index": 1}, {"chunk_index": 2}, {"chunk_index": 0}]],
+        "distances": [[0.1, 0.2, 0.3]],
+    }]
+    with patch.object(outline_store, "query_many", return_value=vector_ranking) as query_many:
+        chunks = Retriever(outline_store, mode="hybrid").get_outline_context("abc", "compass", n_chunks=2)
+        
+    # Asked for twice the results to fuse, then cut back
+    assert query_many.call_args.kwargs["queries"][0]["n_results"] == 4
+    assert [chunk["metadata"]["chunk_index"] for chunk in chunks] == [0, 1]
+    assert chunks[0]["distance"] < chunks[1]["distance"]
+
+def test_outline_loaded_by_document_loader_is_found_by_the_retriever():
+    """Test that DocumentLoader indexes outlines in the store the analyzer retrieves from."""
+    framework_store = MagicMock()
+    try:
+        DocumentLoader(framework_store).load_outline(
+            "John keeps his grandfather's brass compass in a drawer. John sets out to find his direction in life.",
+            "loaded"
+        )
+        chunks = Retriever(outline_vector_store(), mode="lexical").get_outline_context("loaded", "the brass compass", n_chunks=1)
+        
+        assert "brass compass" in chunks[0]["text"]
+        framework_store.add_documents.assert_not_called()
+    finally:
+        reset_clients(IN_MEMORY)
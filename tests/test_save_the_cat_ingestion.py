@@ -7,7 +7,7 @@ import chromadb
 from chromadb.errors import NotFoundError
 
 from src.rag.document_loader import DocumentLoader
-from src.rag.vector_store import VectorStore
+from src.rag.vector_store import VectorStore, reset_clients
 from src.rag.retriever import Retriever
 
 @pytest.fixture
@@ -15,6 +15,7 @@ def temp_chroma_dir():
     """Create a temporary directory for ChromaDB."""
     temp_dir = tempfile.mkdtemp()
     yield temp_dir
+    reset_clients(temp_dir)
     shutil.rmtree(temp_dir)
 
 @pytest.fixture
@@ -0,0 +1,105 @@
+import pytest
+import asyncio
+import threading
+
+from src.rag.single_flight import SingleFlight, content_key
+
+def test_concurrent_duplicates_share_one_run():
+    """Test that concurrent calls with the same key run the work once and share its result."""
+    flights = SingleFlight()
+    runs = []
+    
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {"analysis": "shared"}
+        
+    async def run():
+        return await asyncio.gather(*(flights.run("key", work) for _ in range(3)))
+        
+    results = asyncio.run(run())
+    
+    assert len(runs) == 1
+    assert results[0] is results[1] is results[2]
+    assert flights.stats() == {"leaders": 1, "coalesced": 2, "in_flight": 0}
+
+def test_different_keys_and_later_calls_run_separately():
+    """Test that only in-flight work is shared; nothing is cached afterwards."""
+    flights = SingleFlight()
+    runs = []
+    
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return len(runs)
+        
+    async def run():
+        await asyncio.gather(flights.run("a", work), flights.run("b", work))
+        await flights.run("a", work)
+        
+    asyncio.run(run())
+    
+    assert len(runs) == 3
+
+def test_errors_are_shared():
+    """Test that every waiting caller receives the leader's exception."""
+    flights = SingleFlight()
+    
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+        
+    async def run():
+        return await asyncio.gather(flights.run("key", fail), flights.run("key", fail), return_exceptions=True)
+        
+    results = asyncio.run(run())
+    
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    """Test that a disconnecting caller leaves the computation running for the others."""
+    flights = SingleFlight()
+    
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+        
+    async def run():
+        first = asyncio.ensure_future(flights.run("key", work))
+        second = asyncio.ensure_future(flights.run("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+        
+    assert asyncio.run(run()) == "done"
+
+def test_calls_on_different_event_loops_run_separately():
+    """Test that a call on another event loop runs its own work instead of awaiting a foreign task."""
+    flights = SingleFlight()
+    both_running = threading.Barrier(2, timeout=5)
+    results = []
+    
+    async def work():
+        await asyncio.sleep(0.01)
+        both_running.wait()
+        return "done"
+        
+    def run():
+        results.append(asyncio.run(flights.run("key", work)))
+        
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+        
+    assert results == ["done", "done"]
+    assert flights.stats() == {"leaders": 2, "coalesced": 0, "in_flight": 0}
+
+def test_content_key():
+    """Test that every field takes part in the key."""
+    key = content_key("outline", "beat", "Catalyst", None)
+    
+    assert key == content_key("outline", "beat", "Catalyst", None)
+    assert key != content_key("outline", "beat", "Catalyst", "retrieval")
+    assert key != content_key("outlin", "ebeat", "Catalyst", None)
@@ -0,0 +1,96 @@
+import pytest
+from unittest.mock import patch
+
+from src.rag import token_budget
+from src.rag.token_budget import (
+    estimate_tokens, fit_to_budget, compact_outline, ensure_within_limit, PromptTooLargeError
+)
+
+def _long_outline(paragraphs_per_act=6):
+    """Three-act outline with several multi-sentence paragraphs per act."""
+    acts = []
+    for act in ("ONE", "TWO", "THREE"):
+        paragraphs = [
+            f"Act {act.lower()} event {i} happens to John. It has consequences for everyone. Nobody expects the outcome."
+            for i in range(paragraphs_per_act)
+        ]
+        acts.append(f"ACT {act}\n\n" + "\n\n".join(paragraphs))
+    return "\n\n".join(acts)
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    """Test the local token estimate on simple prose."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("John opens the letter.") == 5
+    assert estimate_tokens("ACT ONE\n\n  OPENING IMAGE:") == 5
+
+def test_fit_to_budget_keeps_most_important_chunks():
+    """Test that chunks are kept in priority order and oversize ones are skipped."""
+    chunks = ["one two three", "a much longer chunk that does not fit", "four five"]
+    
+    assert fit_to_budget(chunks, 5) == ["one two three", "four five"]
+    assert fit_to_budget(chunks, 100) == chunks
+    assert fit_to_budget(chunks, 0) == []
+
+def test_compact_outline_leaves_short_outlines_untouched():
+    """Test that an outline within budget is returned unchanged."""
+    outline = "John   receives a letter.\n\n\n\nHe leaves home."
+    
+    compacted, report = compact_outline(outline, "He leaves home.", 1000)
+    
+    assert compacted == outline
+    assert report["steps"] == []
+    assert report["final_tokens"] == report["original_tokens"]
+
+def test_compact_outline_summarizes_far_sections_first():
+    """Test that sections far from the beat are summarized while the beat's section stays intact."""
+    outline = _long_outline()
+    beat = "Act one event 2 happens to John."
+    budget = estimate_tokens(outline) - 40
+    
+    compacted, report = compact_outline(outline, beat, budget)
+    
+    assert report["final_tokens"] <= budget
+    assert "summaries" in report["steps"]
+    assert "[Summary] ACT THREE" in compacted
+    # The beat's act is kept verbatim
+    assert "Act one event 5 happens to John. It has consequences for everyone." in compacted
+
+def test_compact_outline_truncates_keeping_text_before_beat():
+    """Test that a tiny budget keeps the text leading up to the beat."""
+    outline = _long_outline()
+    beat = "Act two event 3 happens to John."
+    
+    compacted, report = compact_outline(outline, beat, 40)
+    
+    assert report["final_tokens"] <= 40
+    assert report["steps"][-1] == "truncated"
+    assert beat in compacted
+    assert "Act two event 4" not in compacted
+
+def test_compact_outline_counts_sections_incrementally():
+    """Test that dropping sections keeps a running count instead of re-measuring the outline."""
+    outline = "\n\n".join(f"Paragraph {i} follows Mary to the harbour." for i in range(200))
+    beat = "Paragraph 100 follows Mary to the harbour."
+    budget = estimate_tokens(outline) // 4
+    
+    measured = []
+    def spy(text):
+        measured.append(len(text))
+        return estimate_tokens(text)
+        
+    with patch.object(token_budget, "estimate_tokens", side_effect=spy):
+        compacted, report = compact_outline(outline, beat, budget)
+        
+    assert "dropped_sections" in report["steps"]
+    assert report["final_tokens"] == estimate_tokens(compacted) <= budget
+    assert beat in compacted
+    # Only the original, normalized and final outlines are measured whole
+    assert sum(1 for length in measured if length > len(outline) // 8) <= 3
+
+def test_ensure_within_limit():
+    """Test that oversize prompts are rejected with a ValueError subclass."""
+    assert ensure_within_limit("one two three", 3, "functional") == 3
+    
+    with pytest.raises(PromptTooLargeError, match="functional"):
+        ensure_within_limit("one two three four", 3, "functional")
+    assert issubclass(PromptTooLargeError, ValueError)
@@ -0,0 +1,214 @@
+import pytest
+import tempfile
+import shutil
+import threading
+from unittest.mock import patch
+
+from src.rag import vector_store as vector_store_module
+from src.rag.vector_store import VectorStore, IN_MEMORY, get_client, reset_clients
+from src.rag.outline_store import outline_vector_store
+
+@pytest.fixture
+def temp_chroma_dir():
+    """Create a temporary directory for ChromaDB."""
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    reset_clients(temp_dir)
+    shutil.rmtree(temp_dir)
+
+def test_vector_stores_share_one_client(temp_chroma_dir):
+    """Test that every VectorStore on a directory reuses the same client."""
+    first = VectorStore(persist_directory=temp_chroma_dir)
+    second = VectorStore(persist_directory=temp_chroma_dir + "/")
+    
+    assert first.client is second.client
+    assert get_client(temp_chroma_dir) is first.client
+
+def test_client_is_created_once_across_threads(temp_chroma_dir):
+    """Test that concurrent first use still opens a single client."""
+    clients = []
+    
+    def open_client():
+        clients.append(get_client(temp_chroma_dir))
+        
+    threads = [threading.Thread(target=open_client) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+        
+    assert len({id(client) for client in clients}) == 1
+
+def test_collection_handles_are_cached(temp_chroma_dir):
+    """Test that get_collection only hits the client the first time."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    store.create_collection("cached")
+    reset_clients(temp_chroma_dir)
+    
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    with patch.object(store.client, "get_collection", wraps=store.client.get_collection) as spy:
+        first = store.get_collection("cached")
+        second = VectorStore(persist_directory=temp_chroma_dir).get_collection("cached")
+        
+        assert first is second
+        assert spy.call_count == 1
+
+def test_delete_collection_drops_cached_handle(temp_chroma_dir):
+    """Test that a deleted collection is not served from the handle cache."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    store.create_collection("temporary")
+    store.delete_collection("temporary")
+    
+    assert not store.collection_exists("temporary")
+
+def test_handle_of_recreated_collection_is_refetched(temp_chroma_dir):
+    """Test that a cached handle keeps working after another process re-ingests its collection."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    store.create_collection("reingested")
+    store.add_documents("reingested", ["old beat"], ids=["old"])
+    handle = store.get_collection("reingested")
+    assert handle.count() == 1
+    
+    # Another process drops and recreates the collection; only the cached handle is left here
+    store.client.delete_collection("reingested")
+    store.client.create_collection("reingested").add(documents=["Catalyst", "Debate"], ids=["1", "2"])
+    
+    assert VectorStore(persist_directory=temp_chroma_dir).get_collection("reingested").count() == 2
+    assert handle.get(ids=["1"])["documents"] == ["Catalyst"]
+    # The lexical index follows the recreated collection too
+    result = store.lexical_query_many("reingested", [{"query_text": "catalyst"}])[0]
+    assert result["ids"] == [["1"]]
+    
+    # A collection that is really gone still raises
+    store.client.delete_collection("reingested")
+    with pytest.raises(Exception, match="does not exist"):
+        handle.count()
+
+def test_reset_clients_opens_fresh_client(temp_chroma_dir):
+    """Test that the reset hook forces a new client on next use."""
+    client = get_client(temp_chroma_dir)
+    reset_clients(temp_chroma_dir)
+    
+    assert get_client(temp_chroma_dir) is not client
+
+def test_in_memory_store_writes_nothing_to_disk(tmp_path, monkeypatch):
+    """Test that the in-memory store shares one ephemeral client and creates no files."""
+    monkeypatch.chdir(tmp_path)
+    store = VectorStore(IN_MEMORY)
+    store.create_collection("outlines_in_memory")
+    
+    try:
+        assert VectorStore(IN_MEMORY).client is store.client
+        assert VectorStore(IN_MEMORY).collection_exists("outlines_in_memory")
+        assert list(tmp_path.iterdir()) == []
+    finally:
+        store.delete_collection("outlines_in_memory")
+        reset_clients(IN_MEMORY)
+
+def test_outline_store_follows_config(temp_chroma_dir):
+    """Test that outline indexes go to memory by default and to disk when configured."""
+    try:
+        assert outline_vector_store().persist_directory == IN_MEMORY
+        with patch('src.config.config.Config.OUTLINE_STORE', 'persistent'), \
+             patch('src.rag.outline_store.VectorStore', lambda: VectorStore(temp_chroma_dir)):
+            assert outline_vector_store().persist_directory == temp_chroma_dir
+    finally:
+        reset_clients(IN_MEMORY)
+
+def test_add_documents_batches_lazily(temp_chroma_dir):
+    """Test that documents from generators are added in batches of batch_size."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    store.create_collection("batched")
+    
+    report = store.add_documents(
+        "batched",
+        documents=(f"Chunk number {i}" for i in range(25)),
+        ids=(f"chunk_{i}" for i in range(25)),
+        metadatas=({"chunk_index": i} for i in range(25)),
+        batch_size=10,
+        max_workers=2
+    )
+    
+    assert report["chunks"] == 25
+    assert report["batches"] == 3
+    assert store.get_collection("batched").count() == 25
+
+def test_add_documents_embeds_ahead_of_writes(temp_chroma_dir):
+    """Test that batches are embedded on worker threads and at most max_workers + 1 are held."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    collection = store.create_collection("pipelined")
+    embedded, in_flight = [], []
+    consumed = {"documents": 0}
+    
+    def embed(documents):
+        embedded.append(threading.current_thread().name)
+        return [[float(len(document)), 1.0] for document in documents]
+        
+    def documents():
+        for i in range(40):
+            consumed["documents"] += 1
+            yield f"Chunk {i}"
+            
+    original_add = collection.add
+    
+    def add(**kwargs):
+        # Batches read from the input but not yet written
+        in_flight.append(consumed["documents"] - sum(len(batch) for batch in written) - len(kwargs["ids"]))
+        written.append(kwargs["ids"])
+        assert kwargs["embeddings"] is not None
+        return original_add(**kwargs)
+        
+    written = []
+    with patch.object(collection, "_embedding_function", embed, create=True), \
+         patch.object(collection, "add", add):
+        report = store.add_documents("pipelined", documents(), (f"id_{i}" for i in range(40)), batch_size=5, max_workers=2)
+        
+    assert report["batches"] == 8
+    assert all(name.startswith("embed") for name in embedded)
+    assert max(in_flight) <= 2 * 5
+
+def test_query_many_matches_single_queries(temp_chroma_dir):
+    """Test that query_many answers like query, with one collection call per distinct filter."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    collection = store.create_collection("beats")
+    store.add_documents(
+        "beats",
+        documents=["The catalyst upends the hero's life.", "The midpoint raises the stakes.", "All is lost for the hero."],
+        ids=["catalyst", "midpoint", "all_is_lost"],
+        metadatas=[{"act": 1}, {"act": 2}, {"act": 2}]
+    )
+    queries = [
+        {"query_text": "hero", "n_results": 1, "where": {"act": 2}},
+        {"query_text": "stakes", "n_results": 2},
+        {"query_text": "lost", "n_results": 2, "where": {"act": 2}},
+    ]
+    
+    with patch.object(collection, "query", wraps=collection.query) as spy:
+        results = store.query_many("beats", queries)
+        assert spy.call_count == 2
+        
+    for query, result in zip(queries, results):
+        expected = store.query("beats", query["query_text"], query["n_results"], query.get("where"))
+        assert result["ids"] == expected["ids"]
+        assert result["documents"] == expected["documents"]
+
+def test_query_many_embeds_all_texts_once(temp_chroma_dir):
+    """Test that every query text is embedded in a single batch and passed as embeddings."""
+    store = VectorStore(persist_directory=temp_chroma_dir)
+    collection = store.create_collection("embedded")
+    batches = []
+    
+    def embed(texts):
+        batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+        
+    answer = {"ids": [["a", "b"], ["c", "d"]], "documents": [["A", "B"], ["C", "D"]], "metadatas": None, "distances": [[0.1, 0.2], [0.3, 0.4]]}
+    with patch.object(collection, "_embedding_function", embed, create=True), \
+         patch.object(collection, "query", return_value=answer) as query:
+        results = store.query_many("embedded", [{"query_text": "one", "n_results": 1}, {"query_text": "three"}])
+        
+    assert batches == [["one", "three"]]
+    assert query.call_args.kwargs["query_embeddings"] == [[3.0, 1.0], [5.0, 1.0]]
+    assert results[0]["ids"] == [["a"]]
+    assert results[1]["distances"] == [[0.3, 0.4]]
+    assert results[1]["metadatas"] is None